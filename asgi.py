@@ -0,0 +1,4 @@
+from src.app import app as wsgi_app
+from src.asgi import ThreadedWsgiToAsgi
+
+app = ThreadedWsgiToAsgi(wsgi_app)
@@ -0,0 +1,240 @@
+"""
+Compare throughput and latency of the gunicorn SERVER_MODEs (see gunicorn.conf.py)
+on the real /dashboard.
+
+Each mode is started with the repo's gunicorn.conf.py serving src.app, with
+the Oura API replaced by tests/fake_oura.py and Supabase by FakeSupabase, an
+in-memory stand-in. The fake Oura API waits --latency seconds before
+answering a collection read. FakeSupabase waits --supabase-latency seconds
+per query. OURA_SYNC_INTERVAL is 0, so every dashboard request syncs
+daily_sleep through the shared OuraClient, its rate limiter and the SQLite
+daily store before rendering.
+
+--concurrency clients, each signed in as one of --users users, then send
+--requests requests. Sync workers serve one request per worker at a time. The
+asgi mode keeps up to ASGI_THREADS requests per worker waiting on I/O, which
+needs asgiref and uvicorn-worker installed. "sync failures" counts dashboards
+that rendered without their Oura sync, e.g. because the call ran out the
+OURA_REQUEST_BUDGET.
+
+Usage:
+    python benchmarks/bench_server_modes.py
+    python benchmarks/bench_server_modes.py --workers 2 --concurrency 200 --requests 2000
+"""
+import argparse
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+
+import requests
+from cryptography.fernet import Fernet
+from flask import Flask
+
+try:
+    import asgiref  # noqa: F401
+    HAVE_ASGI = True
+except ImportError:
+    HAVE_ASGI = False
+
+MODE_APPS = {'sync': 'bench_server_modes:build_app()', 'asgi': 'bench_server_modes:build_asgi_app()'}
+# Lines the dashboard prints when it renders without a successful Oura sync
+SYNC_FAILURE = re.compile(r'Network error fetching V2 Daily Sleep|deferred by the rate limiter|Unhandled Error')
+
+
+class FakeSupabase:
+    """Answers the app's PostgREST query chains from in-memory tables after `latency` seconds."""
+
+    def __init__(self, tables, latency):
+        self.tables = tables
+        self.latency = latency
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+
+class FakeQuery:
+    """A query chain: eq() filters, update() writes on execute(), every other builder call is ignored."""
+
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.filters = {}
+        self.values = None
+
+    def eq(self, column, value):
+        self.filters[column] = value
+        return self
+
+    def update(self, values):
+        self.values = values
+        return self
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        time.sleep(self.db.latency)
+        rows = [row for row in self.db.tables.get(self.table, [])
+                if all(row.get(column) == value for column, value in self.filters.items())]
+        if self.values is not None:
+            for row in rows:
+                row.update(self.values)
+        return SimpleNamespace(data=[dict(row) for row in rows], count=len(rows))
+
+
+def build_app():
+    """The real Flask app with Supabase swapped for FakeSupabase; gunicorn calls this in each worker."""
+    import src.app as web
+
+    tokens = web.encrypt_token({'access_token': os.environ['BENCH_OURA_TOKEN']})
+    users = [f"user-{i}" for i in range(int(os.environ['BENCH_USERS']))]
+    web.supabase = FakeSupabase({
+        'profiles': [
+            {'id': user_id, 'email': f"{user_id}@example.com", 'display_name': user_id, 'is_admin': False,
+             'avg_sleep_score': None, 'last_sleep_score': None, 'sleep_stats': None, 'oura_tokens': tokens}
+            for user_id in users
+        ],
+        'leaderboard_entries': [
+            {'user_id': user_id, 'display_name': user_id, 'avg_sleep_score': None, 'last_sleep_score': None}
+            for user_id in users
+        ],
+    }, float(os.environ['BENCH_SUPABASE_LATENCY']))
+    return web.app
+
+
+def build_asgi_app():
+    from src.asgi import ThreadedWsgiToAsgi
+    return ThreadedWsgiToAsgi(build_app())
+
+
+def start_fake_oura(latency):
+    from fake_oura import FakeOura
+
+    fake = FakeOura().start()
+    fake.latency = latency
+    today = datetime.now()
+    for offset in range(7):
+        day = (today - timedelta(days=offset)).strftime('%Y-%m-%d')
+        fake.add_document('daily_sleep', {'id': f"sleep-{day}", 'day': day, 'score': 70 + offset})
+    return fake
+
+
+def session_cookie(secret_key, user_id):
+    """The signed Flask-Login session cookie of a signed-in user."""
+    signer = Flask(__name__)
+    signer.secret_key = secret_key
+    return signer.session_interface.get_signing_serializer(signer).dumps({'_user_id': user_id, '_fresh': False})
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, workers, fake, users, supabase_latency, data_dir, log):
+    port = free_port()
+    env = dict(
+        os.environ, SERVER_MODE=mode, SYNC_WORKER_IN_WEB='0', PYTHONUNBUFFERED='1',
+        SUPABASE_URL='https://bench.supabase.co', SUPABASE_KEY='bench', FLASK_SECRET_KEY='bench',
+        FERNET_KEY=Fernet.generate_key().decode(), OURA_API_BASE=fake.url, OURA_SYNC_INTERVAL='0',
+        OURA_GLOBAL_RATE='100000', OURA_GLOBAL_BURST='100000', OURA_TOKEN_RATE='100000', OURA_TOKEN_BURST='100000',
+        DAILY_STORE_PATH=os.path.join(data_dir, f"{mode}-daily.sqlite3"),
+        OURA_RATE_LIMIT_PATH=os.path.join(data_dir, f"{mode}-rate.sqlite3"),
+        BACKFILL_PATH=os.path.join(data_dir, f"{mode}-backfill.sqlite3"),
+        TEMPLATE_CACHE_DIR=os.path.join(data_dir, 'jinja_cache'),
+        BENCH_OURA_TOKEN=fake.access_token, BENCH_USERS=str(users), BENCH_SUPABASE_LATENCY=str(supabase_latency),
+    )
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'),
+         '--pythonpath', f"{os.path.dirname(os.path.abspath(__file__))},{ROOT}", '--bind', f"127.0.0.1:{port}",
+         '--workers', str(workers), '--log-level', 'warning', MODE_APPS[mode]],
+        cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    url = f"http://127.0.0.1:{port}/dashboard"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=5, allow_redirects=False)
+            return server, url
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f"{mode} server did not start")
+
+
+def run_load(url, total, concurrency, cookies):
+    local = threading.local()
+
+    def one(i):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        started = time.perf_counter()
+        response = local.session.get(url, cookies={'session': cookies[i % len(cookies)]},
+                                     timeout=120, allow_redirects=False)
+        return time.perf_counter() - started, response.status_code == 200
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(latency for latency, _ in results)
+    return {
+        'rps': total / elapsed,
+        'p50': latencies[len(latencies) // 2] * 1000,
+        'p95': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        'errors': sum(1 for _, ok in results if not ok),
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Benchmark /dashboard under gunicorn sync workers and the asgi mode.')
+    parser.add_argument('--mode', action='append', choices=sorted(MODE_APPS), help='mode to run (default: all)')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.2, help='seconds per Oura collection read')
+    parser.add_argument('--supabase-latency', type=float, default=0.02, help='seconds per Supabase query')
+    args = parser.parse_args(argv)
+
+    print(f"{args.workers} workers, {args.concurrency} concurrent clients, {args.requests} requests, "
+          f"{args.latency * 1000:.0f} ms Oura reads, {args.supabase_latency * 1000:.0f} ms Supabase queries")
+    cookies = [session_cookie('bench', f"user-{i}") for i in range(args.users)]
+    fake = start_fake_oura(args.latency)
+    try:
+        with tempfile.TemporaryDirectory() as data_dir:
+            for mode in args.mode or ('sync', 'asgi'):
+                if mode == 'asgi' and not HAVE_ASGI:
+                    print("asgi: skipped (asgiref is not installed)")
+                    continue
+                with tempfile.TemporaryFile('w+') as log:
+                    server, url = start_server(mode, args.workers, fake, args.users, args.supabase_latency,
+                                               data_dir, log)
+                    try:
+                        result = run_load(url, args.requests, args.concurrency, cookies)
+                    finally:
+                        server.terminate()
+                        server.wait()
+                    log.seek(0)
+                    failures = sum(1 for line in log if SYNC_FAILURE.search(line))
+                print(f"{mode:>5}: {result['rps']:8.1f} req/s  p50 {result['p50']:7.0f} ms  "
+                      f"p95 {result['p95']:7.0f} ms  errors {result['errors']}  sync failures {failures}")
+    finally:
+        fake.stop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
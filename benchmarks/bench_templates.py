@@ -0,0 +1,52 @@
+"""
+Compare per-request render time of the dashboard template when passed as a
+source string (the old render_template_string path, which recompiles the
+template on every call) against the precompiled file template.
+
+Usage (needs the same environment variables as the app):
+    python benchmarks/bench_templates.py [iterations]
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import render_template, render_template_string
+
+from src.app import app
+
+
+def sample_context(days=7):
+    today = datetime.now()
+    day_list = [(today - timedelta(days=days - 1 - i)).strftime('%Y-%m-%d') for i in range(days)]
+    return {
+        'profile': {'display_name': 'bench', 'avg_sleep_score': 80, 'last_sleep_score': 82},
+        'sleep_data': {'data': [{'day': d, 'score': 80, 'contributors': {}} for d in day_list]},
+        'flush': '',
+    }
+
+
+def timed(render, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        render()
+    return (time.perf_counter() - started) / iterations * 1000
+
+
+def main(argv):
+    iterations = int(argv[0]) if argv else 200
+    source = app.jinja_loader.get_source(app.jinja_env, 'dashboard.html')[0]
+    context = sample_context()
+
+    with app.test_request_context('/dashboard'):
+        inline = timed(lambda: render_template_string(source, **context), iterations)
+        cached = timed(lambda: render_template('dashboard.html', **context), iterations)
+
+    print(f"render_template_string: {inline:.2f} ms/render")
+    print(f"render_template:        {cached:.2f} ms/render ({inline / cached:.1f}x faster)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,5 +1,8 @@
+-- Safe to re-run: creates whatever is missing, and brings a database set up by an
+-- earlier version of this script up to date without touching its data
+
 -- Create profiles table
-CREATE TABLE profiles (
+CREATE TABLE IF NOT EXISTS profiles (
   id UUID PRIMARY KEY,
   oura_user_id TEXT UNIQUE NOT NULL,
   email TEXT,
@@ -7,12 +10,18 @@ CREATE TABLE profiles (
   oura_tokens TEXT,
   avg_sleep_score NUMERIC,
   last_sleep_score NUMERIC,
+  sleep_stats JSONB,
   last_login TIMESTAMP WITH TIME ZONE,
+  is_admin BOOLEAN DEFAULT FALSE NOT NULL,
   created_at TIMESTAMP WITH TIME ZONE DEFAULT timezone('utc'::text, now()) NOT NULL
 );
 
+-- Columns added since the first version of the profiles table
+ALTER TABLE profiles ADD COLUMN IF NOT EXISTS sleep_stats JSONB;
+ALTER TABLE profiles ADD COLUMN IF NOT EXISTS is_admin BOOLEAN DEFAULT FALSE NOT NULL;
+
 -- Create friendships table
-CREATE TABLE friendships (
+CREATE TABLE IF NOT EXISTS friendships (
   id UUID DEFAULT uuid_generate_v4() PRIMARY KEY,
   user_id UUID REFERENCES profiles(id) ON DELETE CASCADE,
   friend_id UUID REFERENCES profiles(id) ON DELETE CASCADE,
@@ -20,33 +29,79 @@ CREATE TABLE friendships (
   UNIQUE(user_id, friend_id)
 );
 
+-- Create leaderboard snapshot table (narrow copy of the scores, maintained by the app when they change)
+CREATE TABLE IF NOT EXISTS leaderboard_entries (
+  user_id UUID PRIMARY KEY REFERENCES profiles(id) ON DELETE CASCADE,
+  display_name TEXT,
+  avg_sleep_score NUMERIC,
+  last_sleep_score NUMERIC,
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT timezone('utc'::text, now()) NOT NULL
+);
+
+-- Seed the snapshot from existing profiles; users who already have a row keep it
+INSERT INTO leaderboard_entries (user_id, display_name, avg_sleep_score, last_sleep_score)
+  SELECT id, display_name, avg_sleep_score, last_sleep_score FROM profiles
+  ON CONFLICT (user_id) DO NOTHING;
+
+-- No longer used: the app pages leaderboard_entries in index order and ranks rows itself
+DROP VIEW IF EXISTS leaderboard;
+DROP INDEX IF EXISTS idx_profiles_avg_sleep_score;
+
 -- Enable Row Level Security
 ALTER TABLE profiles ENABLE ROW LEVEL SECURITY;
 ALTER TABLE friendships ENABLE ROW LEVEL SECURITY;
+ALTER TABLE leaderboard_entries ENABLE ROW LEVEL SECURITY;
 
 -- Create RLS policies for profiles
+DROP POLICY IF EXISTS "Users can view only their own profiles" ON profiles;
 CREATE POLICY "Users can view only their own profiles"
   ON profiles FOR SELECT
   USING (auth.uid() = id);
 
+DROP POLICY IF EXISTS "Users can update only their own profiles" ON profiles;
 CREATE POLICY "Users can update only their own profiles"
   ON profiles FOR UPDATE
   USING (auth.uid() = id);
 
+-- Create RLS policies for the leaderboard snapshot (scores are public, writes are the user's own)
+DROP POLICY IF EXISTS "Leaderboard entries are viewable by everyone" ON leaderboard_entries;
+CREATE POLICY "Leaderboard entries are viewable by everyone"
+  ON leaderboard_entries FOR SELECT
+  USING (true);
+
+DROP POLICY IF EXISTS "Users can write only their own leaderboard entry" ON leaderboard_entries;
+CREATE POLICY "Users can write only their own leaderboard entry"
+  ON leaderboard_entries FOR ALL
+  USING (auth.uid() = user_id)
+  WITH CHECK (auth.uid() = user_id);
+
 -- Create RLS policies for friendships
+DROP POLICY IF EXISTS "Users can view only their own friendships" ON friendships;
 CREATE POLICY "Users can view only their own friendships"
   ON friendships FOR SELECT
   USING (auth.uid() = user_id);
 
+DROP POLICY IF EXISTS "Users can only add friendships where they are the user" ON friendships;
 CREATE POLICY "Users can only add friendships where they are the user"
   ON friendships FOR INSERT
   WITH CHECK (auth.uid() = user_id);
 
+DROP POLICY IF EXISTS "Users can only delete their own friendships" ON friendships;
 CREATE POLICY "Users can only delete their own friendships"
   ON friendships FOR DELETE
   USING (auth.uid() = user_id);
 
 -- Create indexes for better query performance
-CREATE INDEX idx_profiles_oura_user_id ON profiles (oura_user_id);
-CREATE INDEX idx_friendships_user_id ON friendships (user_id);
-CREATE INDEX idx_friendships_friend_id ON friendships (friend_id); 
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_profiles_oura_user_id ON profiles (oura_user_id);
+CREATE INDEX IF NOT EXISTS idx_friendships_user_id ON friendships (user_id);
+CREATE INDEX IF NOT EXISTS idx_friendships_friend_id ON friendships (friend_id);
+
+-- Admin user list: pages in (display_name, id) order without sorting every profile, and
+-- trigram indexes so the contains-search (ilike '%term%') on name or email doesn't scan the table
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_profiles_display_name_id ON profiles (display_name, id);
+CREATE INDEX IF NOT EXISTS idx_profiles_display_name_trgm ON profiles USING gin (display_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_profiles_email_trgm ON profiles USING gin (email gin_trgm_ops);
+
+-- Leaderboard pages and around-me tie counts read this index in order instead of sorting every user
+CREATE INDEX IF NOT EXISTS idx_leaderboard_entries_avg_sleep_score ON leaderboard_entries (avg_sleep_score DESC NULLS LAST, user_id);
@@ -1,4 +1,7 @@
--- Drop existing tables if they exist (to ensure clean setup)
+-- Drop existing tables if they exist (to ensure clean setup), and the ranked leaderboard
+-- view earlier versions created over leaderboard_entries
+DROP VIEW IF EXISTS leaderboard;
+DROP TABLE IF EXISTS leaderboard_entries;
 DROP TABLE IF EXISTS friendships;
 DROP TABLE IF EXISTS profiles;
 
@@ -11,7 +14,9 @@ CREATE TABLE profiles (
   oura_tokens TEXT,
   avg_sleep_score NUMERIC,
   last_sleep_score NUMERIC,
+  sleep_stats JSONB,
   last_login TIMESTAMP WITH TIME ZONE,
+  is_admin BOOLEAN DEFAULT FALSE NOT NULL,
   created_at TIMESTAMP WITH TIME ZONE DEFAULT timezone('utc'::text, now()) NOT NULL
 );
 
@@ -24,9 +29,19 @@ CREATE TABLE friendships (
   UNIQUE(user_id, friend_id)
 );
 
+-- Create leaderboard snapshot table (narrow copy of the scores, maintained by the app when they change)
+CREATE TABLE leaderboard_entries (
+  user_id UUID PRIMARY KEY REFERENCES profiles(id) ON DELETE CASCADE,
+  display_name TEXT,
+  avg_sleep_score NUMERIC,
+  last_sleep_score NUMERIC,
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT timezone('utc'::text, now()) NOT NULL
+);
+
 -- Enable Row Level Security
 ALTER TABLE profiles ENABLE ROW LEVEL SECURITY;
 ALTER TABLE friendships ENABLE ROW LEVEL SECURITY;
+ALTER TABLE leaderboard_entries ENABLE ROW LEVEL SECURITY;
 
 -- Create open policy for profiles (for development)
 -- This allows any operation on profiles without authentication
@@ -46,7 +61,24 @@ CREATE POLICY "Allow all operations on friendships"
   USING (true) 
   WITH CHECK (true);
 
+-- Create open policy for the leaderboard snapshot (for development)
+DROP POLICY IF EXISTS "Allow all operations on leaderboard_entries" ON leaderboard_entries;
+CREATE POLICY "Allow all operations on leaderboard_entries" 
+  ON leaderboard_entries 
+  USING (true) 
+  WITH CHECK (true);
+
 -- Create indexes for better query performance
 CREATE INDEX idx_profiles_oura_user_id ON profiles (oura_user_id);
 CREATE INDEX idx_friendships_user_id ON friendships (user_id);
-CREATE INDEX idx_friendships_friend_id ON friendships (friend_id); 
\ No newline at end of file
+CREATE INDEX idx_friendships_friend_id ON friendships (friend_id);
+
+-- Admin user list: pages in (display_name, id) order without sorting every profile, and
+-- trigram indexes so the contains-search (ilike '%term%') on name or email doesn't scan the table
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_profiles_display_name_id ON profiles (display_name, id);
+CREATE INDEX IF NOT EXISTS idx_profiles_display_name_trgm ON profiles USING gin (display_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_profiles_email_trgm ON profiles USING gin (email gin_trgm_ops);
+
+-- Leaderboard pages and around-me tie counts read this index in order instead of sorting every user
+CREATE INDEX idx_leaderboard_entries_avg_sleep_score ON leaderboard_entries (avg_sleep_score DESC NULLS LAST, user_id); 
\ No newline at end of file
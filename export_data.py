@@ -0,0 +1,36 @@
+"""
+Export every user's stored Oura daily summaries for offline analysis.
+
+Reads the local daily store (the same SQLite file the web app and sync worker
+use) and writes one file per collection, in constant memory regardless of the
+number of users. Parquet needs the optional pyarrow package; CSV always works.
+
+Usage:
+    python export_data.py exports/                      # all collections, Parquet if available
+    python export_data.py exports/ --format csv
+    python export_data.py exports/ --collection daily_sleep --collection daily_activity
+"""
+import argparse
+import sys
+import time
+
+from src.app import daily_store, DAILY_COLLECTIONS
+from src.export import available_formats, write_export, EXPORT_BATCH_SIZE
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Export stored Oura daily summaries.')
+    parser.add_argument('directory', help='directory to write <collection>.<format> files to')
+    parser.add_argument('--format', choices=available_formats(), default=available_formats()[0])
+    parser.add_argument('--collection', action='append', choices=DAILY_COLLECTIONS,
+                        help='collection to export (repeatable; default: all)')
+    parser.add_argument('--batch-size', type=int, default=EXPORT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    for collection in args.collection or DAILY_COLLECTIONS:
+        started = time.monotonic()
+        path = write_export(daily_store, collection, args.format, args.directory, args.batch_size)
+        print(f"export: Wrote {path} in {time.monotonic() - started:.1f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,68 @@
+"""
+Gunicorn settings for the web service.
+
+SERVER_MODE picks how each worker process serves requests:
+    sync  one request at a time per worker (wsgi:app, gunicorn sync workers)
+    asgi  uvicorn workers serving asgi:app, up to ASGI_THREADS requests in flight
+          per worker; needs the optional asgiref and uvicorn-worker packages
+Worker count comes from WEB_CONCURRENCY and the port from PORT, as gunicorn
+reads them by default.
+
+With SYNC_WORKER_IN_WEB=1 the master also runs the background sync worker
+(worker.py) as a child process, restarting it if it exits. It then shares the
+web service's host, so the daily store, backfill checkpoints and rate limits
+it writes to SQLite are the files the web workers read. Hosts that give each
+service its own filesystem (Render, Heroku) need this for the web workers to
+serve the worker's prefetched data.
+"""
+import os
+import subprocess
+import sys
+import threading
+
+SERVER_MODES = {
+    'sync': ('wsgi:app', 'sync'),
+    'asgi': ('asgi:app', 'uvicorn_worker.UvicornWorker'),
+}
+
+server_mode = os.getenv('SERVER_MODE', 'sync').lower()
+if server_mode not in SERVER_MODES:
+    raise ValueError(f"SERVER_MODE must be one of {', '.join(SERVER_MODES)}, not {server_mode!r}")
+
+wsgi_app, worker_class = SERVER_MODES[server_mode]
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+
+SYNC_WORKER_IN_WEB = os.getenv('SYNC_WORKER_IN_WEB', '').lower() in ('1', 'true', 'yes')
+# Seconds to wait before restarting a sync worker that exited
+SYNC_WORKER_RESTART_DELAY = 30
+
+_sync_worker = {'process': None, 'stopping': threading.Event()}
+
+
+def _supervise_sync_worker(server):
+    root = os.path.dirname(os.path.abspath(__file__))
+    stopping = _sync_worker['stopping']
+    while not stopping.is_set():
+        process = subprocess.Popen([sys.executable, os.path.join(root, 'worker.py')], cwd=root)
+        _sync_worker['process'] = process
+        server.log.info(f"Started sync worker (pid: {process.pid})")
+        returncode = process.wait()
+        if not stopping.is_set():
+            server.log.error(f"Sync worker exited with {returncode}, restarting in {SYNC_WORKER_RESTART_DELAY}s")
+            stopping.wait(SYNC_WORKER_RESTART_DELAY)
+
+
+def when_ready(server):
+    if SYNC_WORKER_IN_WEB:
+        threading.Thread(target=_supervise_sync_worker, args=(server,), name='sync-worker', daemon=True).start()
+
+
+def on_exit(server):
+    _sync_worker['stopping'].set()
+    process = _sync_worker['process']
+    if process is not None and process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
@@ -0,0 +1,71 @@
+"""
+Manage the app's Oura webhook subscriptions.
+
+Subscriptions belong to the Oura application (OURA_CLIENT_ID/OURA_CLIENT_SECRET),
+not to a user, and expire unless renewed. `subscribe` creates any missing
+create/update subscription for each daily collection and renews the rest, so it
+can be run on a schedule. Oura calls the callback URL with the verification
+token before it accepts a new subscription, so the web app must be reachable
+and have OURA_WEBHOOK_VERIFICATION_TOKEN set.
+
+Usage:
+    python manage_webhooks.py list
+    python manage_webhooks.py subscribe --callback-url https://example.com/webhooks/oura
+    python manage_webhooks.py renew SUBSCRIPTION_ID
+    python manage_webhooks.py delete SUBSCRIPTION_ID
+"""
+import argparse
+import os
+import sys
+
+import requests
+
+from src.app import oura_client, DAILY_COLLECTIONS, OURA_CLIENT_ID, OURA_CLIENT_SECRET, OURA_WEBHOOK_VERIFICATION_TOKEN
+from src.webhooks import WebhookSubscriptions
+
+def describe(subscription):
+    return (f"{subscription.get('id')}  {subscription.get('data_type')}.{subscription.get('event_type')}  "
+            f"{subscription.get('callback_url')}  expires {subscription.get('expiration_time')}")
+
+def main(argv, subscriptions=None):
+    parser = argparse.ArgumentParser(description='Manage Oura webhook subscriptions.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help='list subscriptions')
+    subscribe = commands.add_parser('subscribe', help='create missing subscriptions and renew existing ones')
+    subscribe.add_argument('--callback-url', default=os.getenv('OURA_WEBHOOK_CALLBACK_URL'))
+    subscribe.add_argument('--verification-token', default=OURA_WEBHOOK_VERIFICATION_TOKEN)
+    subscribe.add_argument('--collection', action='append', choices=DAILY_COLLECTIONS,
+                           help='collection to subscribe to (repeatable; default: all)')
+    for name in ('renew', 'delete'):
+        command = commands.add_parser(name, help=f"{name} a subscription")
+        command.add_argument('subscription_id')
+    args = parser.parse_args(argv)
+
+    if subscriptions is None:
+        subscriptions = WebhookSubscriptions(oura_client, OURA_CLIENT_ID, OURA_CLIENT_SECRET)
+    try:
+        if args.command == 'list':
+            for subscription in subscriptions.list():
+                print(describe(subscription))
+        elif args.command == 'subscribe':
+            if not args.callback_url or not args.verification_token:
+                parser.error('subscribe needs --callback-url and --verification-token '
+                             '(or OURA_WEBHOOK_CALLBACK_URL and OURA_WEBHOOK_VERIFICATION_TOKEN)')
+            created, renewed = subscriptions.ensure(args.callback_url, args.verification_token,
+                                                   args.collection or DAILY_COLLECTIONS)
+            for subscription in created:
+                print(f"webhooks: Created {describe(subscription)}")
+            for subscription in renewed:
+                print(f"webhooks: Renewed {describe(subscription)}")
+        elif args.command == 'renew':
+            print(f"webhooks: Renewed {describe(subscriptions.renew(args.subscription_id))}")
+        else:
+            subscriptions.delete(args.subscription_id)
+            print(f"webhooks: Deleted {args.subscription_id}")
+    except requests.RequestException as e:
+        print(f"webhooks: Oura request failed: {str(e)}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
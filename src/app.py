@@ -1,9 +1,15 @@
 # Standard library imports
 import os
+import sys
 import json
+import re
 import base64
+import hashlib
+import hmac
+import threading
 import uuid
 import traceback  # <<< ADD THIS IMPORT
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 # Third-party imports
@@ -13,15 +19,36 @@ from flask import (
     redirect,
     url_for,
     session,
-    render_template_string,
     render_template,
-    flash
+    make_response,
+    flash,
+    Response,
+    stream_with_context,
+    jsonify,
+    g,
+    has_request_context
 )
 from flask_login import LoginManager, UserMixin, login_required, login_user, logout_user, current_user
 import requests
 from dotenv import load_dotenv
 from supabase import create_client
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, InvalidToken
+
+# Local imports (the repo root is added so `python src/app.py` works as well as `src.app`)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.oura_client import OuraClient
+from src.rate_limiter import RateLimiter, RateLimitExceeded
+from src.daily_store import DailyStore, sync_daily, OURA_SYNC_INTERVAL
+from src.cache import TTLCache
+from src.profile_queries import profiles_query
+from src.sleep_stats import compute_sleep_stats, SLEEP_STATS_WINDOWS
+from src.rank_index import ScoreIndex
+from src.export import iter_export, available_formats, EXPORT_MIMETYPES
+from src.backfill import BackfillJobs, backfill_range, run_backfill, BACKFILL_CONCURRENCY
+from src.webhooks import verify_signature, parse_event, OURA_WEBHOOK_EVENT_TYPES
+from src.token_manager import TokenManager, RefreshLeases, stamp_expiry
+from src.template_cache import configure_template_cache, precompile_templates, stream_page, template_fingerprint
+from src.http_cache import etag_for, set_validators, not_modified, add_content_etag, compress_response
 
 # Load environment variables
 load_dotenv()
@@ -29,6 +56,16 @@ load_dotenv()
 app = Flask(__name__)
 app.secret_key = os.getenv('FLASK_SECRET_KEY')
 
+# Compile every page template once per worker, reusing bytecode across restarts
+configure_template_cache(app, os.getenv('TEMPLATE_CACHE_DIR', os.path.join(app.instance_path, 'jinja_cache')))
+precompile_templates(app)
+TEMPLATE_VERSION = template_fingerprint(app)
+
+@app.after_request
+def finalize_response(response):
+    """Answer repeat GETs with 304 and compress whatever is still sent."""
+    return compress_response(add_content_etag(response))
+
 # Initialize login manager
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -39,6 +76,23 @@ supabase = create_client(
     os.getenv('SUPABASE_URL'),
     os.getenv('SUPABASE_KEY')
 )
+# Supabase returns at most this many rows per request; full-table reads go page by page
+SUPABASE_PAGE_SIZE = 1000
+
+# Initialize the shared, connection-pooled Oura API client, rate limited across all workers on this host
+oura_client = OuraClient(rate_limiter=RateLimiter(
+    os.getenv('OURA_RATE_LIMIT_PATH', os.path.join(app.instance_path, 'rate_limits.sqlite3'))
+))
+
+# Initialize the local store of synced Oura daily summaries
+daily_store = DailyStore(os.getenv('DAILY_STORE_PATH', os.path.join(app.instance_path, 'daily_store.sqlite3')))
+
+# History backfill jobs (checkpointed in SQLite) and the threads that run them off the request path
+backfill_jobs = BackfillJobs(os.getenv('BACKFILL_PATH', os.path.join(app.instance_path, 'backfill.sqlite3')))
+backfill_pool = ThreadPoolExecutor(max_workers=BACKFILL_CONCURRENCY, thread_name_prefix='backfill')
+# Jobs resume_backfills() has queued on backfill_pool and that haven't finished their run yet
+backfill_queued = set()
+backfill_queued_lock = threading.Lock()
 
 # Initialize Fernet encryption
 fernet_key = os.getenv('FERNET_KEY')
@@ -64,44 +118,145 @@ OURA_REDIRECT_URI = os.getenv('OURA_REDIRECT_URI', PRODUCTION_URI if ENVIRONMENT
 OURA_AUTH_URL = 'https://cloud.ouraring.com/oauth/authorize'
 OURA_TOKEN_URL = 'https://api.ouraring.com/oauth/token'
 
+# Daily summary collections shown on the dashboard and admin pages
+DAILY_COLLECTIONS = ['daily_sleep', 'daily_readiness', 'daily_activity']
+
+# Fields returned per day by the /api/v1 daily endpoints
+DAILY_API_FIELDS = {
+    'daily_sleep': ('day', 'score', 'contributors', 'total_sleep_duration', 'deep_sleep_duration',
+                    'rem_sleep_duration', 'light_sleep_duration'),
+    'daily_readiness': ('day', 'score', 'contributors', 'temperature_deviation'),
+    'daily_activity': ('day', 'score', 'steps', 'active_calories', 'total_calories'),
+}
+DAILY_API_MAX_DAYS = 90
+
+# Leaderboard snapshot (see leaderboard_entries / leaderboard in docs/SUPABASE_SETUP.sql)
+LEADERBOARD_COLUMNS = 'user_id, display_name, avg_sleep_score, last_sleep_score'
+LEADERBOARD_PAGE_SIZE = int(os.getenv('LEADERBOARD_PAGE_SIZE', '50'))
+LEADERBOARD_MAX_LIMIT = 100
+leaderboard_cache = TTLCache(maxsize=64, ttl=int(os.getenv('LEADERBOARD_CACHE_TTL', '60')))
+# Rank index over every snapshot score, reloaded every LEADERBOARD_INDEX_TTL seconds
+LEADERBOARD_INDEX_TTL = int(os.getenv('LEADERBOARD_INDEX_TTL', '300'))
+LEADERBOARD_SCOPES = ('global', 'friends')
+# Most emails accepted by one /add_friends request
+FRIEND_IMPORT_MAX = int(os.getenv('FRIEND_IMPORT_MAX', '200'))
+
+# Friend ids per user (the friendships adjacency list); add_friend/remove_friend invalidate entries
+friends_cache = TTLCache(
+    maxsize=int(os.getenv('FRIENDS_CACHE_SIZE', '1024')),
+    ttl=int(os.getenv('FRIENDS_CACHE_TTL', '300'))
+)
+
+# Stream the dashboard as it renders instead of building the whole page first
+DASHBOARD_STREAMING = os.getenv('DASHBOARD_STREAMING', '1').lower() in ('1', 'true', 'yes')
+
+# Session-projection profile rows, shared across requests in this worker
+profile_cache = TTLCache(
+    maxsize=int(os.getenv('PROFILE_CACHE_SIZE', '1024')),
+    ttl=int(os.getenv('PROFILE_CACHE_TTL', '30'))
+)
+
+# Admin pages: users per page, and the cached id -> name index behind the user switcher
+ADMIN_PAGE_SIZE = int(os.getenv('ADMIN_PAGE_SIZE', '48'))
+ADMIN_SWITCHER_SIZE = 50
+ADMIN_SEARCH_MAX_LENGTH = 100
+admin_user_index = TTLCache(maxsize=1, ttl=int(os.getenv('ADMIN_INDEX_TTL', '300')))
+
+# Admin comparison view: cohort size and the pool that syncs its users side by side
+ADMIN_COMPARE_MAX_USERS = int(os.getenv('ADMIN_COMPARE_MAX_USERS', '20'))
+ADMIN_COMPARE_WORKERS = int(os.getenv('ADMIN_COMPARE_WORKERS', '4'))
+compare_pool = ThreadPoolExecutor(max_workers=ADMIN_COMPARE_WORKERS, thread_name_prefix='admin-compare')
+
+# Oura webhook notifications: each one is fetched on a small background pool, and
+# duplicates of a notification that hasn't started yet are dropped
+OURA_WEBHOOK_VERIFICATION_TOKEN = os.getenv('OURA_WEBHOOK_VERIFICATION_TOKEN')
+OURA_WEBHOOK_WORKERS = int(os.getenv('OURA_WEBHOOK_WORKERS', '2'))
+webhook_pool = ThreadPoolExecutor(max_workers=OURA_WEBHOOK_WORKERS, thread_name_prefix='oura-webhook')
+webhook_pending = set()
+webhook_pending_lock = threading.Lock()
+# Oura account id -> profile id
+oura_user_cache = TTLCache(maxsize=4096, ttl=3600)
+
+# Decrypted Oura tokens keyed by ciphertext hash; evicted entries are wiped
+TOKEN_DEBUG = os.getenv('TOKEN_DEBUG', '').lower() in ('1', 'true', 'yes')
+token_cache = TTLCache(
+    maxsize=int(os.getenv('TOKEN_CACHE_SIZE', '1024')),
+    ttl=int(os.getenv('TOKEN_CACHE_TTL', '300')),
+    on_evict=dict.clear
+)
+
 # User class for Flask-Login
 class User(UserMixin):
     """User class for Flask-Login."""
-    def __init__(self, id, email, display_name, oura_tokens, is_admin=False):
+    def __init__(self, id, email, display_name, oura_tokens=None, is_admin=False):
         self.id = id
         self.email = email
         self.display_name = display_name
         self._profile_data = None
-        self.oura_tokens = oura_tokens
+        self._oura_tokens = oura_tokens
         self.is_admin = is_admin
 
     @property
     def profile_data(self):
-        """Get user's profile data from DB."""
+        """Get user's profile data (session projection, no tokens) from DB."""
         if self._profile_data is None:
-            # Fetch from Supabase
-            response = supabase.table('profiles').select('*').eq('id', self.id).execute()
-            if response.data:
-                self._profile_data = response.data[0]
-            else:
-                self._profile_data = {}
+            # Same row load_user just fetched, so this is normally a memo hit
+            self._profile_data = get_session_profile(self.id) or {}
         return self._profile_data
 
+    @property
+    def oura_tokens(self):
+        """Get user's encrypted Oura tokens, fetched only when a route needs them."""
+        if self._oura_tokens is None:
+            response = select_profiles('tokens').eq('id', self.id).execute()
+            if response.data:
+                self._oura_tokens = response.data[0].get('oura_tokens')
+        return self._oura_tokens
+
+def select_profiles(projection, **select_kwargs):
+    """Start a profiles query limited to a named projection (see src/profile_queries.py)."""
+    return profiles_query(supabase, projection, **select_kwargs)
+
+def get_session_profile(user_id):
+    """Return a user's session-projection profile row, or None if there is none.
+
+    Memoized on flask.g for the current request and in a short-TTL LRU cache
+    across requests; anything that writes these columns must call
+    invalidate_profile().
+    """
+    memo = g.setdefault('profile_rows', {}) if has_request_context() else {}
+    if user_id in memo:
+        return memo[user_id]
+
+    row = profile_cache.get(user_id)
+    if row is None:
+        response = select_profiles('session').eq('id', user_id).execute()
+        row = response.data[0] if response.data else None
+        if row is not None:
+            profile_cache.set(user_id, row)
+
+    memo[user_id] = dict(row) if row is not None else None
+    return memo[user_id]
+
+def invalidate_profile(user_id):
+    """Drop a user's cached profile row after writing to it."""
+    profile_cache.pop(user_id)
+    if has_request_context():
+        g.get('profile_rows', {}).pop(user_id, None)
+
 @login_manager.user_loader
 def load_user(user_id):
     """Load user from DB."""
-    response = supabase.table('profiles').select('*').eq('id', user_id).execute()
-    if not response.data:
+    user_data = get_session_profile(user_id)
+    if not user_data:
         return None
 
-    user_data = response.data[0]
     is_admin_user = user_data.get('is_admin', False)
 
     user_obj = User(
         id=user_data['id'],
         email=user_data['email'],
         display_name=user_data['display_name'],
-        oura_tokens=user_data.get('oura_tokens'),
         is_admin=is_admin_user
     )
     return user_obj
@@ -110,74 +265,429 @@ def encrypt_token(token):
     """Encrypt token using Fernet."""
     return cipher_suite.encrypt(json.dumps(token).encode()).decode()
 
+def _trace_token(message):
+    """Print decrypt_token diagnostics when TOKEN_DEBUG is enabled."""
+    if TOKEN_DEBUG:
+        print(f"decrypt_token: {message}")
+
 def decrypt_token(encrypted_token_str):
-    """Decrypt an encrypted token string."""
+    """Decrypt an encrypted token string.
+
+    Parsed tokens are cached by a hash of the ciphertext, so repeat requests
+    skip the Fernet decrypt and JSON parse. Callers get their own copy.
+    """
+    if not encrypted_token_str:
+        _trace_token("Empty token string provided")
+        return None
+
+    if isinstance(encrypted_token_str, str):
+        try:
+            token_bytes = encrypted_token_str.encode('utf-8')
+        except UnicodeEncodeError:
+            _trace_token("UTF-8 encoding failed, trying latin-1")
+            token_bytes = encrypted_token_str.encode('latin-1')
+    else:
+        token_bytes = encrypted_token_str
+
+    cache_key = hashlib.sha256(token_bytes).hexdigest()
+    # Copy under the cache lock: an eviction in another thread wipes the cached dict
+    tokens = token_cache.get(cache_key, copy=dict)
+    if tokens is not None:
+        _trace_token("Cache hit")
+        return tokens
+
+    _trace_token(f"Decrypting token (length: {len(token_bytes)})")
     try:
-        print(f"decrypt_token: Starting decryption of token (length: {len(encrypted_token_str) if encrypted_token_str else 0})")
-        print(f"decrypt_token: First 10 chars of token: {encrypted_token_str[:10] if encrypted_token_str else 'None'}")
-        print(f"decrypt_token: Fernet key length: {len(fernet_key) if fernet_key else 0}")
-        print(f"decrypt_token: First 10 chars of Fernet key: {fernet_key[:10] if fernet_key else 'None'}")
-        
-        if not encrypted_token_str:
-            print("decrypt_token: Empty token string provided")
-            return None
-            
-        # Convert to bytes if it's a string
-        if isinstance(encrypted_token_str, str):
-            print("decrypt_token: Converting string token to bytes")
+        tokens = json.loads(cipher_suite.decrypt(token_bytes))
+    except InvalidToken:
+        print("decrypt_token: Invalid token or wrong Fernet key")
+        return None
+    except ValueError as e:
+        print(f"decrypt_token: Decrypted token is not valid JSON: {str(e)}")
+        return None
+    except Exception as e:
+        print(f"decrypt_token: Unexpected error: {type(e).__name__}: {str(e)}")
+        _trace_token(f"Traceback: {traceback.format_exc()}")
+        return None
+
+    if not isinstance(tokens, dict):
+        print("decrypt_token: Decrypted token is not a JSON object")
+        return None
+
+    # Take the caller's copy before the dict is shared; once cached it can be wiped at any time
+    result = dict(tokens)
+    token_cache.set(cache_key, tokens)
+    return result
+
+def load_stored_tokens(user_id):
+    """Read and decrypt the Oura tokens currently stored for a user."""
+    response = select_profiles('tokens').eq('id', user_id).execute()
+    if not response.data:
+        return None
+    return decrypt_token(response.data[0].get('oura_tokens'))
+
+def save_tokens(user_id, tokens):
+    """Encrypt and persist renewed Oura tokens for a user; raises if they couldn't be stored."""
+    supabase.table('profiles').update({
+        'oura_tokens': encrypt_token(tokens)
+    }).eq('id', user_id).execute()
+
+token_manager = TokenManager(
+    oura_client, OURA_TOKEN_URL, OURA_CLIENT_ID, OURA_CLIENT_SECRET,
+    load=load_stored_tokens, save=save_tokens,
+    leases=RefreshLeases(os.getenv('TOKEN_LEASE_PATH', os.path.join(app.instance_path, 'token_leases.sqlite3')))
+)
+
+def daily_window(days=7):
+    """Return (start_date, end_date) strings for the last `days` days."""
+    start_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+    end_date = datetime.now().strftime('%Y-%m-%d')
+    return start_date, end_date
+
+def update_sleep_scores(user_id):
+    """Recompute a user's sleep statistics from the store and write them to their profile.
+
+    The stats are tagged with the store's daily_sleep version, so nothing is
+    recomputed or written until new or changed days arrive or the day rolls over.
+    """
+    start_date, end_date = daily_window(max(SLEEP_STATS_WINDOWS))
+    version = daily_store.version(user_id, 'daily_sleep')[0]
+    profile = get_session_profile(user_id) or {}
+    current = profile.get('sleep_stats') or {}
+    if current.get('version') == version and current.get('through_day') == end_date:
+        return profile.get('avg_sleep_score'), profile.get('last_sleep_score')
+
+    stats = compute_sleep_stats(daily_store.documents(user_id, 'daily_sleep', start_date, end_date), end_date)
+    stats['version'] = version
+    avg_sleep_score = stats['windows']['7']['mean'] or 0
+    last_sleep_score = stats['last_score']
+
+    try:
+        supabase.table('profiles').update({
+            'avg_sleep_score': avg_sleep_score,
+            'last_sleep_score': last_sleep_score,
+            'sleep_stats': stats
+        }).eq('id', user_id).execute()
+    except Exception as e:
+        print(f"Error updating sleep stats in Supabase: {str(e)}")
+        return avg_sleep_score, last_sleep_score
+
+    invalidate_profile(user_id)
+    publish_leaderboard_entry(user_id, avg_sleep_score=avg_sleep_score, last_sleep_score=last_sleep_score)
+    return avg_sleep_score, last_sleep_score
+
+def publish_leaderboard_entry(user_id, **fields):
+    """Upsert the changed columns of a user's leaderboard snapshot row."""
+    try:
+        supabase.table('leaderboard_entries').upsert({
+            'user_id': user_id,
+            'updated_at': datetime.now().isoformat(),
+            **fields
+        }, on_conflict='user_id').execute()
+    except Exception as e:
+        print(f"Error updating leaderboard entry in Supabase: {str(e)}")
+    leaderboard_cache.clear()
+    if 'avg_sleep_score' in fields:
+        score_index.update(user_id, fields['avg_sleep_score'])
+    else:
+        score_index.track(user_id)
+
+def get_leaderboard(limit=LEADERBOARD_PAGE_SIZE):
+    """Return the top `limit` leaderboard rows."""
+    return get_leaderboard_page(0, limit)
+
+def get_leaderboard_page(offset, limit):
+    """Return `limit` leaderboard rows starting at `offset`, cached in-process for a short TTL.
+
+    Rows are read from leaderboard_entries in the order of its
+    (avg_sleep_score DESC NULLS LAST, user_id) index, so Postgres walks
+    `offset + limit` index entries instead of ranking the whole table first.
+    """
+    key = ('page', offset, limit)
+    rows = leaderboard_cache.get(key)
+    if rows is None:
+        response = supabase.table('leaderboard_entries').select(LEADERBOARD_COLUMNS)\
+            .order('avg_sleep_score', desc=True, nullsfirst=False)\
+            .order('user_id')\
+            .range(offset, offset + limit - 1)\
+            .execute()
+        rows = rank_leaderboard_page(response.data or [], offset)
+        leaderboard_cache.set(key, rows)
+    return rows
+
+def rank_leaderboard_page(rows, offset):
+    """Give a page of score-ordered rows competition ranks (ties share a rank, unscored last).
+
+    A row scoring differently from the one before it ranks at its position.
+    Only the first row can tie with rows on earlier pages; its rank comes from
+    the score index, capped at its position.
+    """
+    previous = None
+    for position, row in enumerate(rows, start=offset + 1):
+        score = row.get('avg_sleep_score')
+        if previous is not None and score == previous[0]:
+            rank = previous[1]
+        elif previous is None and offset > 0:
             try:
-                # First try UTF-8 encoding
-                token_bytes = encrypted_token_str.encode('utf-8')
-                print(f"decrypt_token: Successfully encoded token using UTF-8, length: {len(token_bytes)}")
-            except UnicodeEncodeError:
-                print("decrypt_token: UTF-8 encoding failed, trying latin-1")
-                token_bytes = encrypted_token_str.encode('latin-1')
-                print(f"decrypt_token: Successfully encoded token using latin-1, length: {len(token_bytes)}")
+                rank = min(score_index.rank_of_score(score), position)
+            except Exception as e:
+                print(f"Error loading leaderboard rank index: {str(e)}")
+                rank = position
         else:
-            token_bytes = encrypted_token_str
-            print(f"decrypt_token: Token was already bytes, length: {len(token_bytes)}")
-            
-        print(f"decrypt_token: Token bytes length: {len(token_bytes)}")
-        
-        # Initialize Fernet with the key
-        try:
-            print("decrypt_token: Initializing Fernet with key")
-            key_bytes = fernet_key.encode() if isinstance(fernet_key, str) else fernet_key
-            print(f"decrypt_token: Key bytes length: {len(key_bytes)}")
-            f = Fernet(key_bytes)
-            print("decrypt_token: Successfully initialized Fernet")
-        except Exception as e:
-            print(f"decrypt_token: Error initializing Fernet: {str(e)}")
-            print(f"decrypt_token: Error type: {type(e).__name__}")
-            return None
-        
-        # Decrypt the token
-        print("decrypt_token: Attempting decryption")
-        try:
-            decrypted_token = f.decrypt(token_bytes)
-            print("decrypt_token: Decryption successful")
-        except Exception as e:
-            print(f"decrypt_token: Error during decryption: {str(e)}")
-            print(f"decrypt_token: Error type: {type(e).__name__}")
+            rank = position
+        row['rank'] = rank
+        previous = (score, rank)
+    return rows
+
+def load_leaderboard_scores():
+    """Yield (user_id, avg_sleep_score) for every snapshot row, a page at a time."""
+    offset = 0
+    while True:
+        rows = supabase.table('leaderboard_entries').select('user_id, avg_sleep_score')\
+            .order('user_id')\
+            .range(offset, offset + SUPABASE_PAGE_SIZE - 1)\
+            .execute().data or []
+        for row in rows:
+            yield row['user_id'], row.get('avg_sleep_score')
+        if len(rows) < SUPABASE_PAGE_SIZE:
+            return
+        offset += SUPABASE_PAGE_SIZE
+
+score_index = ScoreIndex(load_leaderboard_scores, ttl=LEADERBOARD_INDEX_TTL)
+
+def get_leaderboard_rank(user_id):
+    """Return a user's leaderboard rank, or None if they have no snapshot row."""
+    return score_index.rank(user_id)
+
+def get_leaderboard_position(user_id):
+    """Return a user's (rank, 1-based row position) in leaderboard order, or (None, None).
+
+    Tied users share a rank but are listed by user_id, so the row position is
+    the rank plus the tied rows sorting before this user.
+    """
+    rank = get_leaderboard_rank(user_id)
+    if rank is None:
+        return None, None
+    score = score_index.score(user_id)
+    query = supabase.table('leaderboard_entries').select('user_id', count='exact', head=True).lt('user_id', user_id)
+    query = query.is_('avg_sleep_score', 'null') if score is None else query.eq('avg_sleep_score', score)
+    return rank, rank + (query.execute().count or 0)
+
+def get_leaderboard_standing(user_id):
+    """Return a user's rank, percentile and the score histogram, or None if the index can't be loaded."""
+    try:
+        return score_index.standing(user_id)
+    except Exception as e:
+        print(f"Error loading leaderboard rank index: {str(e)}")
+        return None
+
+def get_friend_ids(user_id):
+    """Return the ids of a user's friends, cached per user."""
+    friend_ids = friends_cache.get(user_id)
+    if friend_ids is None:
+        response = supabase.table('friendships').select('friend_id').eq('user_id', user_id).execute()
+        friend_ids = tuple(row['friend_id'] for row in response.data or [])
+        friends_cache.set(user_id, friend_ids)
+    return friend_ids
+
+def invalidate_friends(user_id):
+    """Drop a user's cached friend ids after their friendships change."""
+    friends_cache.pop(user_id)
+
+def get_friends_leaderboard(user_id):
+    """Return the user and their friends as ranked leaderboard rows.
+
+    The snapshot rows for everyone come back in a single `in_` query however
+    many friends there are; ranking them (ties share a rank, unscored last,
+    like the global leaderboard) happens here.
+    """
+    member_ids = [user_id, *get_friend_ids(user_id)]
+    response = supabase.table('leaderboard_entries')\
+        .select('user_id, display_name, avg_sleep_score, last_sleep_score')\
+        .in_('user_id', member_ids)\
+        .execute()
+    rows = sorted(
+        response.data or [],
+        key=lambda row: (row.get('avg_sleep_score') is None, -float(row.get('avg_sleep_score') or 0), row['user_id'])
+    )
+    previous = None
+    for position, row in enumerate(rows, start=1):
+        score = row.get('avg_sleep_score')
+        if previous is None or score != previous[0]:
+            previous = (score, position)
+        row['rank'] = previous[1]
+    return rows
+
+def encode_cursor(offset):
+    """Encode a leaderboard offset as an opaque pagination cursor."""
+    return base64.urlsafe_b64encode(json.dumps({'o': offset}).encode()).decode()
+
+def decode_cursor(cursor):
+    """Decode a pagination cursor; raises ValueError if it is malformed."""
+    try:
+        offset = json.loads(base64.urlsafe_b64decode(cursor.encode()))['o']
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError('Invalid cursor')
+    return offset
+
+def refresh_user_data(user_id, access_token, max_age=OURA_SYNC_INTERVAL, priority='interactive',
+                      collections=DAILY_COLLECTIONS):
+    """Sync a user's recent daily summaries and refresh their derived sleep scores.
+
+    Returns the CollectionFetch results of the sync so callers can report
+    failures; an empty dict means the store was already fresh.
+    """
+    # The first sync pulls the longest stats window; later ones only fetch new days
+    start_date, end_date = daily_window(max(SLEEP_STATS_WINDOWS))
+    fetches = sync_daily(oura_client, daily_store, user_id, access_token, collections, start_date, end_date,
+                         max_age=max_age, priority=priority)
+
+    sleep_fetch = fetches.get('daily_sleep')
+    if sleep_fetch and sleep_fetch.error is None and sleep_fetch.response.status_code == 200:
+        update_sleep_scores(user_id)
+    return fetches
+
+def sync_user_data(user_id, tokens, max_age=OURA_SYNC_INTERVAL, refresh_margin=None, priority='interactive',
+                   collections=DAILY_COLLECTIONS):
+    """Renew a user's tokens if they are due, then sync their data.
+
+    A sync rejected with 401 forces one token refresh and is retried. Returns
+    (tokens, fetches); tokens is None when they have expired and could not be
+    renewed, so the user has to authorize again.
+    """
+    tokens = token_manager.valid_tokens(user_id, tokens, margin=refresh_margin)
+    if not tokens:
+        return None, {}
+
+    fetches = refresh_user_data(user_id, tokens['access_token'], max_age=max_age, priority=priority,
+                                collections=collections)
+    if any(fetch.error is None and fetch.response.status_code == 401 for fetch in fetches.values()):
+        print(f"sync_user_data: Oura rejected the access token for {user_id}, refreshing")
+        tokens = token_manager.valid_tokens(user_id, tokens, force=True)
+        if not tokens:
+            return None, fetches
+        fetches = refresh_user_data(user_id, tokens['access_token'], max_age=max_age, priority=priority,
+                                collections=collections)
+    return tokens, fetches
+
+def run_user_backfill(user_id):
+    """Claim and run a user's backfill job; returns its status, or None if it couldn't be claimed."""
+    job = backfill_jobs.claim(user_id)
+    if job is None:
+        return None
+    try:
+        tokens = token_manager.valid_tokens(user_id, load_stored_tokens(user_id))
+        if not tokens or not tokens.get('access_token'):
+            backfill_jobs.release(user_id, delay=3600, error='Oura authorization missing or expired')
+            return 'pending'
+        return run_backfill(backfill_jobs, oura_client, daily_store, job, tokens['access_token'], DAILY_COLLECTIONS)
+    except Exception as e:
+        print(f"backfill: Error backfilling {user_id}: {str(e)}")
+        traceback.print_exc()
+        backfill_jobs.release(user_id, delay=300, error=str(e))
+        return 'pending'
+
+def start_backfill(user_id):
+    """Queue a backfill of the user's history before the synced window and start it in the background.
+
+    Users who already have a job keep it; unfinished ones are resumed by
+    resume_backfills() in the sync worker.
+    """
+    end_day, oldest_day = backfill_range(daily_window(max(SLEEP_STATS_WINDOWS))[0])
+    if backfill_jobs.enqueue(user_id, end_day, oldest_day):
+        backfill_pool.submit(run_user_backfill, user_id)
+
+def resume_backfill(user_id):
+    """Run a job queued by resume_backfills() and let it be queued again."""
+    try:
+        return run_user_backfill(user_id)
+    finally:
+        with backfill_queued_lock:
+            backfill_queued.discard(user_id)
+
+def resume_backfills():
+    """Queue every due, unfinished backfill job on backfill_pool; returns the newly queued user ids.
+
+    Doesn't wait for the jobs: each run loads at most BACKFILL_CHUNKS_PER_RUN
+    chunks and puts the job back for a later call, so backfills never hold up
+    the caller's sync pass.
+    """
+    queued = []
+    for user_id in backfill_jobs.runnable():
+        with backfill_queued_lock:
+            if user_id in backfill_queued:
+                continue
+            backfill_queued.add(user_id)
+        backfill_pool.submit(resume_backfill, user_id)
+        queued.append(user_id)
+    return queued
+
+def find_oura_user(oura_user_id):
+    """Return the id of the profile linked to an Oura account, or None if nobody has linked it."""
+    user_id = oura_user_cache.get(oura_user_id)
+    if user_id is None:
+        response = select_profiles('lookup').eq('oura_user_id', oura_user_id).execute()
+        if not response.data:
             return None
-        
-        # Parse the JSON
-        print("decrypt_token: Parsing JSON")
-        try:
-            tokens = json.loads(decrypted_token)
-            print("decrypt_token: JSON parsing successful")
-            return tokens
-        except json.JSONDecodeError as e:
-            print(f"decrypt_token: JSON parsing failed: {str(e)}")
-            print(f"decrypt_token: Decrypted content: {decrypted_token}")
+        user_id = response.data[0]['id']
+        oura_user_cache.set(oura_user_id, user_id)
+    return user_id
+
+def fetch_webhook_document(user_id, tokens, data_type, object_id):
+    """Fetch one daily document, refreshing the tokens once if Oura rejects them."""
+    response = oura_client.get(oura_client.document_url(data_type, object_id),
+                               access_token=tokens['access_token'], priority='background')
+    if response.status_code == 401:
+        tokens = token_manager.valid_tokens(user_id, tokens, force=True)
+        if not tokens:
             return None
-            
+        response = oura_client.get(oura_client.document_url(data_type, object_id),
+                                   access_token=tokens['access_token'], priority='background')
+    return response
+
+def process_webhook_event(oura_user_id, data_type, object_id):
+    """Fetch the document a notification points at, store it and refresh derived scores.
+
+    Returns the number of stored documents that were new or changed. Failures
+    are only logged: the regular sync picks the day up later.
+    """
+    with webhook_pending_lock:
+        webhook_pending.discard((oura_user_id, data_type, object_id))
+    try:
+        user_id = find_oura_user(oura_user_id)
+        if user_id is None:
+            print(f"webhook: No profile is linked to Oura user {oura_user_id}")
+            return 0
+        tokens = token_manager.valid_tokens(user_id, load_stored_tokens(user_id))
+        if not tokens or not tokens.get('access_token'):
+            print(f"webhook: Oura authorization missing or expired for {user_id}")
+            return 0
+        response = fetch_webhook_document(user_id, tokens, data_type, object_id)
+        if response is None or response.status_code != 200:
+            status = 'no tokens' if response is None else response.status_code
+            print(f"webhook: Fetching {data_type}/{object_id} for {user_id} failed ({status})")
+            return 0
+
+        changed = daily_store.upsert_documents(user_id, data_type, [response.json()])
+        if changed and data_type == 'daily_sleep':
+            update_sleep_scores(user_id)
+        return changed
     except Exception as e:
-        print(f"decrypt_token: Unexpected error: {str(e)}")
-        print(f"decrypt_token: Error type: {type(e).__name__}")
-        import traceback
-        print(f"decrypt_token: Traceback: {traceback.format_exc()}")
-        return None
+        print(f"webhook: Error processing {data_type}/{object_id}: {str(e)}")
+        traceback.print_exc()
+        return 0
+
+def enqueue_webhook_event(oura_user_id, data_type, object_id):
+    """Process a notification in the background; returns False if the same one is already queued."""
+    key = (oura_user_id, data_type, object_id)
+    with webhook_pending_lock:
+        if key in webhook_pending:
+            return False
+        webhook_pending.add(key)
+    webhook_pool.submit(process_webhook_event, oura_user_id, data_type, object_id)
+    return True
 
 @app.route('/')
 def index():
@@ -188,64 +698,7 @@ def index():
     # Add email scope to ensure we can retrieve user information
     scope = "daily+personal+heartrate+workout+session+tag+email"
     auth_url = f"{OURA_AUTH_URL}?client_id={OURA_CLIENT_ID}&redirect_uri={OURA_REDIRECT_URI}&response_type=code&scope={scope}"
-    return render_template_string('''
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Oura Ring Data Comparison</title>
-        <style>
-            body {
-                font-family: Arial, sans-serif;
-                margin: 0;
-                padding: 0;
-                display: flex;
-                justify-content: center;
-                align-items: center;
-                height: 100vh;
-                background-color: #f5f5f5;
-            }
-            .login-container {
-                background: white;
-                border-radius: 8px;
-                padding: 40px;
-                box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-                text-align: center;
-                max-width: 500px;
-            }
-            h1 {
-                margin-top: 0;
-                color: #333;
-            }
-            p {
-                color: #666;
-                margin-bottom: 30px;
-            }
-            .login-button {
-                background-color: #6200EA;
-                color: white;
-                border: none;
-                padding: 12px 24px;
-                border-radius: 4px;
-                font-size: 16px;
-                cursor: pointer;
-                text-decoration: none;
-                display: inline-block;
-                transition: background-color 0.3s;
-            }
-            .login-button:hover {
-                background-color: #5000D6;
-            }
-        </style>
-    </head>
-    <body>
-        <div class="login-container">
-            <h1>Oura Ring Data Comparison</h1>
-            <p>Compare your sleep and readiness metrics with other users. Connect your Oura Ring to get started.</p>
-            <a href="{{ auth_url }}" class="login-button">Connect Oura Ring</a>
-        </div>
-    </body>
-    </html>
-    ''', auth_url=auth_url)
+    return render_template('index.html', auth_url=auth_url)
 
 @app.route('/callback')
 def callback():
@@ -255,7 +708,7 @@ def callback():
         return "Authorization failed", 400
 
     # Exchange code for access token
-    token_response = requests.post(
+    token_response = oura_client.post(
         OURA_TOKEN_URL,
         data={
             'grant_type': 'authorization_code',
@@ -269,12 +722,12 @@ def callback():
     if token_response.status_code != 200:
         return f"Token exchange failed: {token_response.text}", 400
 
-    tokens = token_response.json()
+    tokens = stamp_expiry(token_response.json())
     
     # Get user info from Oura
-    user_info_response = requests.get(
-        'https://api.ouraring.com/v2/usercollection/personal_info',
-        headers={'Authorization': f"Bearer {tokens['access_token']}"}
+    user_info_response = oura_client.get(
+        '/v2/usercollection/personal_info',
+        access_token=tokens['access_token']
     )
     
     if user_info_response.status_code != 200:
@@ -288,7 +741,7 @@ def callback():
 
     # Check if profile exists
     try:
-        existing_profile = supabase.table('profiles').select('*').eq('oura_user_id', user_info.get('id')).execute()
+        existing_profile = select_profiles('lookup').eq('oura_user_id', user_info.get('id')).execute()
 
         # Encrypt tokens for storage
         encrypted_tokens = encrypt_token(tokens)
@@ -339,8 +792,11 @@ def callback():
 
         # Login user
         if profile_id:
-            profile_data = supabase.table('profiles').select('*').eq('id', profile_id).execute().data[0]
-            user = User(profile_id, profile_data['email'], profile_data['display_name'], profile_data.get('oura_tokens'), profile_data.get('is_admin', False))
+            invalidate_profile(profile_id)
+            publish_leaderboard_entry(profile_id, display_name=display_name)
+            start_backfill(profile_id)
+            profile_data = get_session_profile(profile_id) or {}
+            user = User(profile_id, email, display_name, encrypted_tokens, profile_data.get('is_admin', False))
             login_user(user)
             return redirect(url_for('dashboard'))
         else:
@@ -358,17 +814,8 @@ def dashboard():
         # Get user's profile data
         profile = current_user.profile_data
         
-        # Get all profiles for leaderboard
-        try:
-            leaderboard_response = supabase.table('profiles').select('*').order('avg_sleep_score', desc=True).execute()
-            leaderboard = leaderboard_response.data if leaderboard_response.data else []
-        except Exception as e:
-            print(f"Error fetching leaderboard: {str(e)}")
-            flash("Error fetching leaderboard data.", "error")
-            leaderboard = []
-        
         # Decrypt tokens
-        tokens = decrypt_token(profile['oura_tokens'])
+        tokens = decrypt_token(current_user.oura_tokens)
         if not tokens:
             logout_user()
             flash("Session invalid or token decryption failed. Please log in again.", "error")
@@ -382,599 +829,75 @@ def dashboard():
             return redirect(url_for('index'))
         
         # --- Define Date Range ---
-        start_date = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
-        end_date = datetime.now().strftime('%Y-%m-%d')
-        
-        headers = {'Authorization': f"Bearer {access_token}"}
-        
-        # --- CORRECTED: Fetch V2 Daily Sleep Data ---
-        sleep_data = {"data": []}  # Default empty structure
-        sleep_url = 'https://api.ouraring.com/v2/usercollection/daily_sleep'
-        sleep_params = {'start_date': start_date, 'end_date': end_date}
-        print(f"Fetching V2 Daily Sleep from: {sleep_url} with params: {sleep_params}")
-        
-        try:
-            sleep_response = requests.get(sleep_url, headers=headers, params=sleep_params)
-            print(f"V2 Daily Sleep Response Status: {sleep_response.status_code}")
-            
-            if sleep_response.status_code == 200:
-                sleep_data = sleep_response.json()
-                print("V2 Daily Sleep Response JSON:", json.dumps(sleep_data, indent=2))
-                if not sleep_data.get("data"):
-                    print("V2 Daily Sleep data array is empty.")
-                    # Generate placeholder data
-                    sleep_data = {"data": []}
-                    for i in range(7):
-                        day_date = (datetime.now() - timedelta(days=6-i)).strftime('%Y-%m-%d')
-                        sleep_data["data"].append({
-                            "day": day_date,
-                            "score": 0,
-                            "total_sleep_duration": 0,
-                            "deep_sleep_duration": 0,
-                            "rem_sleep_duration": 0,
-                            "light_sleep_duration": 0
-                        })
-            elif sleep_response.status_code in [401, 403]:
-                print("V2 Daily Sleep request failed with Auth error (401/403). Token might be expired or lack scope.")
-                flash("Authentication error fetching sleep data. Your session might have expired.", "error")
-            else:
-                # Handle other errors (404, 5xx, etc.)
-                print(f"V2 Daily Sleep request failed. Status: {sleep_response.status_code}, Response: {sleep_response.text}")
-                flash(f"Failed to fetch sleep data (Error {sleep_response.status_code}).", "error")
-                # Generate placeholder data
-                sleep_data = {"data": []}
-                for i in range(7):
-                    day_date = (datetime.now() - timedelta(days=6-i)).strftime('%Y-%m-%d')
-                    sleep_data["data"].append({
-                        "day": day_date,
-                        "score": 0,
-                        "total_sleep_duration": 0,
-                        "deep_sleep_duration": 0,
-                        "rem_sleep_duration": 0,
-                        "light_sleep_duration": 0
-                    })
-        
-        except requests.exceptions.RequestException as e:
-            print(f"Network error fetching V2 Daily Sleep: {str(e)}")
-            flash("Network error connecting to Oura API for sleep data.", "error")
-        except json.JSONDecodeError:
-            print(f"Failed to decode V2 Daily Sleep JSON response. Content: {sleep_response.text}")
-            flash("Invalid response received from Oura API for sleep data.", "error")
-        except Exception as e:  # Catch unexpected errors
-            print(f"Unexpected error fetching V2 Daily Sleep: {str(e)}")
-            flash("An unexpected error occurred while fetching sleep data.", "error")
-        
-        # --- Process Sleep Data (Calculate Average) ---
-        sleep_scores = []
-        # Use the V2 structure directly: data is a list of daily summaries
-        if sleep_data and 'data' in sleep_data:
-            for day in sleep_data['data']:
-                # V2 uses 'score', not 'sleep_score' directly in the summary object
-                if day.get('score') is not None:
-                    sleep_scores.append(day.get('score'))
-        else:
-            print("Sleep data structure missing 'data' key or is empty after fetch attempt.")
-        
-        # Sort sleep_data['data'] by day if needed for display
-        if sleep_data.get('data'):
-            sleep_data['data'].sort(key=lambda x: x.get('day', ''))
-        
-        avg_sleep_score = sum(sleep_scores) / len(sleep_scores) if sleep_scores else 0
-        last_sleep_score = sleep_scores[-1] if sleep_scores else None  # Get last score if sorted/relevant
+        start_date, end_date = daily_window()
         
-        # Update profile with average sleep score
-        try:
-            supabase.table('profiles').update({
-                'avg_sleep_score': avg_sleep_score,
-                'last_sleep_score': last_sleep_score
-            }).eq('id', current_user.id).execute()
-        except Exception as e:
-            print(f"Error updating sleep scores in Supabase: {str(e)}")
-        
-        # --- Fetch Readiness Data ---
-        readiness_data = {"data": []}
-        readiness_url = 'https://api.ouraring.com/v2/usercollection/daily_readiness'
-        readiness_params = {'start_date': start_date, 'end_date': end_date}
+        # --- Renew tokens if due, then sync new sleep days and scores (a no-op while the worker keeps them fresh) ---
+        # The other tabs load their own data from the /api/v1 endpoints when first opened
+        tokens, fetches = sync_user_data(current_user.id, tokens, collections=['daily_sleep'])
+        if not tokens:
+            logout_user()
+            flash("Your Oura authorization has expired. Please log in again.", "error")
+            return redirect(url_for('index'))
         
-        try:
-            readiness_response = requests.get(readiness_url, headers=headers, params=readiness_params)
-            print(f"Readiness API Response Status: {readiness_response.status_code}")
+        # --- CORRECTED: Report V2 Daily Sleep sync problems ---
+        if 'daily_sleep' in fetches:
+            try:
+                sleep_response = fetches['daily_sleep'].result()
+                print(f"V2 Daily Sleep Response Status: {sleep_response.status_code}")
+                
+                if sleep_response.status_code in [401, 403]:
+                    print("V2 Daily Sleep request failed with Auth error (401/403). Token might be expired or lack scope.")
+                    flash("Authentication error fetching sleep data. Your session might have expired.", "error")
+                elif sleep_response.status_code != 200:
+                    # Handle other errors (404, 5xx, etc.)
+                    print(f"V2 Daily Sleep request failed. Status: {sleep_response.status_code}, Response: {sleep_response.text}")
+                    flash(f"Failed to fetch sleep data (Error {sleep_response.status_code}).", "error")
             
-            if readiness_response.status_code == 200:
-                readiness_data = readiness_response.json()
-                print("Readiness API Response:", json.dumps(readiness_data, indent=2))
-            else:
-                print(f"Readiness API request failed. Status: {readiness_response.status_code}")
-                flash("Error fetching readiness data.", "error")
-        except Exception as e:
-            print(f"Error fetching Readiness data: {str(e)}")
-            flash("Error fetching readiness data.", "error")
+            except RateLimitExceeded as e:
+                print(f"V2 Daily Sleep sync deferred by the rate limiter: {str(e)}")
+                flash("Oura is busy right now; showing your most recently synced sleep data.", "error")
+            except requests.exceptions.RequestException as e:
+                print(f"Network error fetching V2 Daily Sleep: {str(e)}")
+                flash("Network error connecting to Oura API for sleep data.", "error")
+            except json.JSONDecodeError:
+                print("Failed to decode V2 Daily Sleep JSON response.")
+                flash("Invalid response received from Oura API for sleep data.", "error")
+            except Exception as e:  # Catch unexpected errors
+                print(f"Unexpected error fetching V2 Daily Sleep: {str(e)}")
+                flash("An unexpected error occurred while fetching sleep data.", "error")
         
-        # --- Fetch Activity Data ---
-        activity_data = {"data": []}
-        activity_url = 'https://api.ouraring.com/v2/usercollection/daily_activity'
-        activity_params = {'start_date': start_date, 'end_date': end_date}
-        
-        try:
-            activity_response = requests.get(activity_url, headers=headers, params=activity_params)
-            print(f"Activity API Response Status: {activity_response.status_code}")
-            
-            if activity_response.status_code == 200:
-                activity_data = activity_response.json()
-                print("Activity API Response:", json.dumps(activity_data, indent=2))
-            else:
-                print(f"Activity API request failed. Status: {activity_response.status_code}")
-                flash("Error fetching activity data.", "error")
-        except Exception as e:
-            print(f"Error fetching Activity data: {str(e)}")
-            flash("Error fetching activity data.", "error")
+        # --- Skip rendering if the browser already has this exact page ---
+        sleep_version, last_modified = daily_store.version(current_user.id, 'daily_sleep')
+        standing = get_leaderboard_standing(current_user.id)
+        etag = etag_for(TEMPLATE_VERSION, profile, standing, sleep_version, start_date, end_date)
+        cached = not_modified(etag, last_modified)
+        if cached is not None:
+            return cached
 
+        # --- Read Sleep Data from the store ---
+        sleep_data = {"data": daily_store.documents(current_user.id, 'daily_sleep', start_date, end_date)}
+        if not sleep_data["data"]:
+            print("V2 Daily Sleep data array is empty.")
+            # Generate placeholder data
+            for i in range(7):
+                day_date = (datetime.now() - timedelta(days=6-i)).strftime('%Y-%m-%d')
+                sleep_data["data"].append({
+                    "day": day_date,
+                    "score": 0,
+                    "total_sleep_duration": 0,
+                    "deep_sleep_duration": 0,
+                    "rem_sleep_duration": 0,
+                    "light_sleep_duration": 0
+                })
+        
         # Update the template to use the correct field names from V2 API
-        return render_template_string('''
-<!DOCTYPE html>
-<html>
-<head>
-    <title>Oura Ring Dashboard</title>
-    <style>
-        body {
-            font-family: Arial, sans-serif;
-            margin: 0;
-            padding: 20px;
-            background-color: #f5f5f5;
-        }
-        .card {
-            background: white;
-            border-radius: 8px;
-            padding: 20px;
-            margin-bottom: 20px;
-            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-        }
-        .data-grid {
-            display: grid;
-            grid-template-columns: repeat(auto-fill, minmax(200px, 1fr));
-            gap: 20px;
-            margin-top: 20px;
-        }
-        .score {
-            font-size: 24px;
-            font-weight: bold;
-        }
-        .sleep-score {
-            color: #4CAF50;
-        }
-        .readiness-score {
-            color: #2196F3;
-        }
-        .activity-score {
-            color: #FF9800;
-        }
-        .progress-bar {
-            background: #e0e0e0;
-            height: 10px;
-            border-radius: 5px;
-            margin-top: 10px;
-        }
-        .progress {
-            height: 100%;
-            border-radius: 5px;
-            width: 0%;
-            transition: width 0.3s ease;
-        }
-        .sleep-progress {
-            background: #4CAF50;
-        }
-        .readiness-progress {
-            background: #2196F3;
-        }
-        .activity-progress {
-            background: #FF9800;
-        }
-        .leaderboard {
-            margin-top: 30px;
-        }
-        .leaderboard-table {
-            width: 100%;
-            border-collapse: collapse;
-            margin-top: 20px;
-        }
-        .leaderboard-table th,
-        .leaderboard-table td {
-            padding: 12px;
-            text-align: left;
-            border-bottom: 1px solid #ddd;
-        }
-        .leaderboard-table th {
-            background-color: #f8f9fa;
-        }
-        .current-user {
-            background-color: #e3f2fd;
-        }
-        .logout {
-            float: right;
-            color: #666;
-            text-decoration: none;
-        }
-        .logout:hover {
-            color: #333;
-        }
-        .tab-container {
-            margin-bottom: 20px;
-        }
-        .tab {
-            display: inline-block;
-            padding: 10px 20px;
-            cursor: pointer;
-            background-color: #ddd;
-            border-radius: 5px 5px 0 0;
-            margin-right: 5px;
-        }
-        .tab.active {
-            background-color: white;
-            border-bottom: 2px solid #6200EA;
-        }
-        .tab-content {
-            display: none;
-        }
-        .tab-content.active {
-            display: block;
-        }
-        .friend-form {
-            margin-top: 20px;
-            padding-top: 20px;
-            border-top: 1px solid #eee;
-        }
-        .btn {
-            background-color: #6200EA;
-            color: white;
-            border: none;
-            padding: 8px 16px;
-            border-radius: 4px;
-            cursor: pointer;
-        }
-        .btn:hover {
-            background-color: #5000D6;
-        }
-    </style>
-    <script>
-        document.addEventListener('DOMContentLoaded', function() {
-            // Initialize progress bars
-            function initProgressBar(id) {
-                document.querySelectorAll('.' + id).forEach(function(el) {
-                    setTimeout(function() {
-                        el.style.width = el.getAttribute('data-width') + '%';
-                    }, 100);
-                });
-            }
-            
-            initProgressBar('sleep-progress');
-            initProgressBar('readiness-progress');
-            initProgressBar('activity-progress');
-            
-            // Tab functionality
-            document.querySelectorAll('.tab').forEach(function(tab) {
-                tab.addEventListener('click', function() {
-                    // Remove active class from all tabs
-                    document.querySelectorAll('.tab').forEach(function(t) {
-                        t.classList.remove('active');
-                    });
-                    // Add active class to clicked tab
-                    this.classList.add('active');
-                    
-                    // Hide all tab content
-                    document.querySelectorAll('.tab-content').forEach(function(content) {
-                        content.classList.remove('active');
-                    });
-                    // Show corresponding content
-                    document.getElementById(this.getAttribute('data-tab')).classList.add('active');
-                });
-            });
-        });
-    </script>
-</head>
-<body>
-    <div class="card">
-        <a href="{{ url_for('logout') }}" class="logout">Logout</a>
-        <h1>Your Oura Ring Dashboard</h1>
-        <p>Welcome, {{ profile.display_name }}!</p>
-    </div>
-    
-    <div class="tab-container">
-        <div class="tab active" data-tab="sleep-tab">Sleep Data</div>
-        <div class="tab" data-tab="readiness-tab">Readiness Data</div>
-        <div class="tab" data-tab="activity-tab">Activity Data</div>
-        <div class="tab" data-tab="leaderboard-tab">Leaderboard</div>
-    </div>
-    
-    <div id="sleep-tab" class="tab-content active">
-        <div class="card">
-            <h2>Your Sleep Scores (Last 7 Days)</h2>
-            <p>Average Sleep Score: <span class="score sleep-score">{{ "%.1f"|format(profile.avg_sleep_score or 0) }}</span></p>
-            <div class="data-grid">
-                {% for day in sleep_data.get('data', []) %}
-                <div class="card">
-                    <h3>{{ day.get('day', 'Unknown Date') }}</h3>
-                    <div class="score sleep-score">{{ day.get('score', 'N/A') }}</div>
-                    <div class="progress-bar">
-                        <div class="progress sleep-progress" data-width="{{ day.get('score', 0) or 0 }}" style="width: 0%"></div>
-                    </div>
-                    
-                    <div style="margin-top: 15px; border-top: 1px solid #eee; padding-top: 10px;">
-                        <h4>Sleep Details</h4>
-                        <ul style="padding-left: 0; list-style-type: none;">
-                            <li style="margin-bottom: 5px;"><strong>Score:</strong> {{ day.get('score', 'N/A') }}</li>
-                            {% if day.get('efficiency') is not none %}
-                            <li style="margin-bottom: 5px;"><strong>Efficiency:</strong> {{ day.get('efficiency') }}%</li>
-                            {% endif %}
-                            {% if day.get('total_sleep_duration') is not none %}
-                            <li style="margin-bottom: 5px;"><strong>Total Sleep:</strong> {% if day.get('total_sleep_duration') > 0 %}{{ day.get('total_sleep_duration') // 60 }} hours {{ day.get('total_sleep_duration') % 60 }} minutes{% else %}<span style="color: #999;">No data available</span>{% endif %}</li>
-                            {% endif %}
-                            {% if day.get('sleep_phase_durations') is not none and day.get('sleep_phase_durations').get('awake') is not none %}
-                            <li style="margin-bottom: 5px;"><strong>Awake Time:</strong> {{ day.get('sleep_phase_durations', {}).get('awake', 0) // 60 }} min {{ day.get('sleep_phase_durations', {}).get('awake', 0) % 60 }} sec</li>
-                            {% endif %}
-                            {% if day.get('latency') is not none %}
-                            <li style="margin-bottom: 5px;"><strong>Sleep Latency:</strong> {% if day.get('latency') > 0 %}{{ day.get('latency') // 60 }} min {{ day.get('latency') % 60 }} sec{% else %}<span style="color: #999;">No data available</span>{% endif %}</li>
-                            {% endif %}
-                            {% if day.get('sleep_phase_count') is not none %}
-                            <li style="margin-bottom: 5px;"><strong>Sleep Cycles:</strong> {{ day.get('sleep_phase_count') }}</li>
-                            {% endif %}
-                            {% if day.get('restless_periods') is not none %}
-                            <li style="margin-bottom: 5px;"><strong>Restless Periods:</strong> {{ day.get('restless_periods') }}</li>
-                            {% endif %}
-                            {% if day.get('sleep_score_delta') is not none %}
-                            <li style="margin-bottom: 5px;"><strong>Score Change:</strong> {{ day.get('sleep_score_delta') }}</li>
-                            {% endif %}
-                        </ul>
-                    </div>
-                    
-                    <!-- Sleep Phases -->
-                    {% set deep = day.get('deep_sleep_duration', 0) or 0 %}
-                    {% set rem = day.get('rem_sleep_duration', 0) or 0 %}
-                    {% set light = day.get('light_sleep_duration', 0) or 0 %}
-                    {% set awake = day.get('awake_time', 0) or 0 %}
-                    {% set total = deep + rem + light + awake %}
-                    
-                    {% if total > 0 %}
-                    <div class="metric-card">
-                        <h4>Sleep Phases</h4>
-                        <div class="phase-bar">
-                            {% set deep_pct = (deep * 100 / total) | round %}
-                            {% set rem_pct = (rem * 100 / total) | round %}
-                            {% set light_pct = (light * 100 / total) | round %}
-                            {% set awake_pct = (awake * 100 / total) | round %}
-                            
-                            {% if deep_pct > 0 %}
-                            <div class="phase-segment deep-sleep" style="width: {{ deep_pct }}%">
-                                {{ deep_pct }}%
-                            </div>
-                            {% endif %}
-                            {% if rem_pct > 0 %}
-                            <div class="phase-segment rem-sleep" style="width: {{ rem_pct }}%">
-                                {{ rem_pct }}%
-                            </div>
-                            {% endif %}
-                            {% if light_pct > 0 %}
-                            <div class="phase-segment light-sleep" style="width: {{ light_pct }}%">
-                                {{ light_pct }}%
-                            </div>
-                            {% endif %}
-                            {% if awake_pct > 0 %}
-                            <div class="phase-segment awake" style="width: {{ awake_pct }}%">
-                                {{ awake_pct }}%
-                            </div>
-                            {% endif %}
-                        </div>
-                        <div class="phase-legend">
-                            <span>Deep: {{ (deep / 60) | round }}min</span>
-                            <span>REM: {{ (rem / 60) | round }}min</span>
-                            <span>Light: {{ (light / 60) | round }}min</span>
-                            <span>Awake: {{ (awake / 60) | round }}min</span>
-                        </div>
-                    </div>
-                    {% endif %}
-                    
-                    {% if day.get('average_heart_rate') or day.get('lowest_heart_rate') or day.get('average_hrv') or day.get('temperature_delta') or day.get('breathing_variations') %}
-                    <div style="margin-top: 15px; border-top: 1px solid #eee; padding-top: 10px;">
-                        <h4>Biometrics</h4>
-                        <ul style="padding-left: 0; list-style-type: none;">
-                            {% if day.get('average_heart_rate') %}
-                            <li style="margin-bottom: 5px;"><strong>Average HR:</strong> {{ day.get('average_heart_rate') }} bpm</li>
-                            {% endif %}
-                            
-                            {% if day.get('lowest_heart_rate') %}
-                            <li style="margin-bottom: 5px;"><strong>Lowest HR:</strong> {{ day.get('lowest_heart_rate') }} bpm</li>
-                            {% endif %}
-                            
-                            {% if day.get('average_hrv') %}
-                            <li style="margin-bottom: 5px;"><strong>Average HRV:</strong> {{ day.get('average_hrv') }} ms</li>
-                            {% endif %}
-                            
-                            {% if day.get('average_breath') %}
-                            <li style="margin-bottom: 5px;"><strong>Respiratory Rate:</strong> {{ day.get('average_breath') }} breaths/min</li>
-                            {% endif %}
-                            
-                            {% if day.get('temperature_delta') %}
-                            <li style="margin-bottom: 5px;"><strong>Temperature Deviation:</strong> {{ "%.2f"|format(day.get('temperature_delta')) }} °C</li>
-                            {% endif %}
-                            
-                            {% if day.get('breathing_variations') %}
-                            <li style="margin-bottom: 5px;"><strong>Breathing Variations:</strong> {{ day.get('breathing_variations') }}</li>
-                            {% endif %}
-                            
-                            {% if day.get('heart_rate_variability') %}
-                            <li style="margin-bottom: 5px;"><strong>HRV Trend:</strong> {{ day.get('heart_rate_variability') }}</li>
-                            {% endif %}
-                        </ul>
-                    </div>
-                    {% endif %}
-                    
-                    {% if day.get('bedtime_start') or day.get('bedtime_end') %}
-                    <div style="margin-top: 15px; border-top: 1px solid #eee; padding-top: 10px;">
-                        <h4>Sleep Timing</h4>
-                        <ul style="padding-left: 0; list-style-type: none;">
-                            {% if day.get('bedtime_start') %}
-                            <li style="margin-bottom: 5px;"><strong>Bedtime:</strong> {{ day.get('bedtime_start').split('T')[1][:5] }}</li>
-                            {% endif %}
-                            
-                            {% if day.get('bedtime_end') %}
-                            <li style="margin-bottom: 5px;"><strong>Wake-up:</strong> {{ day.get('bedtime_end').split('T')[1][:5] }}</li>
-                            {% endif %}
-                            
-                            {% if day.get('bedtime_start') and day.get('bedtime_end') %}
-                                {% set start = day.get('bedtime_start').split('T')[1][:5] %}
-                                {% set end = day.get('bedtime_end').split('T')[1][:5] %}
-                                <li style="margin-bottom: 5px;"><strong>Time in Bed:</strong> {{ ((day.get('total_sleep_duration', 0) + day.get('awake_duration', 0))) // 60 }} hours {{ ((day.get('total_sleep_duration', 0) + day.get('awake_duration', 0))) % 60 }} minutes</li>
-                            {% endif %}
-                            
-                            {% if day.get('midpoint_time') %}
-                            <li style="margin-bottom: 5px;"><strong>Midpoint of Sleep:</strong> {{ day.get('midpoint_time').split('T')[1][:5] }}</li>
-                            {% endif %}
-                            
-                            {% if day.get('onset_latency') %}
-                            <li style="margin-bottom: 5px;"><strong>Time to Fall Asleep:</strong> {{ day.get('onset_latency') // 60 }} min {{ day.get('onset_latency') % 60 }} sec</li>
-                            {% endif %}
-                        </ul>
-                    </div>
-                    {% endif %}
-                    
-                    {% if day.get('tags') or day.get('contributors') %}
-                    <div style="margin-top: 15px; border-top: 1px solid #eee; padding-top: 10px;">
-                        <h4>Analysis</h4>
-                        <ul style="padding-left: 0; list-style-type: none;">
-                            {% if day.get('contributors', {}).get('deep_sleep') %}
-                            <li style="margin-bottom: 5px;"><strong>Deep Sleep Quality:</strong> {{ day.get('contributors', {}).get('deep_sleep') }}/100</li>
-                            {% endif %}
-                            
-                            {% if day.get('contributors', {}).get('rem_sleep') %}
-                            <li style="margin-bottom: 5px;"><strong>REM Sleep Quality:</strong> {{ day.get('contributors', {}).get('rem_sleep') }}/100</li>
-                            {% endif %}
-                            
-                            {% if day.get('contributors', {}).get('efficiency') %}
-                            <li style="margin-bottom: 5px;"><strong>Sleep Efficiency:</strong> {{ day.get('contributors', {}).get('efficiency') }}/100</li>
-                            {% endif %}
-                            
-                            {% if day.get('contributors', {}).get('latency') %}
-                            <li style="margin-bottom: 5px;"><strong>Sleep Onset:</strong> {{ day.get('contributors', {}).get('latency') }}/100</li>
-                            {% endif %}
-                            
-                            {% if day.get('contributors', {}).get('timing') %}
-                            <li style="margin-bottom: 5px;"><strong>Sleep Timing:</strong> {{ day.get('contributors', {}).get('timing') }}/100</li>
-                            {% endif %}
-                            
-                            {% if day.get('sleep_algorithm_version') %}
-                            <li style="margin-bottom: 5px;"><strong>Algorithm Version:</strong> {{ day.get('sleep_algorithm_version') }}</li>
-                            {% endif %}
-                        </ul>
-                    </div>
-                    {% endif %}
-                </div>
-                {% endfor %}
-            </div>
-        </div>
-    </div>
-    
-    <div id="readiness-tab" class="tab-content">
-        <div class="card">
-            <h2>Your Readiness Scores (Last 7 Days)</h2>
-            <div class="data-grid">
-                {% for day in readiness_data.get('data', []) %}
-                <div class="card">
-                    <h3>{{ day.get('day', 'Unknown Date') }}</h3>
-                    <div class="score readiness-score">{{ day.get('score', 'N/A') }}</div>
-                    <div class="progress-bar">
-                        <div class="progress readiness-progress" data-width="{{ day.get('score', 0) or 0 }}" style="width: 0%"></div>
-                    </div>
-                    
-                    {% if day.get('contributors') %}
-                    <div style="margin-top: 15px; border-top: 1px solid #eee; padding-top: 10px;">
-                        <h4>Contributors</h4>
-                        <ul style="padding-left: 0; list-style-type: none;">
-                            {% if day.get('contributors', {}).get('sleep_balance') %}
-                            <li style="margin-bottom: 5px;">Sleep Balance: {{ day.get('contributors', {}).get('sleep_balance') }}</li>
-                            {% endif %}
-                            
-                            {% if day.get('contributors', {}).get('hrv_balance') %}
-                            <li style="margin-bottom: 5px;">HRV Balance: {{ day.get('contributors', {}).get('hrv_balance') }}</li>
-                            {% endif %}
-                            
-                            {% if day.get('contributors', {}).get('activity_balance') %}
-                            <li style="margin-bottom: 5px;">Activity Balance: {{ day.get('contributors', {}).get('activity_balance') }}</li>
-                            {% endif %}
-                            
-                            {% if day.get('contributors', {}).get('recovery_index') %}
-                            <li style="margin-bottom: 5px;">Recovery Index: {{ day.get('contributors', {}).get('recovery_index') }}</li>
-                            {% endif %}
-                            
-                            {% if day.get('contributors', {}).get('body_temperature') %}
-                            <li style="margin-bottom: 5px;">Body Temperature: {{ day.get('contributors', {}).get('body_temperature') }}</li>
-                            {% endif %}
-                            
-                            {% if day.get('contributors', {}).get('resting_heart_rate') %}
-                            <li style="margin-bottom: 5px;">Resting Heart Rate: {{ day.get('contributors', {}).get('resting_heart_rate') }}</li>
-                            {% endif %}
-                            
-                            {% if day.get('contributors', {}).get('previous_day_activity') %}
-                            <li style="margin-bottom: 5px;">Previous Day Activity: {{ day.get('contributors', {}).get('previous_day_activity') }}</li>
-                            {% endif %}
-                            
-                            {% if day.get('contributors', {}).get('previous_night') %}
-                            <li style="margin-bottom: 5px;">Previous Night: {{ day.get('contributors', {}).get('previous_night') }}</li>
-                            {% endif %}
-                        </ul>
-                    </div>
-                    {% endif %}
-                </div>
-                {% endfor %}
-            </div>
-        </div>
-    </div>
-    
-    <div id="activity-tab" class="tab-content">
-        <div class="card">
-            <h2>Your Activity Scores (Last 7 Days)</h2>
-            <div class="data-grid">
-                {% for day in activity_data.get('data', []) %}
-                <div class="card">
-                    <h3>{{ day.get('day', 'Unknown Date') }}</h3>
-                    <div class="score activity-score">{{ day.get('score', 'N/A') }}</div>
-                    <div class="progress-bar">
-                        <div class="progress activity-progress" data-width="{{ day.get('score', 0) or 0 }}" style="width: 0%"></div>
-                    </div>
-                    <p>Steps: {{ day.get('steps', 'N/A') }}</p>
-                </div>
-                {% endfor %}
-            </div>
-        </div>
-    </div>
-    
-    <div id="leaderboard-tab" class="tab-content">
-        <div class="card">
-            <h2>Global Leaderboard</h2>
-            <p>See how your sleep compares with others!</p>
-            <table class="leaderboard-table">
-                <thead>
-                    <tr>
-                        <th>Rank</th>
-                        <th>User</th>
-                        <th>Average Sleep Score (7 days)</th>
-                        <th>Latest Sleep Score</th>
-                    </tr>
-                </thead>
-                <tbody>
-                    {% for user in leaderboard %}
-                    <tr {% if user.id == profile.id %}class="current-user"{% endif %}>
-                        <td>{{ loop.index }}</td>
-                        <td>{{ user.display_name }}</td>
-                        <td>{{ "%.1f"|format(user.avg_sleep_score or 0) }}</td>
-                        <td>{{ user.last_sleep_score or 'N/A' }}</td>
-                    </tr>
-                    {% endfor %}
-                </tbody>
-            </table>
-        </div>
-    </div>
-</body>
-</html>
-        ''', profile=profile, sleep_data=sleep_data, readiness_data=readiness_data, activity_data=activity_data, leaderboard=leaderboard)
+        if DASHBOARD_STREAMING:
+            response = stream_page(app, 'dashboard.html', profile=profile, sleep_data=sleep_data, standing=standing)
+        else:
+            response = make_response(render_template(
+                'dashboard.html', flush='', profile=profile, sleep_data=sleep_data, standing=standing
+            ))
+        return set_validators(response, etag, last_modified)
 
     except Exception as e:
         print(f"Unhandled Error in dashboard route: {str(e)}")
@@ -982,6 +905,178 @@ def dashboard():
         flash(f"An unexpected error occurred in the dashboard: {str(e)}", "error")
         return redirect(url_for('index'))
 
+def compact_document(collection, document):
+    """Keep only the fields the dashboard shows for a daily document."""
+    return {key: document[key] for key in DAILY_API_FIELDS[collection] if document.get(key) is not None}
+
+@app.route('/api/v1/<any(sleep, readiness, activity):kind>')
+@login_required
+def api_daily(kind):
+    """Recent daily summaries for one collection, syncing just that collection first."""
+    collection = f"daily_{kind}"
+    try:
+        days = int(request.args.get('days', 7))
+        if not 1 <= days <= DAILY_API_MAX_DAYS:
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': f'days must be between 1 and {DAILY_API_MAX_DAYS}'}), 400
+
+    try:
+        tokens = decrypt_token(current_user.oura_tokens)
+        if not tokens or not tokens.get('access_token'):
+            return jsonify({'error': 'Oura authorization missing. Please log in again.'}), 401
+
+        tokens, fetches = sync_user_data(current_user.id, tokens, collections=[collection])
+    except Exception as e:
+        # Token and profile reads and writes go through Supabase
+        print(f"Error syncing {collection}: {str(e)}")
+        return jsonify({'error': f'Error fetching {kind} data.'}), 502
+    if not tokens:
+        return jsonify({'error': 'Your Oura authorization has expired. Please log in again.'}), 401
+
+    # Stale data is still served when the sync fails; the error tells the page why
+    sync_error = None
+    if collection in fetches:
+        fetch = fetches[collection]
+        if fetch.error is not None:
+            print(f"api_daily: {collection} sync failed: {str(fetch.error)}")
+            sync_error = 'Oura is busy right now.' if isinstance(fetch.error, RateLimitExceeded) else 'Could not reach Oura.'
+        elif fetch.response.status_code != 200:
+            print(f"api_daily: {collection} sync failed with status {fetch.response.status_code}")
+            sync_error = f"Oura returned an error ({fetch.response.status_code})."
+
+    start_date, end_date = daily_window(days)
+    documents = daily_store.documents(current_user.id, collection, start_date, end_date)
+    return jsonify({
+        'collection': collection,
+        'start_date': start_date,
+        'end_date': end_date,
+        'data': [compact_document(collection, document) for document in documents],
+        'sync_error': sync_error
+    })
+
+@app.route('/api/v1/leaderboard')
+@login_required
+def api_leaderboard():
+    """Paged leaderboard: top-N, cursor pagination, or a window around the current user.
+
+    `scope=friends` ranks just the user and their friends instead of everyone.
+    """
+    scope = request.args.get('scope', 'global')
+    if scope not in LEADERBOARD_SCOPES:
+        return jsonify({'error': f"scope must be one of: {', '.join(LEADERBOARD_SCOPES)}"}), 400
+    try:
+        limit = int(request.args.get('limit', LEADERBOARD_PAGE_SIZE))
+        if limit < 1:
+            raise ValueError
+        limit = min(limit, LEADERBOARD_MAX_LIMIT)
+    except ValueError:
+        return jsonify({'error': 'limit must be a positive integer'}), 400
+
+    try:
+        friend_rows = get_friends_leaderboard(current_user.id) if scope == 'friends' else None
+    except Exception as e:
+        print(f"Error fetching friends leaderboard: {str(e)}")
+        return jsonify({'error': 'Error fetching leaderboard data.'}), 502
+
+    my_rank = None
+    try:
+        if request.args.get('around') == 'me':
+            # Centre a window of `limit` rows on the current user's rank
+            # Tied users share a rank, so centre on the user's row position instead
+            if friend_rows is None:
+                try:
+                    my_rank, position = get_leaderboard_position(current_user.id)
+                except Exception as e:
+                    print(f"Error fetching leaderboard rank: {str(e)}")
+                    return jsonify({'error': 'Error fetching leaderboard data.'}), 502
+            else:
+                index = next((i for i, row in enumerate(friend_rows) if row['user_id'] == current_user.id), None)
+                my_rank = None if index is None else friend_rows[index]['rank']
+                position = None if index is None else index + 1
+            offset = max(0, (position or 1) - 1 - limit // 2)
+        elif request.args.get('cursor'):
+            offset = decode_cursor(request.args['cursor'])
+        else:
+            offset = 0
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if friend_rows is not None:
+        entries = friend_rows[offset:offset + limit]
+        has_more = offset + limit < len(friend_rows)
+    else:
+        try:
+            entries = get_leaderboard_page(offset, limit)
+        except Exception as e:
+            print(f"Error fetching leaderboard page: {str(e)}")
+            return jsonify({'error': 'Error fetching leaderboard data.'}), 502
+        has_more = len(entries) == limit
+
+    return jsonify({
+        'scope': scope,
+        'entries': entries,
+        'offset': offset,
+        'limit': limit,
+        'my_rank': my_rank,
+        'next_cursor': encode_cursor(offset + limit) if has_more else None,
+        'prev_cursor': encode_cursor(max(0, offset - limit)) if offset > 0 else None
+    })
+
+@app.route('/api/v1/rank')
+@login_required
+def api_rank():
+    """The current user's leaderboard rank, percentile and the score histogram."""
+    standing = get_leaderboard_standing(current_user.id)
+    if standing is None:
+        return jsonify({'error': 'Error fetching leaderboard data.'}), 502
+    return jsonify(standing)
+
+def add_friends_by_email(user_id, emails):
+    """Befriend every registered user among `emails` in three round-trips.
+
+    One `in_` query resolves the emails, one finds the friendships that
+    already exist, and one batched upsert writes the rest; the
+    UNIQUE(user_id, friend_id) constraint makes a concurrent duplicate a no-op.
+    Returns the emails grouped into 'added', 'existing' and 'not_found'.
+    """
+    emails = list(dict.fromkeys(email.strip() for email in emails if email and email.strip()))
+    result = {'added': [], 'existing': [], 'not_found': []}
+    if not emails:
+        return result
+
+    found = select_profiles('lookup').in_('email', emails).execute().data or []
+    ids_by_email = {row['email']: row['id'] for row in found}
+    result['not_found'] = [email for email in emails if email not in ids_by_email]
+    # Users are always on their own friends leaderboard
+    result['existing'] = [email for email, friend_id in ids_by_email.items() if friend_id == user_id]
+    ids_by_email = {email: friend_id for email, friend_id in ids_by_email.items() if friend_id != user_id}
+    if not ids_by_email:
+        return result
+
+    existing = supabase.table('friendships').select('friend_id')\
+        .eq('user_id', user_id)\
+        .in_('friend_id', list(set(ids_by_email.values())))\
+        .execute()
+    existing_ids = {row['friend_id'] for row in existing.data or []}
+
+    new_ids = []
+    for email, friend_id in ids_by_email.items():
+        if friend_id in existing_ids or friend_id in new_ids:
+            result['existing'].append(email)
+        else:
+            new_ids.append(friend_id)
+            result['added'].append(email)
+
+    if new_ids:
+        supabase.table('friendships').upsert(
+            [{'user_id': user_id, 'friend_id': friend_id} for friend_id in new_ids],
+            on_conflict='user_id,friend_id',
+            ignore_duplicates=True
+        ).execute()
+        invalidate_friends(user_id)
+    return result
+
 @app.route('/add_friend', methods=['POST'])
 @login_required
 def add_friend():
@@ -992,36 +1087,57 @@ def add_friend():
         return redirect(url_for('dashboard'))
     
     try:
-        # Find friend by email
-        friend = supabase.table('profiles').select('*').eq('email', friend_email).execute()
-        if not friend.data:
+        result = add_friends_by_email(current_user.id, [friend_email])
+        if result['not_found']:
             flash(f'No user found with email {friend_email}')
-            return redirect(url_for('dashboard'))
-        
-        friend_id = friend.data[0]['id']
-        
-        # Check if friendship already exists
-        existing = supabase.table('friendships').select('*')\
-            .eq('user_id', current_user.id)\
-            .eq('friend_id', friend_id)\
-            .execute()
-        
-        if existing.data:
+        elif result['existing']:
             flash(f'You are already friends with {friend_email}')
-            return redirect(url_for('dashboard'))
-        
-        # Create friendship
-        supabase.table('friendships').insert({
-            'user_id': current_user.id,
-            'friend_id': friend_id
-        }).execute()
-        
-        flash(f'Friend {friend_email} added successfully')
+        else:
+            flash(f'Friend {friend_email} added successfully')
     except Exception as e:
         flash(f'Error adding friend: {str(e)}')
     
     return redirect(url_for('dashboard'))
 
+@app.route('/add_friends', methods=['POST'])
+@login_required
+def add_friends():
+    """Add many friends at once, from a JSON `emails` list or a `friend_emails` form field."""
+    if request.is_json:
+        emails = (request.get_json(silent=True) or {}).get('emails')
+        if not isinstance(emails, list) or not all(isinstance(email, str) for email in emails):
+            return jsonify({'error': 'emails must be a list of strings'}), 400
+    else:
+        emails = re.split(r'[\s,;]+', request.form.get('friend_emails', ''))
+    emails = [email for email in emails if email.strip()]
+
+    if not emails:
+        error = 'At least one email is required'
+    elif len(emails) > FRIEND_IMPORT_MAX:
+        error = f'At most {FRIEND_IMPORT_MAX} emails can be added at once'
+    else:
+        error = None
+    if error:
+        if request.is_json:
+            return jsonify({'error': error}), 400
+        flash(error)
+        return redirect(url_for('dashboard'))
+
+    try:
+        result = add_friends_by_email(current_user.id, emails)
+    except Exception as e:
+        print(f"Error adding friends: {str(e)}")
+        if request.is_json:
+            return jsonify({'error': 'Error adding friends.'}), 502
+        flash(f'Error adding friends: {str(e)}')
+        return redirect(url_for('dashboard'))
+
+    if request.is_json:
+        return jsonify(result)
+    flash(f"Added {len(result['added'])} friends"
+          f" ({len(result['existing'])} already friends, {len(result['not_found'])} not found)")
+    return redirect(url_for('dashboard'))
+
 @app.route('/remove_friend', methods=['POST'])
 @login_required
 def remove_friend():
@@ -1037,6 +1153,7 @@ def remove_friend():
             .eq('user_id', current_user.id)\
             .eq('friend_id', friend_id)\
             .execute()
+        invalidate_friends(current_user.id)
         
         flash('Friend removed successfully')
     except Exception as e:
@@ -1044,6 +1161,34 @@ def remove_friend():
     
     return redirect(url_for('dashboard'))
 
+@app.route('/webhooks/oura', methods=['GET', 'POST'])
+def oura_webhook():
+    """Receive Oura webhook notifications.
+
+    GET is Oura's check of a new subscription's callback URL; it must echo the
+    challenge. POST is a signed notification that a daily document was created
+    or updated, acknowledged with 202 once its fetch is queued.
+    """
+    if request.method == 'GET':
+        token = request.args.get('verification_token', '')
+        if not OURA_WEBHOOK_VERIFICATION_TOKEN or not hmac.compare_digest(token, OURA_WEBHOOK_VERIFICATION_TOKEN):
+            return jsonify({'error': 'Invalid verification token'}), 403
+        return jsonify({'challenge': request.args.get('challenge', '')})
+
+    body = request.get_data()
+    if not verify_signature(OURA_CLIENT_SECRET, request.headers.get('x-oura-timestamp'), body,
+                            request.headers.get('x-oura-signature')):
+        return jsonify({'error': 'Invalid signature'}), 401
+    try:
+        oura_user_id, event_type, data_type, object_id = parse_event(json.loads(body))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if event_type not in OURA_WEBHOOK_EVENT_TYPES or data_type not in DAILY_COLLECTIONS:
+        return jsonify({'status': 'ignored'})
+    queued = enqueue_webhook_event(oura_user_id, data_type, object_id)
+    return jsonify({'status': 'queued' if queued else 'duplicate'}), 202
+
 @app.route('/logout')
 def logout():
     """Handle user logout."""
@@ -1056,11 +1201,8 @@ def logout():
 def debug_data():
     """Debug endpoint to check raw Oura API responses."""
     try:
-        # Get user's profile data
-        profile = current_user.profile_data
-        
         # Decrypt tokens
-        tokens = decrypt_token(profile['oura_tokens'])
+        tokens = decrypt_token(current_user.oura_tokens)
         if not tokens:
             return "Failed to decrypt tokens", 500
             
@@ -1069,7 +1211,9 @@ def debug_data():
             "access_token_exists": bool(tokens.get('access_token')),
             "refresh_token_exists": bool(tokens.get('refresh_token')),
             "token_type": tokens.get('token_type'),
-            "expires_in": tokens.get('expires_in')
+            "expires_in": tokens.get('expires_in'),
+            "expires_at": tokens.get('expires_at'),
+            "needs_refresh": token_manager.needs_refresh(tokens)
         }
         
         # Get dates for testing
@@ -1079,20 +1223,22 @@ def debug_data():
         # Test all endpoints
         endpoints = [
             # v1 endpoints
-            {'name': 'v1_sleep', 'url': 'https://api.ouraring.com/v1/sleep', 'params': {'start': start_date, 'end': end_date}},
+            {'name': 'v1_sleep', 'url': oura_client.url('/v1/sleep'), 'params': {'start': start_date, 'end': end_date}},
             
             # v2 endpoints
-            {'name': 'v2_daily_sleep', 'url': 'https://api.ouraring.com/v2/usercollection/daily_sleep', 'params': {'start_date': start_date, 'end_date': end_date}},
-            {'name': 'v2_daily_readiness', 'url': 'https://api.ouraring.com/v2/usercollection/daily_readiness', 'params': {'start_date': start_date, 'end_date': end_date}},
+            {'name': 'v2_daily_sleep', 'url': oura_client.collection_url('daily_sleep'), 'params': {'start_date': start_date, 'end_date': end_date}},
+            {'name': 'v2_daily_readiness', 'url': oura_client.collection_url('daily_readiness'), 'params': {'start_date': start_date, 'end_date': end_date}},
         ]
         
         results = {}
         for endpoint in endpoints:
             try:
-                response = requests.get(
+                # Debug calls are shed first when Oura capacity is short
+                response = oura_client.get(
                     endpoint['url'],
-                    headers={'Authorization': f"Bearer {tokens['access_token']}"},
-                    params=endpoint['params']
+                    access_token=tokens['access_token'],
+                    params=endpoint['params'],
+                    priority='low'
                 )
                 results[endpoint['name']] = {
                     'status_code': response.status_code,
@@ -1103,52 +1249,12 @@ def debug_data():
                     results[endpoint['name']]['response'] = data
                 else:
                     results[endpoint['name']]['response'] = response.text
+            except RateLimitExceeded as e:
+                results.setdefault(endpoint['name'], {})['error'] = f"Skipped: {str(e)}"
             except Exception as e:
-                results[endpoint['name']]['error'] = str(e)
+                results.setdefault(endpoint['name'], {})['error'] = str(e)
         
-        return render_template_string('''
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>Oura API Debug</title>
-            <style>
-                body { font-family: monospace; margin: 20px; }
-                .endpoint { margin-bottom: 30px; border: 1px solid #ddd; padding: 15px; border-radius: 5px; }
-                h2 { margin-top: 0; }
-                pre { background: #f5f5f5; padding: 10px; overflow-x: auto; max-height: 500px; }
-                .success { color: green; }
-                .error { color: red; }
-            </style>
-        </head>
-        <body>
-            <h1>Oura API Debug</h1>
-            
-            <div class="endpoint">
-                <h2>Token Status</h2>
-                <pre>{{ token_info | tojson(indent=2) }}</pre>
-            </div>
-            
-            {% for name, result in results.items() %}
-            <div class="endpoint">
-                <h2>{{ name }}</h2>
-                <p>URL: {{ result.url }}</p>
-                <p class="{{ 'success' if result.status_code == 200 else 'error' }}">
-                    Status: {{ result.status_code }}
-                </p>
-                {% if result.get('error') %}
-                <p class="error">Error: {{ result.error }}</p>
-                {% else %}
-                <pre>{{ result.response | tojson(indent=2) }}</pre>
-                {% endif %}
-            </div>
-            {% endfor %}
-            
-            <div style="margin-top: 30px;">
-                <a href="{{ url_for('dashboard') }}">Return to Dashboard</a>
-            </div>
-        </body>
-        </html>
-        ''', token_info=token_info, results=results)
+        return render_template('debug_data.html', token_info=token_info, results=results)
         
     except Exception as e:
         return f"An error occurred: {str(e)}", 500
@@ -1166,11 +1272,60 @@ def is_admin():
     print("--- Exiting is_admin() check ---")
     return admin_status
 
+def admin_search_term(value):
+    """Reduce a search box value to text that is safe inside a PostgREST or() ilike filter."""
+    # Commas, parentheses and quotes structure the filter; * and % are wildcards
+    return re.sub(r'[,()"\'\\*%]', ' ', value or '').strip()[:ADMIN_SEARCH_MAX_LENGTH]
+
+def get_admin_user_page(page, search=''):
+    """Return one page of admin_list profiles in name order, and the number of matches.
+
+    The count is Postgres's estimate once the table is large, so an exact
+    count doesn't scan every profile on each page view. Rows are read through
+    idx_profiles_display_name_id, and searches use the pg_trgm indexes on
+    display_name and email (see docs/SUPABASE_SETUP.sql).
+    """
+    offset = (page - 1) * ADMIN_PAGE_SIZE
+    query = select_profiles('admin_list', count='estimated')
+    if search:
+        pattern = f"*{search}*"
+        query = query.or_(f"display_name.ilike.{pattern},email.ilike.{pattern}")
+    response = query.order('display_name').order('id').range(offset, offset + ADMIN_PAGE_SIZE - 1).execute()
+    return response.data or [], response.count or 0
+
+def get_admin_user_index():
+    """Return every user's (id, display_name) in name order and each id's position in it.
+
+    Only the switcher projection is read, a page at a time, and the result is
+    cached for ADMIN_INDEX_TTL seconds, so new users and renames show up late.
+    """
+    index = admin_user_index.get('users')
+    if index is None:
+        users = []
+        offset = 0
+        while True:
+            rows = select_profiles('switcher').order('display_name').order('id')\
+                .range(offset, offset + SUPABASE_PAGE_SIZE - 1).execute().data or []
+            users.extend((row['id'], row.get('display_name')) for row in rows)
+            if len(rows) < SUPABASE_PAGE_SIZE:
+                break
+            offset += SUPABASE_PAGE_SIZE
+        index = (users, {user_id: position for position, (user_id, _) in enumerate(users)})
+        admin_user_index.set('users', index)
+    return index
+
+def admin_switcher_options(user_id):
+    """Users listed in the admin switcher: a window of the name index around `user_id`."""
+    users, positions = get_admin_user_index()
+    position = positions.get(user_id, 0)
+    start = max(0, min(position - ADMIN_SWITCHER_SIZE // 2, len(users) - ADMIN_SWITCHER_SIZE))
+    return [{'id': entry_id, 'display_name': name} for entry_id, name in users[start:start + ADMIN_SWITCHER_SIZE]]
+
 # Add an admin dashboard route
 @app.route('/admin')
 @login_required
 def admin_dashboard():
-    """Admin dashboard to view all users' data."""
+    """Admin dashboard listing users a page at a time, optionally filtered by name or email."""
     # Direct check
     is_user_admin = getattr(current_user, 'is_admin', False)
     if not is_user_admin:
@@ -1178,108 +1333,32 @@ def admin_dashboard():
         return redirect(url_for('dashboard'))
 
     try:
-        # Get all profiles
-        all_profiles = supabase.table('profiles').select('*').execute()
+        page = max(1, int(request.args.get('page', 1)))
+    except ValueError:
+        page = 1
+    search = admin_search_term(request.args.get('q'))
+
+    try:
+        # One page of profiles (without tokens) plus the estimated count, in a single query
+        profiles, total = get_admin_user_page(page, search)
         
-        if not all_profiles.data:
+        if not total and not profiles and not search:
             flash("No users found in the database.", "error")
             return redirect(url_for('dashboard'))
         
-        return render_template_string('''
-<!DOCTYPE html>
-<html>
-<head>
-    <title>Admin Dashboard</title>
-    <style>
-        body {
-            font-family: Arial, sans-serif;
-            margin: 0;
-            padding: 20px;
-            background-color: #f5f5f5;
-        }
-        .card {
-            background: white;
-            border-radius: 8px;
-            padding: 20px;
-            margin-bottom: 20px;
-            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-        }
-        .user-list {
-            display: grid;
-            grid-template-columns: repeat(auto-fill, minmax(300px, 1fr));
-            gap: 20px;
-        }
-        .user-card {
-            background: white;
-            border-radius: 8px;
-            padding: 15px;
-            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-            transition: transform 0.2s;
-        }
-        .user-card:hover {
-            transform: translateY(-5px);
-            box-shadow: 0 5px 15px rgba(0,0,0,0.1);
-        }
-        .button {
-            display: inline-block;
-            padding: 8px 16px;
-            background-color: #6200EA;
-            color: white;
-            text-decoration: none;
-            border-radius: 4px;
-            transition: background-color 0.2s;
-        }
-        .button:hover {
-            background-color: #5000D6;
-        }
-        .header {
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-        }
-        .header a {
-            color: #666;
-            text-decoration: none;
-            margin-left: 15px;
-        }
-        .header a:hover {
-            color: #333;
-        }
-        .score {
-            font-size: 24px;
-            font-weight: bold;
-            color: #4CAF50;
-        }
-    </style>
-</head>
-<body>
-    <div class="card">
-        <div class="header">
-            <h1>Admin Dashboard</h1>
-            <div>
-                <a href="{{ url_for('dashboard') }}">My Dashboard</a>
-                <a href="{{ url_for('logout') }}">Logout</a>
-            </div>
-        </div>
-        
-        <h2>All Users</h2>
-        <div class="user-list">
-            {% for profile in profiles %}
-            <div class="user-card">
-                <h3>{{ profile.display_name }}</h3>
-                <p>Email: {{ profile.email }}</p>
-                <p>Average Sleep Score: <span class="score">{{ "%.1f"|format(profile.avg_sleep_score or 0) }}</span></p>
-                <p>Last Sleep Score: {{ profile.last_sleep_score or 'N/A' }}</p>
-                <p>Last Login: {{ profile.updated_at[:10] if profile.updated_at else 'Never' }}</p>
-                
-                <a href="{{ url_for('view_user_data', user_id=profile.id) }}" class="button">View Data</a>
-            </div>
-            {% endfor %}
-        </div>
-    </div>
-</body>
-</html>
-        ''', profiles=all_profiles.data)
+        # The total is an estimate for large tables; if it falls short, keep offering the next page
+        seen = (page - 1) * ADMIN_PAGE_SIZE + len(profiles)
+        pages = max(page, -(-total // ADMIN_PAGE_SIZE))
+        if seen > total and len(profiles) == ADMIN_PAGE_SIZE:
+            pages = page + 1
+        return render_template(
+            'admin/dashboard.html',
+            profiles=profiles,
+            search=search,
+            page=page,
+            total=max(total, seen),
+            pages=pages
+        )
 
     except Exception as e:
         print(f"Error in admin dashboard logic: {str(e)}")
@@ -1308,7 +1387,7 @@ def view_user_data(user_id):
     try:
         # Check 2: Does the target user exist?
         print(f"view_user_data: Fetching profile for {user_id}")
-        user_profile = supabase.table('profiles').select('*').eq('id', user_id).execute()
+        user_profile = select_profiles('tokens').eq('id', user_id).execute()
         if not user_profile.data:
             print(f"view_user_data: Profile not found for {user_id}. Redirecting.")
             flash("User not found.", "error")
@@ -1317,8 +1396,8 @@ def view_user_data(user_id):
         profile = user_profile.data[0]
         print(f"view_user_data: Found profile for {profile.get('display_name')}")
         
-        # Get all profiles for the dropdown
-        all_profiles = supabase.table('profiles').select('*').execute()
+        # Nearby users for the dropdown, from the cached name index
+        all_profiles = admin_switcher_options(user_id)
 
         # Step 3: Decrypt Token
         print(f"view_user_data: Attempting to decrypt tokens for {profile.get('display_name')}")
@@ -1357,62 +1436,28 @@ def view_user_data(user_id):
         print("view_user_data: Successfully obtained access token")
 
         # Step 4: Fetch Oura Data
-        end_date = datetime.now()
-        start_date = (end_date - timedelta(days=7)).strftime('%Y-%m-%d')
-        end_date = end_date.strftime('%Y-%m-%d')
+        start_date, end_date = daily_window()
         
-        headers = {'Authorization': f"Bearer {access_token}"}
-        
-        # Fetch sleep data
-        try:
-            print("view_user_data: Fetching sleep data")
-            sleep_response = requests.get(
-                'https://api.ouraring.com/v2/usercollection/daily_sleep',
-                headers=headers,
-                params={'start_date': start_date, 'end_date': end_date},
-                timeout=10
-            )
-            if sleep_response.status_code == 200:
-                sleep_data = sleep_response.json()
-                print(f"view_user_data: Sleep data fetched successfully")
-            else:
-                print(f"view_user_data: Sleep API request failed with status {sleep_response.status_code}")
-        except Exception as e:
-            print(f"view_user_data: Error fetching sleep data: {str(e)}")
-            
-        # Fetch readiness data
-        try:
-            print("view_user_data: Fetching readiness data")
-            readiness_response = requests.get(
-                'https://api.ouraring.com/v2/usercollection/daily_readiness',
-                headers=headers,
-                params={'start_date': start_date, 'end_date': end_date},
-                timeout=10
-            )
-            if readiness_response.status_code == 200:
-                readiness_data = readiness_response.json()
-                print(f"view_user_data: Readiness data fetched successfully")
-            else:
-                print(f"view_user_data: Readiness API request failed with status {readiness_response.status_code}")
-        except Exception as e:
-            print(f"view_user_data: Error fetching readiness data: {str(e)}")
-            
-        # Fetch activity data
-        try:
-            print("view_user_data: Fetching activity data")
-            activity_response = requests.get(
-                'https://api.ouraring.com/v2/usercollection/daily_activity',
-                headers=headers,
-                params={'start_date': start_date, 'end_date': end_date},
-                timeout=10
-            )
-            if activity_response.status_code == 200:
-                activity_data = activity_response.json()
-                print(f"view_user_data: Activity data fetched successfully")
-            else:
-                print(f"view_user_data: Activity API request failed with status {activity_response.status_code}")
-        except Exception as e:
-            print(f"view_user_data: Error fetching activity data: {str(e)}")
+        print("view_user_data: Syncing sleep, readiness and activity data")
+        # Admin browsing yields Oura capacity to users' own dashboards
+        tokens, fetches = sync_user_data(user_id, tokens, priority='background')
+        if not tokens:
+            print("view_user_data: Tokens expired and could not be refreshed")
+            flash("User's Oura authorization has expired; showing stored data only.", "error")
+
+        for collection, fetch in fetches.items():
+            try:
+                response = fetch.result()
+                if response.status_code == 200:
+                    print(f"view_user_data: {collection} data fetched successfully")
+                else:
+                    print(f"view_user_data: {collection} API request failed with status {response.status_code}")
+            except Exception as e:
+                print(f"view_user_data: Error fetching {collection} data: {str(e)}")
+
+        sleep_data = {"data": daily_store.documents(user_id, 'daily_sleep', start_date, end_date)}
+        readiness_data = {"data": daily_store.documents(user_id, 'daily_readiness', start_date, end_date)}
+        activity_data = {"data": daily_store.documents(user_id, 'daily_activity', start_date, end_date)}
 
     except Exception as e:
         print(f"view_user_data: Unexpected error: {str(e)}")
@@ -1424,12 +1469,112 @@ def view_user_data(user_id):
     # Step 5: Render template with all collected data
     return render_template('admin/user_data.html',
         user=profile,
-        all_profiles=all_profiles.data,
+        all_profiles=all_profiles,
         sleep_data=sleep_data,
         readiness_data=readiness_data,
         activity_data=activity_data
     )
 
+def sync_compared_user(profile):
+    """Sync one compared user's stored data; returns an error message or None."""
+    tokens = decrypt_token(profile.get('oura_tokens'))
+    if not tokens or not tokens.get('access_token'):
+        return "Oura tokens are missing or unreadable."
+    # Admin browsing yields Oura capacity to users' own dashboards
+    tokens, fetches = sync_user_data(profile['id'], tokens, priority='background')
+    if not tokens:
+        return "Oura authorization has expired."
+    failed = [collection for collection, fetch in fetches.items()
+              if fetch.error is not None or fetch.response.status_code != 200]
+    return f"Could not sync {', '.join(failed)}." if failed else None
+
+@app.route('/admin/compare')
+@login_required
+def compare_users():
+    """Admin view lining up several users' daily scores side by side.
+
+    Tokens for the whole cohort come from one query, and the users are synced
+    concurrently on compare_pool (stores that are already fresh skip Oura
+    entirely), so the page takes about as long as the slowest user.
+    """
+    if not current_user.is_admin:
+        flash("You don't have permission to access other users' data.", "error")
+        return redirect(url_for('dashboard'))
+
+    user_ids = []
+    for value in request.args.getlist('user_id'):
+        user_ids.extend(user_id.strip() for user_id in value.split(',') if user_id.strip())
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        flash("Select at least one user to compare.", "error")
+        return redirect(url_for('admin_dashboard'))
+    if len(user_ids) > ADMIN_COMPARE_MAX_USERS:
+        flash(f"At most {ADMIN_COMPARE_MAX_USERS} users can be compared at once.", "error")
+        return redirect(url_for('admin_dashboard'))
+    try:
+        days = min(max(1, int(request.args.get('days', 7))), DAILY_API_MAX_DAYS)
+    except ValueError:
+        days = 7
+
+    try:
+        rows = select_profiles('tokens').in_('id', user_ids).execute().data or []
+    except Exception as e:
+        print(f"compare_users: Error loading profiles: {str(e)}")
+        flash("Error loading the selected users.", "error")
+        return redirect(url_for('admin_dashboard'))
+    by_id = {row['id']: row for row in rows}
+    profiles = [by_id[user_id] for user_id in user_ids if user_id in by_id]
+
+    futures = {profile['id']: compare_pool.submit(sync_compared_user, profile) for profile in profiles}
+    errors = {}
+    for user_id, future in futures.items():
+        try:
+            errors[user_id] = future.result()
+        except Exception as e:
+            print(f"compare_users: Error syncing {user_id}: {str(e)}")
+            errors[user_id] = "Sync failed; showing stored data."
+
+    start_date, end_date = daily_window(days)
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    dates = [(end - timedelta(days=offset)).strftime('%Y-%m-%d') for offset in range(days + 1)]
+    scores = {
+        collection: {
+            profile['id']: {
+                document['day']: document.get('score')
+                for document in daily_store.documents(profile['id'], collection, start_date, end_date)
+            }
+            for profile in profiles
+        }
+        for collection in DAILY_COLLECTIONS
+    }
+
+    return render_template('admin/compare.html',
+        users=[{'id': profile['id'], 'display_name': profile.get('display_name'), 'error': errors.get(profile['id'])}
+               for profile in profiles],
+        missing=[user_id for user_id in user_ids if user_id not in by_id],
+        dates=dates,
+        days=days,
+        scores=scores
+    )
+
+@app.route('/admin/export/<any(daily_sleep, daily_readiness, daily_activity):collection>')
+@login_required
+def export_collection(collection):
+    """Stream every user's stored documents for a collection as Parquet or CSV."""
+    if not current_user.is_admin:
+        flash("You don't have permission to export data.", "error")
+        return redirect(url_for('dashboard'))
+
+    fmt = request.args.get('format', available_formats()[0])
+    if fmt not in available_formats():
+        return jsonify({'error': f"format must be one of: {', '.join(available_formats())}"}), 400
+
+    print(f"export_collection: {current_user.id} exporting {collection} as {fmt}")
+    response = Response(stream_with_context(iter_export(daily_store, collection, fmt)),
+                        mimetype=EXPORT_MIMETYPES[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{collection}.{fmt}"'
+    return response
+
 @app.route('/debug_admin')
 def debug_admin():
     """Debug route to check admin status."""
@@ -1440,7 +1585,7 @@ def debug_admin():
     admin_status = current_user.is_admin if hasattr(current_user, 'is_admin') else False
     
     # Get current user's profile from Supabase
-    response = supabase.table('profiles').select('*').eq('id', current_user.id).execute()
+    response = select_profiles('admin_check').eq('id', current_user.id).execute()
     db_is_admin = False
     if response.data:
         db_is_admin = response.data[0].get('is_admin', False)
@@ -1467,6 +1612,7 @@ def make_admin(user_id):
     try:
         # Update the user's profile in Supabase
         supabase.table('profiles').update({'is_admin': True}).eq('id', user_id).execute()
+        invalidate_profile(user_id)
         flash("User has been granted admin privileges.", "success")
     except Exception as e:
         flash(f"Error making user admin: {str(e)}", "error")
@@ -0,0 +1,49 @@
+"""
+ASGI adapter for serving the Flask app from uvicorn workers.
+
+asgiref's WsgiToAsgi runs every request on a single shared thread, so a
+process would serve one request at a time. ThreadedWsgiToAsgi runs each
+request on a pool of ASGI_THREADS threads instead. The event loop accepts
+and parks connections, and the blocking Oura and Supabase calls of the
+views only hold a pool thread while they wait. One process can then keep
+hundreds of dashboard requests in flight. Needs the optional `asgiref`
+package, and `uvicorn-worker` to run under gunicorn.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import SyncToAsync
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+ASGI_THREADS = int(os.getenv('ASGI_THREADS', '200'))
+
+
+class ThreadedWsgiToAsgi(WsgiToAsgi):
+    """WsgiToAsgi that runs requests concurrently on a bounded thread pool."""
+
+    def __init__(self, wsgi_application, threads=ASGI_THREADS, duplicate_header_limit=100):
+        super().__init__(wsgi_application, duplicate_header_limit)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='asgi-request')
+        # Per-adapter subclass so run_wsgi_app uses this adapter's pool
+        self._instance_class = type('ThreadedWsgiToAsgiInstance', (WsgiToAsgiInstance,), {
+            'run_wsgi_app': SyncToAsync(
+                WsgiToAsgiInstance.__dict__['run_wsgi_app'].func, thread_sensitive=False, executor=self.executor
+            ),
+        })
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        await self._instance_class(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        """Acknowledge server startup and shutdown (which uvicorn sends once requests have drained)."""
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
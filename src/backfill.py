@@ -0,0 +1,241 @@
+"""
+Historical backfill of a user's Oura daily summaries.
+
+The dashboard and sync worker only keep the most recent days in the local
+DailyStore. A backfill job walks backwards from just before that window in
+BACKFILL_CHUNK_DAYS chunks, fetching every daily collection for a chunk in one
+fan-out and loading it into the store. After each chunk the job's cursor is
+checkpointed in SQLite, so a restarted process resumes where the last one
+stopped. Jobs are claimed with a lease and only BACKFILL_CONCURRENCY may run at
+once across every process on the host. A run stops after
+BACKFILL_CHUNKS_PER_RUN chunks and puts the job back, so long histories are
+loaded over several runs and never hold a thread for hours. Calls go through the shared rate
+limiter at background priority, and a shed call puts the job back until the
+limiter's retry_after has passed.
+"""
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from src.rate_limiter import RateLimitExceeded
+
+BACKFILL_CHUNK_DAYS = int(os.getenv('BACKFILL_CHUNK_DAYS', '30'))
+BACKFILL_MAX_DAYS = int(os.getenv('BACKFILL_MAX_DAYS', '1095'))
+BACKFILL_CONCURRENCY = int(os.getenv('BACKFILL_CONCURRENCY', '2'))
+BACKFILL_CHUNKS_PER_RUN = int(os.getenv('BACKFILL_CHUNKS_PER_RUN', '6'))
+# A job stops early once this many chunks in a row came back empty (no older history)
+BACKFILL_EMPTY_CHUNKS = 2
+# Failed chunks are retried after BACKFILL_RETRY_DELAY seconds, at most BACKFILL_MAX_ATTEMPTS times in a row
+BACKFILL_RETRY_DELAY = 300
+BACKFILL_MAX_ATTEMPTS = 5
+# A claimed job whose process stops renewing it becomes claimable again after this many seconds
+BACKFILL_LEASE = 300
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS backfill_jobs (
+    user_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    next_end TEXT NOT NULL,
+    oldest_day TEXT NOT NULL,
+    empty_chunks INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    documents INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    leased_until REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at REAL NOT NULL
+);
+'''
+
+JOB_COLUMNS = ('user_id', 'status', 'next_end', 'oldest_day', 'empty_chunks', 'attempts', 'documents',
+               'not_before', 'leased_until', 'error', 'updated_at')
+
+
+class BackfillJobs:
+    """Backfill jobs and their checkpoints, shared across processes through SQLite.
+
+    A job is 'pending' (waiting to run or resume), 'running' (claimed, with a
+    lease), 'done' or 'failed'.
+    """
+
+    def __init__(self, path, concurrency=BACKFILL_CONCURRENCY, lease=BACKFILL_LEASE):
+        self.path = path
+        self.concurrency = concurrency
+        self.lease = lease
+        self._lock = threading.RLock()
+        self._conn = None
+        self._pid = None
+
+    def _connection(self):
+        # One connection per process: gunicorn workers fork after the app is imported
+        if self._conn is None or self._pid != os.getpid():
+            if self.path != ':memory:':
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            if self.path != ':memory:':
+                conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._connection().execute(sql, params)
+
+    def enqueue(self, user_id, end_day, oldest_day):
+        """Add a job for a user unless they already have one; returns True if it was added."""
+        cursor = self._execute(
+            '''INSERT INTO backfill_jobs (user_id, status, next_end, oldest_day, updated_at)
+               VALUES (?, 'pending', ?, ?, ?) ON CONFLICT (user_id) DO NOTHING''',
+            (user_id, end_day, oldest_day, time.time())
+        )
+        return cursor.rowcount == 1
+
+    def get(self, user_id):
+        """Return a user's job as a dict, or None."""
+        row = self._execute(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM backfill_jobs WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return dict(zip(JOB_COLUMNS, row)) if row else None
+
+    def runnable(self, now=None):
+        """User ids of unfinished jobs that are due and not held by a live lease."""
+        now = time.time() if now is None else now
+        rows = self._execute(
+            '''SELECT user_id FROM backfill_jobs
+               WHERE status IN ('pending', 'running') AND not_before <= ? AND leased_until <= ?
+               ORDER BY updated_at''',
+            (now, now)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def claim(self, user_id, now=None):
+        """Lease a user's job for this process, or return None if it isn't runnable now.
+
+        Fails when the job is finished, not yet due, leased elsewhere, or when
+        `concurrency` jobs already hold live leases.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            conn = self._connection()
+            # BEGIN IMMEDIATE makes the concurrency check and the claim atomic across processes
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                running = conn.execute(
+                    'SELECT COUNT(*) FROM backfill_jobs WHERE leased_until > ?', (now,)
+                ).fetchone()[0]
+                claimed = running < self.concurrency and conn.execute(
+                    '''UPDATE backfill_jobs SET status = 'running', leased_until = ?, updated_at = ?
+                       WHERE user_id = ? AND status IN ('pending', 'running')
+                         AND not_before <= ? AND leased_until <= ?''',
+                    (now + self.lease, now, user_id, now, now)
+                ).rowcount == 1
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return self.get(user_id) if claimed else None
+
+    def checkpoint(self, user_id, next_end, empty_chunks, documents):
+        """Record a completed chunk and renew the lease."""
+        now = time.time()
+        self._execute(
+            '''UPDATE backfill_jobs SET next_end = ?, empty_chunks = ?, documents = documents + ?,
+                   attempts = 0, error = NULL, leased_until = ?, updated_at = ?
+               WHERE user_id = ?''',
+            (next_end, empty_chunks, documents, now + self.lease, now, user_id)
+        )
+
+    def release(self, user_id, delay=0.0, error=None, failed=False):
+        """Give a job back to the queue (after `delay` seconds), or mark it failed."""
+        now = time.time()
+        self._execute(
+            '''UPDATE backfill_jobs SET status = ?, not_before = ?, leased_until = 0, error = ?,
+                   attempts = attempts + ?, updated_at = ?
+               WHERE user_id = ?''',
+            ('failed' if failed else 'pending', now + delay, error, 1 if error else 0, now, user_id)
+        )
+
+    def finish(self, user_id):
+        """Mark a job done."""
+        self._execute(
+            "UPDATE backfill_jobs SET status = 'done', leased_until = 0, error = NULL, updated_at = ? WHERE user_id = ?",
+            (time.time(), user_id)
+        )
+
+
+def _day(value):
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
+def backfill_range(before_day, max_days=BACKFILL_MAX_DAYS):
+    """Return (end_day, oldest_day) for a backfill of the `max_days` before `before_day`."""
+    end = _day(before_day) - timedelta(days=1)
+    return end.strftime('%Y-%m-%d'), (end - timedelta(days=max_days - 1)).strftime('%Y-%m-%d')
+
+
+def run_backfill(jobs, client, store, job, access_token, collections, chunk_days=BACKFILL_CHUNK_DAYS,
+                 max_attempts=BACKFILL_MAX_ATTEMPTS, retry_delay=BACKFILL_RETRY_DELAY,
+                 max_chunks=BACKFILL_CHUNKS_PER_RUN):
+    """Work through a claimed job chunk by chunk; returns its status.
+
+    Returns 'done' when the history is loaded, 'pending' when the job was put
+    back (after `max_chunks` chunks, rate limited, or a failed chunk that will
+    be retried) and 'failed' after `max_attempts` failed chunks in a row.
+    """
+    user_id = job['user_id']
+    next_end, oldest_day, empty_chunks = job['next_end'], job['oldest_day'], job['empty_chunks']
+    attempts = job['attempts']
+    chunks = 0
+
+    while next_end >= oldest_day and empty_chunks < BACKFILL_EMPTY_CHUNKS:
+        if max_chunks and chunks >= max_chunks:
+            # Let the next run (and other users' jobs) continue from the checkpoint
+            jobs.release(user_id)
+            return 'pending'
+        chunks += 1
+        start_day = max(oldest_day, (_day(next_end) - timedelta(days=chunk_days - 1)).strftime('%Y-%m-%d'))
+        calls = {collection: {'start_date': start_day, 'end_date': next_end} for collection in collections}
+        fetches = client.fetch_many(access_token, calls, priority='background')
+
+        shed = [fetch.error for fetch in fetches.values() if isinstance(fetch.error, RateLimitExceeded)]
+        if shed:
+            retry_after = max(error.retry_after or 0 for error in shed)
+            print(f"backfill: {user_id} deferred {retry_after:.0f}s by the rate limiter at {next_end}")
+            jobs.release(user_id, delay=retry_after)
+            return 'pending'
+
+        failed = [
+            collection for collection, fetch in fetches.items()
+            if fetch.error is not None or fetch.response.status_code != 200
+        ]
+        documents = {}
+        for collection, fetch in fetches.items():
+            if collection in failed:
+                continue
+            try:
+                documents[collection] = fetch.response.json().get('data', [])
+            except ValueError:
+                failed.append(collection)
+        if failed:
+            attempts += 1
+            error = f"{', '.join(failed)} failed for {start_day}..{next_end}"
+            print(f"backfill: {user_id} {error} (attempt {attempts})")
+            jobs.release(user_id, delay=retry_delay * attempts, error=error, failed=attempts >= max_attempts)
+            return 'failed' if attempts >= max_attempts else 'pending'
+
+        loaded = 0
+        for collection, collection_documents in documents.items():
+            store.upsert_documents(user_id, collection, collection_documents)
+            loaded += len(collection_documents)
+        print(f"backfill: {user_id} loaded {loaded} documents for {start_day}..{next_end}")
+        empty_chunks = 0 if loaded else empty_chunks + 1
+        attempts = 0
+        next_end = (_day(start_day) - timedelta(days=1)).strftime('%Y-%m-%d')
+        jobs.checkpoint(user_id, next_end, empty_chunks, loaded)
+
+    jobs.finish(user_id)
+    return 'done'
@@ -0,0 +1,82 @@
+"""
+In-process caching helpers.
+
+TTLCache is a small thread-safe LRU cache whose entries expire after a fixed
+number of seconds. Each gunicorn worker keeps its own instances, so cached
+values must be safe to serve slightly stale.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache with per-entry expiry.
+
+    If `on_evict` is given it is called with every value that leaves the cache
+    through expiry, LRU eviction, replacement or clear(), e.g. to wipe secrets.
+    Values returned by pop() are handed back to the caller instead.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60, on_evict=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evicted(self, values):
+        # Run callbacks outside the lock so they can't deadlock against the cache
+        if self.on_evict is not None:
+            for value in values:
+                self.on_evict(value)
+
+    def get(self, key, default=None, copy=None):
+        """Return the cached value for key, or default if missing or expired.
+
+        With `copy`, copy(value) is returned instead, taken under the lock so
+        an `on_evict` callback in another thread can't change it mid-copy.
+        """
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            expires_at, value = item
+            if expires_at > time.monotonic():
+                self._data.move_to_end(key)
+                return value if copy is None else copy(value)
+            del self._data[key]
+        self._evicted([value])
+        return default
+
+    def set(self, key, value, ttl=None):
+        """Cache value under key, evicting the least recently used entry if full."""
+        ttl = self.ttl if ttl is None else ttl
+        evicted = []
+        with self._lock:
+            previous = self._data.pop(key, _MISSING)
+            if previous is not _MISSING and previous[1] is not value:
+                evicted.append(previous[1])
+            self._data[key] = (time.monotonic() + ttl, value)
+            while len(self._data) > self.maxsize:
+                evicted.append(self._data.popitem(last=False)[1][1])
+        self._evicted(evicted)
+
+    def pop(self, key, default=None):
+        """Remove key and return its value (expired or not), or default."""
+        with self._lock:
+            item = self._data.pop(key, _MISSING)
+        return default if item is _MISSING else item[1]
+
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            evicted = [value for _, value in self._data.values()]
+            self._data.clear()
+        self._evicted(evicted)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
@@ -0,0 +1,232 @@
+"""
+Local persistent store of Oura daily summaries.
+
+Daily documents (daily_sleep, daily_readiness, daily_activity) are kept in
+SQLite keyed by (user, collection, day). Past days almost never change, so a
+sync only asks Oura for the days after the last synced day plus a short
+re-validation tail, and skips Oura entirely while the last sync is fresh.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Seconds a completed sync stays fresh, and days re-fetched behind the last synced day
+OURA_SYNC_INTERVAL = int(os.getenv('OURA_SYNC_INTERVAL', '900'))
+OURA_REVALIDATE_DAYS = int(os.getenv('OURA_REVALIDATE_DAYS', '2'))
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS daily_documents (
+    user_id TEXT NOT NULL,
+    collection TEXT NOT NULL,
+    day TEXT NOT NULL,
+    document TEXT NOT NULL,
+    PRIMARY KEY (user_id, collection, day)
+);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    user_id TEXT NOT NULL,
+    collection TEXT NOT NULL,
+    last_day TEXT,
+    synced_at REAL NOT NULL,
+    PRIMARY KEY (user_id, collection)
+);
+
+CREATE TABLE IF NOT EXISTS collection_versions (
+    user_id TEXT NOT NULL,
+    collection TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    changed_at REAL NOT NULL,
+    PRIMARY KEY (user_id, collection)
+);
+'''
+
+
+class DailyStore:
+    """SQLite-backed store of per-user daily Oura documents."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = None
+        self._pid = None
+
+    def _connection(self):
+        # One connection per process: gunicorn workers fork after the app is imported
+        if self._conn is None or self._pid != os.getpid():
+            if self.path != ':memory:':
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            if self.path != ':memory:':
+                # WAL lets the web workers read while another process writes
+                conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def upsert_documents(self, user_id, collection, documents):
+        """Insert or replace daily documents; returns how many were new or changed."""
+        rows = [
+            (user_id, collection, doc['day'], json.dumps(doc, sort_keys=True))
+            for doc in documents
+            if doc.get('day')
+        ]
+        if not rows:
+            return 0
+        with self._lock:
+            conn = self._connection()
+            before = conn.total_changes
+            with conn:
+                conn.executemany(
+                    '''INSERT INTO daily_documents (user_id, collection, day, document)
+                       VALUES (?, ?, ?, ?)
+                       ON CONFLICT (user_id, collection, day) DO UPDATE SET document = excluded.document
+                       WHERE daily_documents.document != excluded.document''',
+                    rows
+                )
+                changed = conn.total_changes - before
+                if changed:
+                    conn.execute(
+                        '''INSERT INTO collection_versions (user_id, collection, version, changed_at)
+                           VALUES (?, ?, 1, ?)
+                           ON CONFLICT (user_id, collection) DO UPDATE SET
+                               version = collection_versions.version + 1,
+                               changed_at = excluded.changed_at''',
+                        (user_id, collection, time.time())
+                    )
+            return changed
+
+    def documents(self, user_id, collection, start_day, end_day):
+        """Return the stored documents for a day range (inclusive), oldest first."""
+        with self._lock:
+            cursor = self._connection().execute(
+                '''SELECT document FROM daily_documents
+                   WHERE user_id = ? AND collection = ? AND day >= ? AND day <= ?
+                   ORDER BY day''',
+                (user_id, collection, start_day, end_day)
+            )
+            return [json.loads(row['document']) for row in cursor.fetchall()]
+
+    def version(self, user_id, collection):
+        """Return (version, changed_at) for a collection's stored documents, (0, None) if empty.
+
+        The version increases every time an upsert adds or changes a document,
+        so it can key HTTP validators and caches of anything derived from them.
+        """
+        with self._lock:
+            row = self._connection().execute(
+                'SELECT version, changed_at FROM collection_versions WHERE user_id = ? AND collection = ?',
+                (user_id, collection)
+            ).fetchone()
+        return (row['version'], row['changed_at']) if row else (0, None)
+
+    def iter_documents(self, collection, batch_size=1000):
+        """Yield every user's documents for a collection in batches of (user_id, document) pairs.
+
+        Rows are read with fetchmany on a dedicated connection, ordered by user
+        and day, so memory stays bounded by one batch and the web workers'
+        connection isn't held for the length of the scan.
+        """
+        if self.path == ':memory:':
+            # An in-memory database only exists on the shared connection
+            with self._lock:
+                rows = self._connection().execute(
+                    'SELECT user_id, document FROM daily_documents WHERE collection = ? ORDER BY user_id, day',
+                    (collection,)
+                ).fetchall()
+            for start in range(0, len(rows), batch_size):
+                yield [(row['user_id'], json.loads(row['document'])) for row in rows[start:start + batch_size]]
+            return
+
+        self._connection()  # creates the schema if the store is new
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            cursor = conn.execute(
+                'SELECT user_id, document FROM daily_documents WHERE collection = ? ORDER BY user_id, day',
+                (collection,)
+            )
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield [(user_id, json.loads(document)) for user_id, document in rows]
+        finally:
+            conn.close()
+
+    def sync_state(self, user_id, collection):
+        """Return (last_day, synced_at) for a collection, or None if never synced."""
+        with self._lock:
+            row = self._connection().execute(
+                'SELECT last_day, synced_at FROM sync_state WHERE user_id = ? AND collection = ?',
+                (user_id, collection)
+            ).fetchone()
+        return (row['last_day'], row['synced_at']) if row else None
+
+    def mark_synced(self, user_id, collection, last_day, synced_at=None):
+        """Record a completed sync, never moving last_day backwards."""
+        synced_at = time.time() if synced_at is None else synced_at
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    '''INSERT INTO sync_state (user_id, collection, last_day, synced_at)
+                       VALUES (?, ?, ?, ?)
+                       ON CONFLICT (user_id, collection) DO UPDATE SET
+                           last_day = MAX(COALESCE(sync_state.last_day, ''), COALESCE(excluded.last_day, '')),
+                           synced_at = excluded.synced_at''',
+                    (user_id, collection, last_day, synced_at)
+                )
+
+
+def sync_start_day(state, window_start, revalidate_days=OURA_REVALIDATE_DAYS):
+    """Work out the first day to ask Oura for, given a collection's sync state."""
+    if not state or not state[0]:
+        return window_start
+    last_day = datetime.strptime(state[0], '%Y-%m-%d')
+    revalidate_from = (last_day - timedelta(days=revalidate_days)).strftime('%Y-%m-%d')
+    return max(window_start, revalidate_from)
+
+
+def sync_daily(client, store, user_id, access_token, collections, window_start, end_day,
+               max_age=OURA_SYNC_INTERVAL, revalidate_days=OURA_REVALIDATE_DAYS, priority='interactive'):
+    """Incrementally sync daily collections for a user into the store.
+
+    Collections synced less than `max_age` seconds ago are skipped. The rest
+    are fetched concurrently, each starting from its last synced day minus the
+    re-validation tail. Returns a dict of CollectionFetch results for the
+    collections that were actually fetched, so callers can report failures.
+    `priority` is passed through to the client's rate limiter.
+    """
+    now = time.time()
+    calls = {}
+    for collection in collections:
+        state = store.sync_state(user_id, collection)
+        if state and now - state[1] < max_age:
+            continue
+        calls[collection] = {
+            'start_date': sync_start_day(state, window_start, revalidate_days),
+            'end_date': end_day
+        }
+
+    if not calls:
+        return {}
+
+    print(f"sync_daily: Fetching {calls} for user {user_id}")
+    fetches = client.fetch_many(access_token, calls, priority=priority)
+    for collection, fetch in fetches.items():
+        if fetch.error is not None or fetch.response.status_code != 200:
+            continue
+        try:
+            documents = fetch.response.json().get('data', [])
+        except ValueError as e:
+            fetch.error = e
+            continue
+        changed = store.upsert_documents(user_id, collection, documents)
+        last_day = max((doc['day'] for doc in documents if doc.get('day')), default=None)
+        store.mark_synced(user_id, collection, last_day, synced_at=now)
+        print(f"sync_daily: {collection} stored {len(documents)} documents ({changed} new or changed)")
+    return fetches
@@ -0,0 +1,188 @@
+"""
+Bulk export of stored daily summaries.
+
+Every user's documents for a collection are read from the local DailyStore a
+batch at a time and written as Parquet (when the optional `pyarrow` package is
+installed) or CSV. Each batch becomes one Parquet row group, or one block of
+CSV lines, and is handed on before the next is read. Memory stays bounded by
+EXPORT_BATCH_SIZE however many users there are. Nested `contributors` scores
+are flattened into `contributors_<name>` columns; list-valued fields (5-minute
+class strings, MET series) are left out.
+"""
+import csv
+import io
+import os
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '5000'))
+
+# Exported fields per collection: (dotted path in the Oura document, column type)
+EXPORT_FIELDS = {
+    'daily_sleep': (
+        ('day', 'str'), ('score', 'int'), ('timestamp', 'str'),
+        ('total_sleep_duration', 'int'), ('deep_sleep_duration', 'int'),
+        ('rem_sleep_duration', 'int'), ('light_sleep_duration', 'int'),
+        ('contributors.deep_sleep', 'int'), ('contributors.efficiency', 'int'),
+        ('contributors.latency', 'int'), ('contributors.rem_sleep', 'int'),
+        ('contributors.restfulness', 'int'), ('contributors.timing', 'int'),
+        ('contributors.total_sleep', 'int'),
+    ),
+    'daily_readiness': (
+        ('day', 'str'), ('score', 'int'), ('timestamp', 'str'),
+        ('temperature_deviation', 'float'), ('temperature_trend_deviation', 'float'),
+        ('contributors.activity_balance', 'int'), ('contributors.body_temperature', 'int'),
+        ('contributors.hrv_balance', 'int'), ('contributors.previous_day_activity', 'int'),
+        ('contributors.previous_night', 'int'), ('contributors.recovery_index', 'int'),
+        ('contributors.resting_heart_rate', 'int'), ('contributors.sleep_balance', 'int'),
+    ),
+    'daily_activity': (
+        ('day', 'str'), ('score', 'int'), ('timestamp', 'str'),
+        ('steps', 'int'), ('active_calories', 'int'), ('total_calories', 'int'),
+        ('target_calories', 'int'), ('equivalent_walking_distance', 'int'),
+        ('high_activity_time', 'int'), ('medium_activity_time', 'int'), ('low_activity_time', 'int'),
+        ('sedentary_time', 'int'), ('resting_time', 'int'), ('non_wear_time', 'int'),
+        ('contributors.meet_daily_targets', 'int'), ('contributors.move_every_hour', 'int'),
+        ('contributors.recovery_time', 'int'), ('contributors.stay_active', 'int'),
+        ('contributors.training_frequency', 'int'), ('contributors.training_volume', 'int'),
+    ),
+}
+
+EXPORT_MIMETYPES = {
+    'parquet': 'application/vnd.apache.parquet',
+    'csv': 'text/csv',
+}
+
+
+def available_formats():
+    """Export formats usable in this environment, preferred first."""
+    return ('parquet', 'csv') if pq is not None else ('csv',)
+
+
+def export_columns(collection):
+    """Column names of an export, in order."""
+    return ['user_id'] + [path.replace('.', '_') for path, _ in EXPORT_FIELDS[collection]]
+
+
+def _coerce(value, kind):
+    if value is None or isinstance(value, (dict, list)):
+        return None
+    try:
+        if kind == 'int':
+            return int(value)
+        if kind == 'float':
+            return float(value)
+    except (TypeError, ValueError):
+        return None
+    return str(value)
+
+
+def _lookup(document, path):
+    for key in path.split('.'):
+        if not isinstance(document, dict):
+            return None
+        document = document.get(key)
+    return document
+
+
+def export_batches(store, collection, batch_size=None):
+    """Yield lists of row tuples (matching export_columns) for every stored document."""
+    fields = EXPORT_FIELDS[collection]
+    for batch in store.iter_documents(collection, batch_size or EXPORT_BATCH_SIZE):
+        yield [
+            (user_id,) + tuple(_coerce(_lookup(document, path), kind) for path, kind in fields)
+            for user_id, document in batch
+        ]
+
+
+def iter_csv(store, collection, batch_size=None):
+    """Yield an export as CSV text, a header and then one chunk per batch."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(export_columns(collection))
+    for rows in export_batches(store, collection, batch_size):
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands written bytes back through drain()."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def parquet_schema(collection):
+    """The Arrow schema of a collection's Parquet export."""
+    types = {'str': pa.string(), 'int': pa.int64(), 'float': pa.float64()}
+    return pa.schema(
+        [('user_id', pa.string())]
+        + [(path.replace('.', '_'), types[kind]) for path, kind in EXPORT_FIELDS[collection]]
+    )
+
+
+def iter_parquet(store, collection, batch_size=None):
+    """Yield an export as Parquet bytes, one row group per batch."""
+    if pq is None:
+        raise RuntimeError('Parquet export needs the pyarrow package')
+    schema = parquet_schema(collection)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='snappy')
+    try:
+        for rows in export_batches(store, collection, batch_size):
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(zip(*rows), schema)], schema=schema
+            ))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def iter_export(store, collection, fmt, batch_size=None):
+    """Yield a collection's export in `fmt` ('parquet' or 'csv') as bytes."""
+    if collection not in EXPORT_FIELDS:
+        raise ValueError(f"Unknown collection: {collection}")
+    if fmt not in available_formats():
+        raise ValueError(f"Unsupported export format: {fmt}")
+    if fmt == 'parquet':
+        return iter_parquet(store, collection, batch_size)
+    return (chunk.encode('utf-8') for chunk in iter_csv(store, collection, batch_size))
+
+
+def write_export(store, collection, fmt, directory, batch_size=None):
+    """Write a collection's export to `directory`; returns the file path."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{collection}.{fmt}")
+    with open(path, 'wb') as output:
+        for chunk in iter_export(store, collection, fmt, batch_size):
+            output.write(chunk)
+    return path
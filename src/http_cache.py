@@ -0,0 +1,119 @@
+"""
+HTTP validators and response compression.
+
+Buffered GET responses (JSON endpoints, admin pages) get a content-hash ETag
+and are answered with 304 when the client already has them. Pages that are
+expensive to render, like the streamed dashboard, compute their ETag from the
+data they depend on first and skip rendering entirely on a match. Responses
+that still go out are gzip- or brotli-compressed when large enough; brotli is
+used only if the optional `brotli` package is installed.
+"""
+import gzip
+import hashlib
+import json
+import os
+import zlib
+from datetime import datetime, timezone
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))
+COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', '6'))
+COMPRESSIBLE_MIMETYPES = frozenset([
+    'text/html', 'text/plain', 'text/css', 'text/csv', 'text/javascript', 'application/javascript',
+    'application/json'
+])
+
+
+def etag_for(*parts):
+    """Build an ETag value from the JSON-serializable inputs a response depends on."""
+    payload = json.dumps(parts, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def set_validators(response, etag, last_modified=None):
+    """Attach an ETag (and Last-Modified, a Unix timestamp) to a per-user response."""
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = datetime.fromtimestamp(last_modified, timezone.utc)
+    # Personal data: browsers may keep it but must revalidate, shared caches must not store it
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def not_modified(etag, last_modified=None):
+    """Return a 304 response if the request's validators still match, else None."""
+    response = set_validators(Response(), etag, last_modified)
+    response.make_conditional(request)
+    return response if response.status_code == 304 else None
+
+
+def _cacheable(response):
+    return (
+        request.method in ('GET', 'HEAD')
+        and response.status_code == 200
+        and not response.is_streamed
+        and not response.direct_passthrough
+        and response.mimetype in COMPRESSIBLE_MIMETYPES
+    )
+
+
+def add_content_etag(response):
+    """Give a buffered GET response a content-hash ETag, answering 304 if it matches."""
+    if not _cacheable(response):
+        return response
+    if 'ETag' not in response.headers:
+        response.add_etag()
+    response.headers.setdefault('Cache-Control', 'private, no-cache')
+    return response.make_conditional(request)
+
+
+def _gzip_stream(chunks):
+    # Flush after every chunk so a streamed page still reaches the browser section by section
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def compress_response(response):
+    """Compress a text response with the best encoding the client accepts."""
+    if (response.status_code != 200 or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+
+    accepted = request.accept_encodings
+    if response.is_streamed:
+        if not accepted['gzip']:
+            return response
+        response.response = _gzip_stream(response.response)
+        response.headers.pop('Content-Length', None)
+        encoding = 'gzip'
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        if brotli is not None and accepted['br']:
+            response.set_data(brotli.compress(data, quality=5))
+            encoding = 'br'
+        elif accepted['gzip']:
+            response.set_data(gzip.compress(data, compresslevel=COMPRESS_LEVEL))
+            encoding = 'gzip'
+        else:
+            return response
+    response.headers['Content-Encoding'] = encoding
+
+    # The bytes differ per encoding, so the ETag can only promise semantic equivalence
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,178 @@
+"""
+Oura API client.
+
+A single OuraClient is shared by every route in a worker process. It keeps a
+connection-pooled, keep-alive requests.Session to api.ouraring.com with a
+retry/backoff policy and default timeouts, and fans the per-request collection
+calls out concurrently on a bounded thread pool so a page waits roughly as
+long as the slowest call instead of the sum of all of them. When given a
+RateLimiter, every call first takes capacity from it at the caller's priority.
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from src.rate_limiter import parse_retry_after
+
+OURA_API_BASE = os.getenv('OURA_API_BASE', 'https://api.ouraring.com')
+
+# Per-call deadline (seconds) and overall budget for one fan-out
+OURA_CALL_TIMEOUT = float(os.getenv('OURA_CALL_TIMEOUT', '10'))
+OURA_REQUEST_BUDGET = float(os.getenv('OURA_REQUEST_BUDGET', '15'))
+# Requests one worker process serves at once: up to ASGI_THREADS under SERVER_MODE=asgi (see gunicorn.conf.py)
+SERVER_CONCURRENCY = int(os.getenv('ASGI_THREADS', '200')) if os.getenv('SERVER_MODE', 'sync').lower() == 'asgi' else 1
+OURA_FETCH_WORKERS = int(os.getenv('OURA_FETCH_WORKERS', str(max(8, SERVER_CONCURRENCY))))
+
+# Connection pool and retry policy, per gunicorn worker
+OURA_POOL_SIZE = int(os.getenv('OURA_POOL_SIZE', str(max(10, SERVER_CONCURRENCY))))
+OURA_RETRIES = int(os.getenv('OURA_RETRIES', '2'))
+OURA_RETRY_BACKOFF = float(os.getenv('OURA_RETRY_BACKOFF', '0.3'))
+# 429s are not retried here: they go straight to the rate limiter, which blocks the token for Retry-After
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class CollectionFetch:
+    """Outcome of a single collection call made by OuraClient.fetch_many()."""
+
+    def __init__(self, collection, response=None, error=None):
+        self.collection = collection
+        self.response = response
+        self.error = error
+
+    def result(self):
+        """Return the HTTP response, re-raising the error the call failed with."""
+        if self.error is not None:
+            raise self.error
+        return self.response
+
+
+class OuraClient:
+    """Shared, connection-pooled client for all Oura API traffic."""
+
+    def __init__(self, base_url=OURA_API_BASE, pool_size=OURA_POOL_SIZE, retries=OURA_RETRIES,
+                 backoff=OURA_RETRY_BACKOFF, timeout=OURA_CALL_TIMEOUT, budget=OURA_REQUEST_BUDGET,
+                 fetch_workers=OURA_FETCH_WORKERS, rate_limiter=None):
+        self.base_url = base_url.rstrip('/')
+        self.rate_limiter = rate_limiter
+        self.timeout = timeout
+        self.budget = budget
+
+        # Only idempotent GETs are retried; authorization codes are single-use
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(['GET']),
+            # Sleeping out a Retry-After here would bypass the limiter, the call timeout and the fan-out budget
+            respect_retry_after_header=False,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._fetch_pool = ThreadPoolExecutor(max_workers=fetch_workers, thread_name_prefix='oura-fetch')
+
+    def url(self, path):
+        """Resolve an API path against the base URL; absolute URLs pass through."""
+        if path.startswith('http://') or path.startswith('https://'):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def collection_url(self, collection):
+        """Build the v2 usercollection URL for a collection name."""
+        return self.url(f"/v2/usercollection/{collection}")
+
+    def document_url(self, collection, document_id):
+        """Build the URL of a single document in a collection."""
+        return f"{self.collection_url(collection)}/{document_id}"
+
+    def request(self, method, path, access_token=None, timeout=None, headers=None,
+                priority='interactive', rate_wait=None, **kwargs):
+        """Send a request over the pooled session with the default timeout.
+
+        Raises RateLimitExceeded (a RequestException) if the rate limiter sheds
+        the call or has no capacity within `rate_wait` seconds. A 429 response
+        blocks the token's bucket for its Retry-After.
+        """
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(access_token, priority, max_wait=rate_wait)
+
+        headers = dict(headers or {})
+        if access_token:
+            headers['Authorization'] = f"Bearer {access_token}"
+        response = self.session.request(
+            method,
+            self.url(path),
+            headers=headers,
+            timeout=self.timeout if timeout is None else timeout,
+            **kwargs
+        )
+
+        if response.status_code == 429 and self.rate_limiter is not None:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            self.rate_limiter.block(access_token, 60.0 if retry_after is None else retry_after)
+        return response
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request('PUT', path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+    def fetch_collections(self, access_token, collections, params, timeout=None, budget=None,
+                          priority='interactive'):
+        """Fetch several Oura collections for the same date range at the same time."""
+        calls = {collection: params for collection in collections}
+        return self.fetch_many(access_token, calls, timeout=timeout, budget=budget, priority=priority)
+
+    def fetch_many(self, access_token, calls, timeout=None, budget=None, priority='interactive'):
+        """Fetch several Oura collections at the same time, each with its own params.
+
+        `calls` maps collection names to query params. Returns a dict mapping
+        each collection name to a CollectionFetch. Calls that are still running
+        when the overall budget runs out are reported as timeouts rather than
+        holding up the caller.
+        """
+        budget = self.budget if budget is None else budget
+        deadline = time.monotonic() + budget
+
+        def fetch(collection, params):
+            # Never queue for rate-limit capacity past the point the caller stops waiting
+            return self.get(
+                self.collection_url(collection),
+                access_token=access_token,
+                params=params,
+                timeout=timeout,
+                priority=priority,
+                rate_wait=max(0.0, deadline - time.monotonic())
+            )
+
+        futures = {
+            collection: self._fetch_pool.submit(fetch, collection, params)
+            for collection, params in calls.items()
+        }
+        wait(futures.values(), timeout=budget)
+
+        results = {}
+        for collection, future in futures.items():
+            if not future.done():
+                future.cancel()
+                error = requests.exceptions.Timeout(f"{collection} exceeded the {budget}s request budget")
+                results[collection] = CollectionFetch(collection, error=error)
+            elif future.exception() is not None:
+                results[collection] = CollectionFetch(collection, error=future.exception())
+            else:
+                results[collection] = CollectionFetch(collection, response=future.result())
+        return results
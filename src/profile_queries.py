@@ -0,0 +1,31 @@
+"""
+Named column projections for the profiles table.
+
+Every profiles query names the projection it needs instead of using
+select('*'), so the large Fernet-encrypted oura_tokens blob is only shipped
+(and JSON-decoded) by the few call sites that actually decrypt tokens.
+"""
+
+PROFILE_PROJECTIONS = {
+    # Signed-in user: what load_user, the dashboard header and scores need
+    'session': 'id, email, display_name, is_admin, avg_sleep_score, last_sleep_score, sleep_stats',
+    # Admin user grid
+    'admin_list': 'id, email, display_name, avg_sleep_score, last_sleep_score, last_login',
+    # Admin user switcher dropdown
+    'switcher': 'id, display_name',
+    # Resolving a user by email or Oura id
+    'lookup': 'id, email',
+    # Admin status checks
+    'admin_check': 'id, is_admin',
+    # The only projection that includes the encrypted tokens
+    'tokens': 'id, display_name, oura_tokens',
+}
+
+
+def profiles_query(client, projection, **select_kwargs):
+    """Start a profiles select limited to a named projection's columns."""
+    try:
+        columns = PROFILE_PROJECTIONS[projection]
+    except KeyError:
+        raise ValueError(f"Unknown profiles projection: {projection}")
+    return client.table('profiles').select(columns, **select_kwargs)
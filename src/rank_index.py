@@ -0,0 +1,173 @@
+"""
+In-process rank index over leaderboard scores.
+
+ScoreIndex keeps every user's average sleep score in a sorted list, so a
+user's rank and percentile are two bisections and a histogram is one bisection
+per bin edge, instead of a count query or a sort over all profiles. Each
+gunicorn worker holds its own copy: score changes made in the process are
+applied immediately, and the whole index is reloaded from the leaderboard
+snapshot every `ttl` seconds to pick up changes made by other processes.
+"""
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+
+# Histogram bin edges over the 0-100 score range
+DEFAULT_BIN_EDGES = tuple(range(0, 101, 10))
+
+
+class ScoreIndex:
+    """Sorted per-user scores answering rank, percentile and histogram queries.
+
+    `load` returns an iterable of (user_id, score) pairs; users whose score is
+    None are counted but rank after everyone with a score, like the
+    leaderboard's NULLS LAST ordering. Reloads run outside the index lock: one
+    thread loads while the others keep answering from the previous snapshot.
+    Only the very first load (or one after invalidate()) makes callers wait.
+    """
+
+    def __init__(self, load, ttl=300):
+        self.load = load
+        self.ttl = ttl
+        self._scores = []
+        self._by_user = {}
+        self._loaded_at = None
+        self._lock = threading.RLock()
+        self._reload_lock = threading.Lock()
+        # Scores updated while a reload is in flight, re-applied to the new snapshot
+        self._pending = None
+
+    def _fresh(self):
+        # Called without the lock; loads on first use and once the TTL has passed
+        with self._lock:
+            loaded = self._loaded_at is not None
+            if loaded and time.monotonic() - self._loaded_at < self.ttl:
+                return
+        if loaded:
+            if not self._reload_lock.acquire(blocking=False):
+                return
+        else:
+            self._reload_lock.acquire()
+            with self._lock:
+                if self._loaded_at is not None:
+                    # Another thread finished the first load while we waited
+                    self._reload_lock.release()
+                    return
+        try:
+            with self._lock:
+                self._pending = {}
+            by_user = {user_id: None if score is None else float(score) for user_id, score in self.load()}
+            scores = sorted(score for score in by_user.values() if score is not None)
+            with self._lock:
+                pending = self._pending
+                self._by_user, self._scores, self._loaded_at = by_user, scores, time.monotonic()
+                for user_id, score in pending.items():
+                    self._apply(user_id, score)
+        finally:
+            with self._lock:
+                self._pending = None
+            self._reload_lock.release()
+
+    def _apply(self, user_id, score):
+        # Called with the lock held
+        previous = self._by_user.get(user_id)
+        if previous is not None:
+            del self._scores[bisect_left(self._scores, previous)]
+        if score is not None:
+            insort(self._scores, score)
+        self._by_user[user_id] = score
+
+    def invalidate(self):
+        """Force a reload from `load` on the next query."""
+        with self._lock:
+            self._loaded_at = None
+
+    def update(self, user_id, score):
+        """Record a user's new score (None to mark them unscored)."""
+        score = None if score is None else float(score)
+        with self._lock:
+            if self._pending is not None:
+                self._pending[user_id] = score
+            if self._loaded_at is None:
+                # Nothing loaded yet; the first query will read the new score from the snapshot
+                return
+            self._apply(user_id, score)
+
+    def track(self, user_id):
+        """Add a user without a score, leaving an existing entry alone."""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.setdefault(user_id, self._by_user.get(user_id))
+            if self._loaded_at is not None:
+                self._by_user.setdefault(user_id, None)
+
+    def score(self, user_id):
+        """A user's indexed score, or None."""
+        self._fresh()
+        with self._lock:
+            return self._by_user.get(user_id)
+
+    def rank(self, user_id):
+        """1-based competition rank (ties share a rank), or None for users not in the index."""
+        self._fresh()
+        with self._lock:
+            return self._rank(user_id)
+
+    def rank_of_score(self, score):
+        """The competition rank a score would have (None ranks after every scored user)."""
+        self._fresh()
+        with self._lock:
+            return self._rank_of(score)
+
+    def percentile(self, user_id):
+        """Percentile rank (0-100) among scored users, counting ties as half below, or None."""
+        self._fresh()
+        with self._lock:
+            return self._percentile(user_id)
+
+    def histogram(self, edges=DEFAULT_BIN_EDGES):
+        """Counts of scored users per [low, high) bin; the last bin includes its upper edge."""
+        self._fresh()
+        with self._lock:
+            return self._histogram(edges)
+
+    def standing(self, user_id, edges=DEFAULT_BIN_EDGES):
+        """A user's score, rank, percentile and the score histogram from one consistent snapshot."""
+        self._fresh()
+        with self._lock:
+            return {
+                'score': self._by_user.get(user_id),
+                'rank': self._rank(user_id),
+                'percentile': self._percentile(user_id),
+                'total': len(self._by_user),
+                'scored': len(self._scores),
+                'histogram': self._histogram(edges),
+            }
+
+    # The helpers below are called with the lock held on a loaded index
+
+    def _rank(self, user_id):
+        if user_id not in self._by_user:
+            return None
+        return self._rank_of(self._by_user[user_id])
+
+    def _rank_of(self, score):
+        if score is None:
+            return len(self._scores) + 1
+        return len(self._scores) - bisect_right(self._scores, float(score)) + 1
+
+    def _percentile(self, user_id):
+        score = self._by_user.get(user_id)
+        if score is None:
+            return None
+        below = bisect_left(self._scores, score)
+        ties = bisect_right(self._scores, score) - below
+        return round(100.0 * (below + ties / 2) / len(self._scores), 1)
+
+    def _histogram(self, edges):
+        positions = [bisect_left(self._scores, edge) for edge in edges[:-1]]
+        positions.append(bisect_right(self._scores, edges[-1]))
+        return [
+            {'min': low, 'max': high, 'count': end - start}
+            for low, high, start, end in zip(edges, edges[1:], positions, positions[1:])
+        ]
@@ -0,0 +1,171 @@
+"""
+Client-side rate limiting for Oura API calls.
+
+Token buckets live in a small SQLite database so every gunicorn worker and the
+background worker on the same host draw from the same budget: one app-wide
+bucket plus one per access token. Each call names a priority that decides how
+long it may queue for capacity and how much headroom it must leave for
+interactive traffic; low-priority calls are shed rather than queued. A 429
+with Retry-After blocks the affected bucket until Oura says to come back.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+
+# App-wide and per-token refill rates (requests/second) and burst sizes
+OURA_GLOBAL_RATE = float(os.getenv('OURA_GLOBAL_RATE', '10'))
+OURA_GLOBAL_BURST = float(os.getenv('OURA_GLOBAL_BURST', '50'))
+OURA_TOKEN_RATE = float(os.getenv('OURA_TOKEN_RATE', '1'))
+OURA_TOKEN_BURST = float(os.getenv('OURA_TOKEN_BURST', '10'))
+
+# priority: (longest wait for capacity in seconds, share of the burst it must leave untouched)
+PRIORITIES = {
+    'interactive': (5.0, 0.0),
+    'background': (60.0, 0.25),
+    'low': (0.0, 0.5),
+}
+
+GLOBAL_BUCKET = 'global'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    blocked_until REAL NOT NULL DEFAULT 0
+);
+'''
+
+
+class RateLimitExceeded(requests.exceptions.RequestException):
+    """Raised when a call was shed or could not get capacity in time."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def token_bucket_key(access_token):
+    """Bucket key for an access token; the token itself is never stored."""
+    return 'token:' + hashlib.sha256(access_token.encode('utf-8')).hexdigest()[:32]
+
+
+def parse_retry_after(value):
+    """Return the seconds a Retry-After header asks us to wait, or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """Token-bucket limiter shared across processes through SQLite."""
+
+    def __init__(self, path, global_rate=OURA_GLOBAL_RATE, global_burst=OURA_GLOBAL_BURST,
+                 token_rate=OURA_TOKEN_RATE, token_burst=OURA_TOKEN_BURST):
+        self.path = path
+        self.limits = {GLOBAL_BUCKET: (global_rate, global_burst)}
+        self.token_limit = (token_rate, token_burst)
+        self._lock = threading.RLock()
+        self._conn = None
+        self._pid = None
+
+    def _connection(self):
+        # One connection per process: gunicorn workers fork after the app is imported
+        if self._conn is None or self._pid != os.getpid():
+            if self.path != ':memory:':
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            if self.path != ':memory:':
+                conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _buckets(self, access_token):
+        keys = [GLOBAL_BUCKET]
+        if access_token:
+            keys.append(token_bucket_key(access_token))
+        return [(key, self.limits.get(key, self.token_limit)) for key in keys]
+
+    def _take(self, buckets, reserve, now):
+        """Take one token from every bucket, or return the seconds until that is possible."""
+        with self._lock:
+            conn = self._connection()
+            # BEGIN IMMEDIATE takes the write lock up front, so the read-modify-write is atomic across processes
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                levels = []
+                wait_for = 0.0
+                for key, (rate, burst) in buckets:
+                    row = conn.execute(
+                        'SELECT tokens, updated_at, blocked_until FROM buckets WHERE key = ?', (key,)
+                    ).fetchone()
+                    tokens, updated_at, blocked_until = row if row else (burst, now, 0.0)
+                    tokens = min(burst, tokens + max(0.0, now - updated_at) * rate)
+                    needed = 1 + reserve * burst
+                    if blocked_until > now:
+                        wait_for = max(wait_for, blocked_until - now)
+                    elif tokens < needed:
+                        wait_for = max(wait_for, (needed - tokens) / rate if rate > 0 else float('inf'))
+                    levels.append((key, tokens, blocked_until))
+
+                if wait_for == 0.0:
+                    conn.executemany(
+                        '''INSERT INTO buckets (key, tokens, updated_at, blocked_until) VALUES (?, ?, ?, ?)
+                           ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at''',
+                        [(key, tokens - 1, now, blocked_until) for key, tokens, blocked_until in levels]
+                    )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return wait_for
+
+    def acquire(self, access_token=None, priority='interactive', max_wait=None):
+        """Wait for capacity for one call, or raise RateLimitExceeded.
+
+        Calls queue for at most their priority's wait limit (or `max_wait`, if
+        shorter); a call that would have to wait longer (or at all, for 'low')
+        is shed immediately.
+        """
+        priority_wait, reserve = PRIORITIES[priority]
+        max_wait = priority_wait if max_wait is None else min(priority_wait, max_wait)
+        buckets = self._buckets(access_token)
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait_for = self._take(buckets, reserve, time.time())
+            if wait_for == 0.0:
+                return
+            remaining = deadline - time.monotonic()
+            if wait_for > remaining:
+                raise RateLimitExceeded(
+                    f"Oura rate limit reached for {priority} call; retry in {wait_for:.1f}s",
+                    retry_after=wait_for
+                )
+            time.sleep(wait_for)
+
+    def block(self, access_token, seconds):
+        """Stop all calls through a token's bucket (or the app-wide one) for `seconds`."""
+        key = token_bucket_key(access_token) if access_token else GLOBAL_BUCKET
+        now = time.time()
+        with self._lock:
+            self._connection().execute(
+                '''INSERT INTO buckets (key, tokens, updated_at, blocked_until) VALUES (?, 0, ?, ?)
+                   ON CONFLICT (key) DO UPDATE SET
+                       tokens = 0, updated_at = excluded.updated_at,
+                       blocked_until = MAX(buckets.blocked_until, excluded.blocked_until)''',
+                (key, now, now + seconds)
+            )
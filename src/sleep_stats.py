@@ -0,0 +1,92 @@
+"""
+Sleep score statistics over trailing windows.
+
+Daily sleep documents from the local store are laid out as a dense NumPy
+series (one slot per calendar day, NaN where there is no score), so every
+window's mean, median, spread and trend is a handful of vectorized nan-aware
+reductions. Results are plain JSON-ready dicts that are stored on the profile
+and only recomputed when the stored sleep data or the current day changes.
+"""
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# Trailing windows (days) to summarize, and the score that counts towards a streak
+SLEEP_STATS_WINDOWS = (7, 30, 90)
+SLEEP_STREAK_SCORE = int(os.getenv('SLEEP_STREAK_SCORE', '85'))
+
+
+def daily_series(documents, end_day, days):
+    """Return `days` scores ending at end_day (oldest first), NaN for days without one."""
+    end = datetime.strptime(end_day, '%Y-%m-%d').date()
+    series = np.full(days, np.nan)
+    for document in documents:
+        score = document.get('score')
+        if score is None or not document.get('day'):
+            continue
+        offset = (end - datetime.strptime(document['day'], '%Y-%m-%d').date()).days
+        if 0 <= offset < days:
+            series[days - 1 - offset] = score
+    return series
+
+
+def trend_slope(values):
+    """Least-squares slope in points per day over the non-NaN values, or None."""
+    x = np.flatnonzero(~np.isnan(values)).astype(float)
+    if x.size < 2:
+        return None
+    y = values[x.astype(int)]
+    x -= x.mean()
+    return float(np.dot(x, y - y.mean()) / np.dot(x, x))
+
+
+def window_stats(series, window):
+    """Summarize the last `window` days of a series."""
+    values = series[-window:]
+    scored = int(np.count_nonzero(~np.isnan(values)))
+    if not scored:
+        return {'days': 0, 'mean': None, 'median': None, 'std': None, 'slope': None}
+    slope = trend_slope(values)
+    return {
+        'days': scored,
+        'mean': round(float(np.nanmean(values)), 2),
+        'median': round(float(np.nanmedian(values)), 2),
+        'std': round(float(np.nanstd(values)), 2),
+        'slope': None if slope is None else round(slope, 3),
+    }
+
+
+def streaks(series, threshold=SLEEP_STREAK_SCORE):
+    """Current and longest runs of consecutive days scoring at least `threshold`.
+
+    A missing score for the final day (usually today, before Oura has it)
+    doesn't end the current streak; any other missing day does.
+    """
+    if series.size and np.isnan(series[-1]):
+        series = series[:-1]
+    # NaN compares False, so missing days break a streak
+    good = np.concatenate(([False], series >= threshold, [False]))
+    edges = np.flatnonzero(np.diff(good.astype(np.int8)))
+    runs = edges[1::2] - edges[::2]
+    current = int(runs[-1]) if runs.size and edges[-1] == series.size else 0
+    return {'current': current, 'longest': int(runs.max()) if runs.size else 0, 'threshold': threshold}
+
+
+def compute_sleep_stats(documents, end_day, windows=SLEEP_STATS_WINDOWS, threshold=SLEEP_STREAK_SCORE):
+    """Compute per-window statistics and streaks from daily_sleep documents."""
+    series = daily_series(documents, end_day, max(windows))
+    scored = np.flatnonzero(~np.isnan(series))
+    last_day = last_score = None
+    if scored.size:
+        last_day = datetime.strptime(end_day, '%Y-%m-%d') - timedelta(days=int(series.size - 1 - scored[-1]))
+        last_day = last_day.strftime('%Y-%m-%d')
+        last_score = float(series[scored[-1]])
+        last_score = int(last_score) if last_score.is_integer() else last_score
+    return {
+        'through_day': end_day,
+        'last_day': last_day,
+        'last_score': last_score,
+        'windows': {str(window): window_stats(series, window) for window in windows},
+        'streaks': streaks(series, threshold),
+    }
@@ -0,0 +1,67 @@
+"""
+Template compilation off the request path.
+
+Pages are rendered from files under src/templates. Compiled templates are
+kept in Jinja's in-memory cache for the life of the worker and in a bytecode
+cache on disk, and every template is compiled once at startup, so requests
+only ever render.
+
+Large pages can also be streamed: stream_page() renders with Jinja's
+generate() and sends the output in pieces that end at FLUSH_MARKER, so the
+browser gets the top of the page while later sections are still loading.
+"""
+import hashlib
+import os
+
+from flask import Response, stream_with_context
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+
+# Templates write {{ flush }} where a streamed response should send what it has so far
+FLUSH_MARKER = Markup('<!-- flush -->')
+
+
+def configure_template_cache(app, cache_dir):
+    """Give the app's Jinja environment an on-disk bytecode cache."""
+    os.makedirs(cache_dir, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+
+def precompile_templates(app):
+    """Load (and so compile) every template the app can render; returns their names."""
+    names = app.jinja_env.list_templates(extensions=['html'])
+    for name in names:
+        app.jinja_env.get_template(name)
+    return names
+
+
+def template_fingerprint(app):
+    """Hash of every page template's source, for validators of rendered pages."""
+    digest = hashlib.sha1()
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        source = app.jinja_loader.get_source(app.jinja_env, name)[0]
+        digest.update(name.encode('utf-8') + b'\0' + source.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def flush_at_markers(chunks, marker=FLUSH_MARKER):
+    """Join Jinja's many small output chunks into one write per flushed section."""
+    buffer = []
+    for chunk in chunks:
+        buffer.append(chunk)
+        if marker in chunk:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_page(app, name, **context):
+    """Stream a template as an HTML response, flushing at each {{ flush }}."""
+    template = app.jinja_env.get_template(name)
+    context['flush'] = FLUSH_MARKER
+    app.update_template_context(context)
+    response = Response(stream_with_context(flush_at_markers(template.generate(context))), mimetype='text/html')
+    # Stop reverse proxies from buffering the stream back into one response
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,220 @@
+"""
+Oura OAuth token lifecycle.
+
+Tokens are stamped with an absolute `expires_at` when they are issued, so any
+process can tell how long they have left. TokenManager renews them with the
+refresh_token shortly before they expire (the background worker uses a wider
+margin than web requests, so it normally gets there first) and serializes
+renewals per user: Oura refresh tokens are single-use, so two concurrent
+refreshes would leave one of them holding a revoked token. A lock serializes
+the threads of one process, and a RefreshLeases lease in SQLite serializes
+the gunicorn workers and the sync worker on the host.
+"""
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import requests
+
+# Seconds before expiry at which a web request renews tokens itself
+OURA_TOKEN_REFRESH_MARGIN = int(os.getenv('OURA_TOKEN_REFRESH_MARGIN', '300'))
+# A refresh lease whose holder died is taken over after this many seconds
+TOKEN_REFRESH_LEASE = 30
+# Seconds a refresh waits for another process's lease before giving up
+TOKEN_REFRESH_WAIT = 15
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS refresh_leases (
+    user_id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    leased_until REAL NOT NULL
+);
+'''
+
+
+def stamp_expiry(tokens, now=None):
+    """Record an absolute expires_at on a token response that carries expires_in."""
+    if tokens.get('expires_in') and not tokens.get('expires_at'):
+        now = time.time() if now is None else now
+        tokens['expires_at'] = int(now + int(tokens['expires_in']))
+    return tokens
+
+
+class RefreshLeases:
+    """Per-user token refresh leases, shared across processes through SQLite."""
+
+    def __init__(self, path, lease=TOKEN_REFRESH_LEASE, wait=TOKEN_REFRESH_WAIT, poll=0.1):
+        self.path = path
+        self.lease = lease
+        self.wait = wait
+        self.poll = poll
+        self._lock = threading.RLock()
+        self._conn = None
+        self._pid = None
+
+    def _connection(self):
+        # One connection per process: gunicorn workers fork after the app is imported
+        if self._conn is None or self._pid != os.getpid():
+            if self.path != ':memory:':
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            if self.path != ':memory:':
+                conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def try_acquire(self, user_id, owner, now=None):
+        """Take a user's lease unless another owner holds a live one; returns True on success."""
+        now = time.time() if now is None else now
+        with self._lock:
+            conn = self._connection()
+            # BEGIN IMMEDIATE makes the check and the claim atomic across processes
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                acquired = conn.execute(
+                    '''INSERT INTO refresh_leases (user_id, owner, leased_until) VALUES (?, ?, ?)
+                       ON CONFLICT (user_id) DO UPDATE SET owner = excluded.owner, leased_until = excluded.leased_until
+                       WHERE refresh_leases.leased_until <= ?''',
+                    (user_id, owner, now + self.lease, now)
+                ).rowcount == 1
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return acquired
+
+    def acquire(self, user_id):
+        """Wait up to `wait` seconds for a user's lease; returns its owner id, or None on timeout."""
+        owner = uuid.uuid4().hex
+        deadline = time.monotonic() + self.wait
+        while not self.try_acquire(user_id, owner):
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(self.poll)
+        return owner
+
+    def release(self, user_id, owner):
+        """Give up a lease, unless it already expired and was taken over."""
+        with self._lock:
+            self._connection().execute(
+                'DELETE FROM refresh_leases WHERE user_id = ? AND owner = ?', (user_id, owner)
+            )
+
+
+class TokenManager:
+    """Refreshes and persists per-user Oura tokens.
+
+    `load(user_id)` must return the user's currently stored token dict (or
+    None) and `save(user_id, tokens)` must persist a new one, raising if it
+    can't; the app supplies both so this module stays independent of Supabase
+    and encryption. With `leases`, refreshes are also serialized across
+    processes.
+    """
+
+    def __init__(self, client, token_url, client_id, client_secret, load, save,
+                 margin=OURA_TOKEN_REFRESH_MARGIN, leases=None):
+        self.client = client
+        self.token_url = token_url
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.load = load
+        self.save = save
+        self.margin = margin
+        self.leases = leases
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def _user_lock(self, user_id):
+        with self._locks_guard:
+            return self._locks.setdefault(user_id, threading.Lock())
+
+    def needs_refresh(self, tokens, margin=None):
+        """True if tokens expire within `margin` seconds (unknown expiry counts as fresh)."""
+        margin = self.margin if margin is None else margin
+        expires_at = tokens.get('expires_at')
+        return bool(expires_at) and expires_at - margin <= time.time()
+
+    def valid_tokens(self, user_id, tokens, margin=None, force=False):
+        """Return usable tokens for a user, refreshing them first if they are due.
+
+        `force` refreshes regardless of expiry, e.g. after the API answered
+        401. Returns None when the tokens are expired and cannot be renewed,
+        meaning the user has to authorize again.
+        """
+        if not force and not self.needs_refresh(tokens, margin):
+            return tokens
+
+        with self._user_lock(user_id):
+            owner = None
+            if self.leases is not None:
+                owner = self.leases.acquire(user_id)
+                if owner is None:
+                    print(f"token_manager: Timed out waiting for another process to refresh user {user_id}")
+            try:
+                # Another request or process may have refreshed while we waited for the lock
+                stored = self.load(user_id)
+                if stored and stored.get('access_token') != tokens.get('access_token'):
+                    if not self.needs_refresh(stored, margin):
+                        return stored
+                    tokens = stored
+
+                # Without the lease another process may be mid-refresh, so don't spend the refresh token too
+                if self.leases is None or owner is not None:
+                    refreshed = self._refresh(user_id, tokens)
+                    if refreshed:
+                        return refreshed
+            finally:
+                if owner is not None:
+                    self.leases.release(user_id, owner)
+
+        # Renewal failed: keep using tokens that haven't actually expired yet
+        if not force and not self.needs_refresh(tokens, margin=0):
+            return tokens
+        return None
+
+    def _refresh(self, user_id, tokens):
+        refresh_token = tokens.get('refresh_token')
+        if not refresh_token:
+            print(f"token_manager: No refresh token for user {user_id}")
+            return None
+
+        try:
+            response = self.client.post(
+                self.token_url,
+                data={
+                    'grant_type': 'refresh_token',
+                    'refresh_token': refresh_token,
+                    'client_id': self.client_id,
+                    'client_secret': self.client_secret
+                }
+            )
+        except requests.exceptions.RequestException as e:
+            print(f"token_manager: Refresh request for user {user_id} failed: {str(e)}")
+            return None
+
+        if response.status_code != 200:
+            print(f"token_manager: Refresh for user {user_id} failed with status {response.status_code}")
+            return None
+
+        try:
+            new_tokens = response.json()
+        except ValueError:
+            print(f"token_manager: Refresh response for user {user_id} was not JSON")
+            return None
+
+        # Oura rotates the refresh token; keep the old one only if none came back
+        new_tokens.setdefault('refresh_token', refresh_token)
+        stamp_expiry(new_tokens)
+        try:
+            self.save(user_id, new_tokens)
+        except Exception as e:
+            # The old refresh token is spent, so the next refresh of this user will fail
+            print(f"token_manager: ERROR: Refreshed tokens for user {user_id} could not be saved, "
+                  f"the rotated refresh token is lost and they will have to log in again: {str(e)}")
+            return None
+        print(f"token_manager: Refreshed tokens for user {user_id}")
+        return new_tokens
@@ -0,0 +1,110 @@
+"""
+Oura webhook notifications and subscriptions.
+
+Oura can push a notification whenever one of a user's daily documents is
+created or updated, instead of the app polling for new days. Notifications are
+signed with the app's client secret: the `x-oura-signature` header is the
+HMAC-SHA256 of the `x-oura-timestamp` header followed by the raw body.
+WebhookSubscriptions manages the app's subscriptions through the
+/v2/webhook/subscription endpoints, which authenticate with the client id and
+secret rather than a user token.
+"""
+import hashlib
+import hmac
+import os
+import time
+
+OURA_WEBHOOK_EVENT_TYPES = ('create', 'update')
+# Notifications whose timestamp is further than this from our clock (seconds) are rejected as replays
+OURA_WEBHOOK_MAX_SKEW = int(os.getenv('OURA_WEBHOOK_MAX_SKEW', '300'))
+
+SUBSCRIPTION_PATH = '/v2/webhook/subscription'
+
+
+def webhook_signature(secret, timestamp, body):
+    """Hex HMAC-SHA256 of timestamp + body, as Oura sends it."""
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    message = str(timestamp).encode('utf-8') + body
+    return hmac.new(secret.encode('utf-8'), message, hashlib.sha256).hexdigest().upper()
+
+
+def verify_signature(secret, timestamp, body, signature, now=None, max_skew=OURA_WEBHOOK_MAX_SKEW):
+    """Return True if a notification's signature matches and its timestamp is recent."""
+    if not secret or not timestamp or not signature:
+        return False
+    try:
+        sent_at = float(timestamp)
+    except ValueError:
+        return False
+    now = time.time() if now is None else now
+    if abs(now - sent_at) > max_skew:
+        return False
+    return hmac.compare_digest(webhook_signature(secret, timestamp, body), signature.upper())
+
+
+def parse_event(payload):
+    """Validate a notification body; returns (oura_user_id, event_type, data_type, object_id).
+
+    Raises ValueError for malformed notifications.
+    """
+    if not isinstance(payload, dict):
+        raise ValueError('Notification body must be a JSON object')
+    fields = [payload.get(key) for key in ('user_id', 'event_type', 'data_type', 'object_id')]
+    if not all(isinstance(value, str) and value for value in fields):
+        raise ValueError('Notification is missing user_id, event_type, data_type or object_id')
+    return tuple(fields)
+
+
+class WebhookSubscriptions:
+    """The app's Oura webhook subscriptions."""
+
+    def __init__(self, client, client_id, client_secret):
+        self.client = client
+        self.headers = {'x-client-id': client_id or '', 'x-client-secret': client_secret or ''}
+
+    def _call(self, method, path, **kwargs):
+        response = self.client.request(method, path, headers=self.headers, priority='background', **kwargs)
+        response.raise_for_status()
+        return response.json() if response.content else None
+
+    def list(self):
+        """Return every subscription for this app."""
+        return self._call('GET', SUBSCRIPTION_PATH) or []
+
+    def create(self, callback_url, verification_token, event_type, data_type):
+        """Subscribe to one event type for one data type; Oura verifies the callback URL first."""
+        return self._call('POST', SUBSCRIPTION_PATH, json={
+            'callback_url': callback_url,
+            'verification_token': verification_token,
+            'event_type': event_type,
+            'data_type': data_type,
+        })
+
+    def renew(self, subscription_id):
+        """Extend a subscription before it expires."""
+        return self._call('PUT', f"{SUBSCRIPTION_PATH}/renew/{subscription_id}")
+
+    def delete(self, subscription_id):
+        """Remove a subscription."""
+        self._call('DELETE', f"{SUBSCRIPTION_PATH}/{subscription_id}")
+
+    def ensure(self, callback_url, verification_token, data_types, event_types=OURA_WEBHOOK_EVENT_TYPES):
+        """Create missing subscriptions for every data/event type pair and renew existing ones.
+
+        Returns (created, renewed) lists of subscriptions.
+        """
+        existing = {
+            (subscription.get('data_type'), subscription.get('event_type')): subscription
+            for subscription in self.list()
+            if subscription.get('callback_url') == callback_url
+        }
+        created, renewed = [], []
+        for data_type in data_types:
+            for event_type in event_types:
+                subscription = existing.get((data_type, event_type))
+                if subscription:
+                    renewed.append(self.renew(subscription['id']))
+                else:
+                    created.append(self.create(callback_url, verification_token, event_type, data_type))
+        return created, renewed
@@ -0,0 +1,151 @@
+"""A local stand-in for the parts of the Oura API the webhook flow uses.
+
+FakeOura runs an HTTP server on a free localhost port in a background thread.
+It serves single daily documents and collection pages to a bearer token, and
+the /v2/webhook/subscription endpoints to the app's client id and secret.
+Every request is recorded in `requests` as (method, path), and collection
+reads wait `latency` seconds first to stand in for the real API's round trip.
+"""
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from src.webhooks import webhook_signature
+
+COLLECTION_PREFIX = '/v2/usercollection/'
+SUBSCRIPTION_PATH = '/v2/webhook/subscription'
+
+
+class _Server(ThreadingHTTPServer):
+    # The default backlog of 5 refuses connections when many clients connect at once
+    request_queue_size = 256
+
+
+class FakeOura:
+    """In-memory Oura API serving `documents` and `subscriptions`."""
+
+    def __init__(self, access_token='fake-token', client_id='fake-client', client_secret='fake-secret'):
+        self.access_token = access_token
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.documents = {}  # (collection, document id) -> document
+        self.subscriptions = {}  # subscription id -> subscription
+        self.requests = []
+        self.latency = 0
+        self._server = _Server(('127.0.0.1', 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def add_document(self, collection, document):
+        """Store a document (with an 'id' and 'day') and return the notification Oura would send for it."""
+        self.documents[(collection, document['id'])] = document
+        return {'event_type': 'create', 'data_type': collection, 'object_id': document['id'],
+                'user_id': 'oura-user', 'event_time': f"{document['day']}T08:00:00+00:00"}
+
+    def sign(self, notification, timestamp):
+        """Return (body, headers) for POSTing a notification signed like Oura does."""
+        body = json.dumps(notification).encode('utf-8')
+        return body, {
+            'x-oura-timestamp': str(timestamp),
+            'x-oura-signature': webhook_signature(self.client_secret, timestamp, body),
+            'Content-Type': 'application/json',
+        }
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, so the client's pooled connections are reused as they would be against Oura
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, payload=None):
+                body = b'' if payload is None else json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _read_body(self):
+                # Always drained, so an unread body can't corrupt the next request on the connection
+                length = int(self.headers.get('Content-Length') or 0)
+                return json.loads(self.rfile.read(length)) if length else None
+
+            def _route(self, method):
+                self.payload = self._read_body()
+                url = urlparse(self.path)
+                fake.requests.append((method, url.path))
+                if url.path.startswith(SUBSCRIPTION_PATH):
+                    if (self.headers.get('x-client-id') != fake.client_id
+                            or self.headers.get('x-client-secret') != fake.client_secret):
+                        return self._send(401, {'detail': 'Invalid client credentials'})
+                    return self._subscriptions(method, url.path[len(SUBSCRIPTION_PATH):])
+                if method == 'GET' and url.path.startswith(COLLECTION_PREFIX):
+                    if self.headers.get('Authorization') != f"Bearer {fake.access_token}":
+                        return self._send(401, {'detail': 'Invalid token'})
+                    return self._collection(url.path[len(COLLECTION_PREFIX):], parse_qs(url.query))
+                return self._send(404, {'detail': 'Not found'})
+
+            def _collection(self, path, query):
+                if fake.latency:
+                    time.sleep(fake.latency)
+                collection, _, document_id = path.partition('/')
+                if document_id:
+                    document = fake.documents.get((collection, document_id))
+                    return self._send(200, document) if document else self._send(404, {'detail': 'Not found'})
+                start = query.get('start_date', [''])[0]
+                end = query.get('end_date', ['9999-12-31'])[0]
+                data = sorted(
+                    (document for (name, _), document in fake.documents.items()
+                     if name == collection and start <= document['day'] <= end),
+                    key=lambda document: document['day']
+                )
+                return self._send(200, {'data': data, 'next_token': None})
+
+            def _subscriptions(self, method, path):
+                if method == 'GET' and not path:
+                    return self._send(200, list(fake.subscriptions.values()))
+                if method == 'POST' and not path:
+                    subscription = dict(self.payload, id=str(uuid.uuid4()), expiration_time='2030-01-01T00:00:00')
+                    subscription.pop('verification_token', None)
+                    fake.subscriptions[subscription['id']] = subscription
+                    return self._send(201, subscription)
+                if method == 'PUT' and path.startswith('/renew/') and path[7:] in fake.subscriptions:
+                    subscription = fake.subscriptions[path[7:]]
+                    subscription['expiration_time'] = '2031-01-01T00:00:00'
+                    return self._send(200, subscription)
+                if method == 'DELETE' and path[1:] in fake.subscriptions:
+                    del fake.subscriptions[path[1:]]
+                    return self._send(204)
+                return self._send(404, {'detail': 'Not found'})
+
+            def do_GET(self):
+                self._route('GET')
+
+            def do_POST(self):
+                self._route('POST')
+
+            def do_PUT(self):
+                self._route('PUT')
+
+            def do_DELETE(self):
+                self._route('DELETE')
+
+        return Handler
@@ -1,12 +1,20 @@
 import unittest
 import os
 import sys
-from unittest.mock import patch, MagicMock
+import time
+from unittest.mock import patch, MagicMock, call
 
 # Add the src directory to the path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from src.app import app
+from src.oura_client import CollectionFetch
+from src.backfill import BackfillJobs
+from src.app import (
+    app, encode_cursor, decode_cursor, leaderboard_cache, profile_cache, load_user, invalidate_profile,
+    update_sleep_scores, daily_window, score_index, friends_cache, admin_user_index,
+    admin_search_term, admin_switcher_options, start_backfill, run_user_backfill, resume_backfills,
+    resume_backfill, backfill_queued, rank_leaderboard_page, get_leaderboard_position
+)
 
 class OuraAppTestCase(unittest.TestCase):
     def setUp(self):
@@ -36,29 +44,28 @@ class OuraAppTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn(b'Connect Oura Ring', response.data)
     
-    @patch('src.app.requests.post')
-    def test_callback_with_no_code(self, mock_post):
+    @patch('src.app.oura_client')
+    def test_callback_with_no_code(self, mock_oura):
         """Test that callback fails without an authorization code."""
         response = self.client.get('/callback')
         self.assertEqual(response.status_code, 400)
         self.assertIn(b'Authorization failed', response.data)
     
-    @patch('src.app.requests.post')
-    @patch('src.app.requests.get')
+    @patch('src.app.oura_client')
     @patch('src.app.supabase')
     @patch('src.app.login_user')
-    def test_callback_successful(self, mock_login, mock_supabase, mock_get, mock_post):
+    def test_callback_successful(self, mock_login, mock_supabase, mock_oura):
         """Test a successful OAuth callback."""
         # Mock token response
-        mock_post.return_value.status_code = 200
-        mock_post.return_value.json.return_value = {
+        mock_oura.post.return_value.status_code = 200
+        mock_oura.post.return_value.json.return_value = {
             'access_token': 'test_access_token',
             'refresh_token': 'test_refresh_token'
         }
         
         # Mock user info response
-        mock_get.return_value.status_code = 200
-        mock_get.return_value.json.return_value = {
+        mock_oura.get.return_value.status_code = 200
+        mock_oura.get.return_value.json.return_value = {
             'id': 'test_user_id',
             'email': 'test@example.com'
         }
@@ -86,5 +93,572 @@ class OuraAppTestCase(unittest.TestCase):
         response = self.client.get('/logout')
         self.assertEqual(response.status_code, 302)  # Redirect to index
 
+class LeaderboardApiTestCase(unittest.TestCase):
+    """Tests for the paged leaderboard JSON API."""
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        leaderboard_cache.clear()
+        profile_cache.clear()
+
+        self.supabase_patcher = patch('src.app.supabase')
+        self.mock_supabase = self.supabase_patcher.start()
+        # Profile lookup used by load_user
+        self.mock_supabase.table().select().eq().execute.return_value.data = [{
+            'id': 'user-1', 'email': 'me@example.com', 'display_name': 'me', 'is_admin': False
+        }]
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = 'user-1'
+            sess['_fresh'] = True
+
+    def tearDown(self):
+        self.supabase_patcher.stop()
+
+    def page_query(self):
+        return self.mock_supabase.table().select().order().order().range
+
+    def test_requires_login(self):
+        """Test that anonymous users are redirected away."""
+        with self.client.session_transaction() as sess:
+            sess.clear()
+        response = self.client.get('/api/v1/leaderboard')
+        self.assertEqual(response.status_code, 302)
+
+    def test_top_page_with_next_cursor(self):
+        """Test that a full page comes back with a cursor to the next one."""
+        entries = [{'user_id': f'u{i}', 'avg_sleep_score': 90 - i} for i in range(2)]
+        self.page_query().return_value.execute.return_value.data = entries
+
+        response = self.client.get('/api/v1/leaderboard?limit=2')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['entries'], [dict(entry, rank=i + 1) for i, entry in enumerate(entries)])
+        self.mock_supabase.table.assert_any_call('leaderboard_entries')
+        self.mock_supabase.table().select().order.assert_any_call('avg_sleep_score', desc=True, nullsfirst=False)
+        self.assertEqual(decode_cursor(response.json['next_cursor']), 2)
+        self.assertIsNone(response.json['prev_cursor'])
+        self.page_query().assert_called_with(0, 1)
+
+    def test_cursor_pagination(self):
+        """Test that a cursor selects the matching offset."""
+        self.page_query().return_value.execute.return_value.data = [{'user_id': 'u10', 'avg_sleep_score': 70}]
+
+        response = self.client.get(f'/api/v1/leaderboard?limit=5&cursor={encode_cursor(10)}')
+
+        self.assertEqual(response.json['offset'], 10)
+        self.assertIsNone(response.json['next_cursor'])
+        self.page_query().assert_called_with(10, 14)
+
+    def test_page_ranks_ties_across_pages(self):
+        """Test that ranks follow positions, ties share one, and a page's first row can tie the last page."""
+        rows = [
+            {'user_id': 'u3', 'avg_sleep_score': 80},
+            {'user_id': 'u4', 'avg_sleep_score': 70},
+            {'user_id': 'u5', 'avg_sleep_score': 70},
+            {'user_id': 'u6', 'avg_sleep_score': None},
+            {'user_id': 'u7', 'avg_sleep_score': None},
+        ]
+        with patch('src.app.score_index') as mock_index:
+            mock_index.rank_of_score.return_value = 2
+            ranked = rank_leaderboard_page([dict(row) for row in rows], 3)
+            mock_index.rank_of_score.assert_called_once_with(80)
+
+        self.assertEqual([row['rank'] for row in ranked], [2, 5, 5, 7, 7])
+        self.assertEqual([row['rank'] for row in rank_leaderboard_page([dict(row) for row in rows], 0)],
+                         [1, 2, 2, 4, 4])
+
+    def test_invalid_arguments(self):
+        """Test that malformed limits and cursors are rejected."""
+        self.assertEqual(self.client.get('/api/v1/leaderboard?limit=0').status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/leaderboard?cursor=nope').status_code, 400)
+
+    def test_friends_scope_ranks_friends_in_one_query(self):
+        """Test that the friends leaderboard batches every friend's scores into one query."""
+        friends_cache.clear()
+        self.mock_supabase.table().select().eq().execute.return_value.data = [
+            {'id': 'user-1', 'email': 'me@example.com', 'display_name': 'me', 'is_admin': False,
+             'friend_id': 'user-2'},
+        ]
+        entries = self.mock_supabase.table().select().in_
+        entries.return_value.execute.return_value.data = [
+            {'user_id': 'user-1', 'avg_sleep_score': 80},
+            {'user_id': 'user-2', 'avg_sleep_score': 85},
+            {'user_id': 'user-3', 'avg_sleep_score': 80},
+            {'user_id': 'user-4', 'avg_sleep_score': None},
+        ]
+
+        body = self.client.get('/api/v1/leaderboard?scope=friends&around=me').get_json()
+        self.client.get('/api/v1/leaderboard?scope=friends')
+        friends_cache.clear()
+
+        self.assertEqual([(e['user_id'], e['rank']) for e in body['entries']],
+                         [('user-2', 1), ('user-1', 2), ('user-3', 2), ('user-4', 4)])
+        self.assertEqual(body['my_rank'], 2)
+        self.assertIsNone(body['next_cursor'])
+        entries.assert_called_with('user_id', ['user-1', 'user-2'])
+        # The friend ids were cached after the first request
+        self.assertEqual(self.mock_supabase.table.call_args_list.count(call('friendships')), 1)
+
+    def test_invalid_scope(self):
+        """Test that unknown scopes are rejected."""
+        self.assertEqual(self.client.get('/api/v1/leaderboard?scope=team').status_code, 400)
+
+    @patch('src.app.invalidate_friends')
+    def test_friend_changes_invalidate_adjacency_cache(self, mock_invalidate):
+        """Test that adding or removing a friend drops the cached friend ids."""
+        self.client.post('/remove_friend', data={'friend_id': 'user-2'})
+        mock_invalidate.assert_called_once_with('user-1')
+
+    def test_bulk_add_friends_batches_writes(self):
+        """Test that a list of emails costs one lookup, one existence check and one upsert."""
+        self.mock_supabase.reset_mock()
+        lookup = self.mock_supabase.table().select().in_().execute
+        lookup.return_value.data = [
+            {'id': 'user-1', 'email': 'me@example.com'},
+            {'id': 'user-2', 'email': 'a@example.com'},
+            {'id': 'user-3', 'email': 'b@example.com'},
+        ]
+        existing = self.mock_supabase.table().select().eq().in_().execute
+        existing.return_value.data = [{'friend_id': 'user-3'}]
+        self.mock_supabase.table.reset_mock()
+
+        with patch('src.app.invalidate_friends') as mock_invalidate:
+            response = self.client.post('/add_friends', json={
+                'emails': ['a@example.com', 'b@example.com', 'a@example.com', 'me@example.com', 'nobody@example.com']
+            })
+
+        self.assertEqual(response.get_json(), {
+            'added': ['a@example.com'],
+            'existing': ['me@example.com', 'b@example.com'],
+            'not_found': ['nobody@example.com'],
+        })
+        upsert = self.mock_supabase.table().upsert
+        upsert.assert_called_once_with(
+            [{'user_id': 'user-1', 'friend_id': 'user-2'}], on_conflict='user_id,friend_id', ignore_duplicates=True
+        )
+        mock_invalidate.assert_called_once_with('user-1')
+
+    def test_bulk_add_friends_validates_input(self):
+        """Test that empty, malformed and oversized requests are rejected."""
+        self.assertEqual(self.client.post('/add_friends', json={'emails': []}).status_code, 400)
+        self.assertEqual(self.client.post('/add_friends', json={'emails': 'a@example.com'}).status_code, 400)
+        with patch('src.app.FRIEND_IMPORT_MAX', 1):
+            response = self.client.post('/add_friends', json={'emails': ['a@example.com', 'b@example.com']})
+        self.assertEqual(response.status_code, 400)
+
+    def test_rank_endpoint(self):
+        """Test that rank, percentile and histogram come from the in-process index."""
+        score_index.invalidate()
+        entries = self.mock_supabase.table().select().order().range().execute
+        entries.return_value.data = [
+            {'user_id': 'user-1', 'avg_sleep_score': 75},
+            {'user_id': 'user-2', 'avg_sleep_score': 85},
+        ]
+
+        body = self.client.get('/api/v1/rank').get_json()
+        score_index.invalidate()
+
+        self.assertEqual((body['rank'], body['percentile'], body['total']), (2, 25.0, 2))
+        self.assertEqual(sum(bin['count'] for bin in body['histogram']), 2)
+
+    @patch('src.app.get_leaderboard_position')
+    def test_around_me_centres_window(self, mock_position):
+        """Test that the around-me window is centred on the user's row."""
+        mock_position.return_value = (42, 42)
+        self.page_query().return_value.execute.return_value.data = []
+
+        response = self.client.get('/api/v1/leaderboard?around=me&limit=10')
+
+        self.assertEqual(response.json['my_rank'], 42)
+        self.assertEqual(response.json['offset'], 36)
+        self.page_query().assert_called_with(36, 45)
+
+    @patch('src.app.score_index')
+    def test_around_me_centres_on_row_within_tie_group(self, mock_index):
+        """Test that a user deep in a tie group bigger than the window still lands in it."""
+        # Rank 5 shared by a large group scoring 0, with 25 of them listed before the user
+        mock_index.rank.return_value = 5
+        mock_index.score.return_value = 0.0
+        ties = self.mock_supabase.table().select().lt
+        ties.return_value.eq.return_value.execute.return_value.count = 25
+        self.page_query().return_value.execute.return_value.data = []
+
+        response = self.client.get('/api/v1/leaderboard?around=me&limit=10')
+
+        self.assertEqual(response.json['my_rank'], 5)
+        self.assertEqual(response.json['offset'], 24)
+        ties.assert_called_with('user_id', 'user-1')
+        ties.return_value.eq.assert_called_with('avg_sleep_score', 0.0)
+
+    def test_unscored_user_counts_unscored_ties(self):
+        """Test that users without a score are counted against the other NULL rows."""
+        ties = self.mock_supabase.table().select().lt
+        ties.return_value.is_.return_value.execute.return_value.count = 3
+        with patch('src.app.score_index') as mock_index:
+            mock_index.rank.return_value = 8
+            mock_index.score.return_value = None
+            self.assertEqual(get_leaderboard_position('user-1'), (8, 11))
+        ties.return_value.is_.assert_called_with('avg_sleep_score', 'null')
+
+    def test_user_without_row_has_no_position(self):
+        """Test that users missing from the snapshot don't trigger a count query."""
+        with patch('src.app.score_index') as mock_index:
+            mock_index.rank.return_value = None
+            self.assertEqual(get_leaderboard_position('user-1'), (None, None))
+        self.mock_supabase.table().select().lt.assert_not_called()
+
+    @patch('src.app.get_leaderboard_rank')
+    def test_around_me_rank_failure(self, mock_rank):
+        """Test that a failed rank index reload is reported as an upstream error."""
+        mock_rank.side_effect = Exception('connection reset')
+
+        response = self.client.get('/api/v1/leaderboard?around=me')
+
+        self.assertEqual(response.status_code, 502)
+        self.page_query().assert_not_called()
+
+class ProfileCacheTestCase(unittest.TestCase):
+    """Tests for the load_user profile cache."""
+
+    def setUp(self):
+        profile_cache.clear()
+        self.supabase_patcher = patch('src.app.supabase')
+        self.mock_supabase = self.supabase_patcher.start()
+        self.execute = self.mock_supabase.table().select().eq().execute
+        self.execute.return_value.data = [{
+            'id': 'user-1', 'email': 'me@example.com', 'display_name': 'me', 'is_admin': False
+        }]
+        self.execute.reset_mock()
+
+    def tearDown(self):
+        self.supabase_patcher.stop()
+        profile_cache.clear()
+
+    def test_profile_data_reuses_load_user_row(self):
+        """Test that load_user and profile_data share one query per request."""
+        with app.test_request_context():
+            user = load_user('user-1')
+            self.assertEqual(user.profile_data['display_name'], 'me')
+        self.assertEqual(self.execute.call_count, 1)
+
+    def test_rows_are_cached_across_requests(self):
+        """Test that a second request is served from the TTL cache."""
+        with app.test_request_context():
+            load_user('user-1')
+        with app.test_request_context():
+            self.assertTrue(load_user('user-1').is_authenticated)
+        self.assertEqual(self.execute.call_count, 1)
+
+    def test_invalidate_forces_refetch(self):
+        """Test that writes invalidate the cached row."""
+        with app.test_request_context():
+            load_user('user-1')
+        self.execute.return_value.data = [{
+            'id': 'user-1', 'email': 'me@example.com', 'display_name': 'me', 'is_admin': True
+        }]
+        invalidate_profile('user-1')
+        with app.test_request_context():
+            self.assertTrue(load_user('user-1').is_admin)
+        self.assertEqual(self.execute.call_count, 2)
+
+    def test_missing_user(self):
+        """Test that unknown ids load as None and are not cached."""
+        self.execute.return_value.data = []
+        with app.test_request_context():
+            self.assertIsNone(load_user('ghost'))
+        self.assertIsNone(profile_cache.get('ghost'))
+
+class DailyApiTestCase(unittest.TestCase):
+    """Tests for the per-collection daily data JSON API."""
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        profile_cache.clear()
+
+        self.patchers = [
+            patch('src.app.supabase'),
+            patch('src.app.decrypt_token', return_value={'access_token': 'tok'}),
+            patch('src.app.sync_user_data'),
+            patch('src.app.daily_store'),
+        ]
+        self.mock_supabase, _, self.mock_sync, self.mock_store = [p.start() for p in self.patchers]
+        self.mock_supabase.table().select().eq().execute.return_value.data = [{
+            'id': 'user-1', 'email': 'me@example.com', 'display_name': 'me', 'is_admin': False,
+            'oura_tokens': 'enc'
+        }]
+        self.mock_sync.return_value = ({'access_token': 'tok'}, {})
+        self.mock_store.documents.return_value = [
+            {'day': '2024-01-01', 'score': 80, 'steps': 9000, 'class_5_min': '0' * 288, 'met': {}}
+        ]
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = 'user-1'
+            sess['_fresh'] = True
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        profile_cache.clear()
+
+    def test_syncs_only_the_requested_collection(self):
+        """Test that a tab's endpoint syncs and returns only its own collection."""
+        response = self.client.get('/api/v1/activity')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.mock_sync.call_args.kwargs['collections'], ['daily_activity'])
+        self.assertEqual(self.mock_store.documents.call_args.args[1], 'daily_activity')
+        # Bulky fields the dashboard doesn't show are dropped
+        self.assertEqual(response.get_json()['data'], [{'day': '2024-01-01', 'score': 80, 'steps': 9000}])
+
+    def test_failed_sync_still_serves_stored_data(self):
+        """Test that a sync error is reported alongside the stored documents."""
+        fetch = CollectionFetch('daily_readiness', response=MagicMock(status_code=500))
+        self.mock_sync.return_value = ({'access_token': 'tok'}, {'daily_readiness': fetch})
+
+        body = self.client.get('/api/v1/readiness').get_json()
+
+        self.assertEqual(len(body['data']), 1)
+        self.assertIn('500', body['sync_error'])
+
+    def test_expired_authorization(self):
+        """Test that tokens that can't be renewed answer 401."""
+        self.mock_sync.return_value = (None, {})
+        self.assertEqual(self.client.get('/api/v1/sleep').status_code, 401)
+
+    def test_sync_exception_answers_json_502(self):
+        """Test that a Supabase error during the sync is reported as JSON, not an HTML 500."""
+        self.mock_sync.side_effect = Exception('supabase down')
+
+        response = self.client.get('/api/v1/sleep')
+
+        self.assertEqual(response.status_code, 502)
+        self.assertIn('error', response.get_json())
+        self.mock_store.documents.assert_not_called()
+
+    def test_invalid_days(self):
+        """Test that out-of-range day counts are rejected."""
+        self.assertEqual(self.client.get('/api/v1/sleep?days=0').status_code, 400)
+        self.mock_sync.assert_not_called()
+
+class SleepStatsUpdateTestCase(unittest.TestCase):
+    """Tests for recomputing stored sleep statistics."""
+
+    def setUp(self):
+        self.patchers = [
+            patch('src.app.supabase'),
+            patch('src.app.daily_store'),
+            patch('src.app.get_session_profile'),
+            patch('src.app.publish_leaderboard_entry'),
+        ]
+        self.mock_supabase, self.mock_store, self.mock_profile, self.mock_publish = [p.start() for p in self.patchers]
+        self.mock_store.version.return_value = (3, 1700000000.0)
+        self.end_date = daily_window()[1]
+        self.mock_store.documents.return_value = [{'day': self.end_date, 'score': 82}]
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        profile_cache.clear()
+
+    def test_unchanged_data_is_not_recomputed(self):
+        """Test that stats tagged with the current version and day are reused."""
+        self.mock_profile.return_value = {
+            'avg_sleep_score': 80, 'last_sleep_score': 82,
+            'sleep_stats': {'version': 3, 'through_day': self.end_date}
+        }
+
+        self.assertEqual(update_sleep_scores('user-1'), (80, 82))
+        self.mock_store.documents.assert_not_called()
+        self.mock_supabase.table.assert_not_called()
+
+    def test_new_data_is_recomputed_and_stored(self):
+        """Test that a version change recomputes and writes the stats."""
+        self.mock_profile.return_value = {'sleep_stats': {'version': 2, 'through_day': self.end_date}}
+
+        self.assertEqual(update_sleep_scores('user-1'), (82.0, 82))
+        update = self.mock_supabase.table().update.call_args.args[0]
+        self.assertEqual(update['sleep_stats']['version'], 3)
+        self.assertEqual(update['sleep_stats']['windows']['7']['days'], 1)
+        self.mock_publish.assert_called_once()
+
+    def test_failed_write_is_not_published(self):
+        """Test that a failed profile update is neither retried nor published to the leaderboard."""
+        self.mock_profile.return_value = {}
+        self.mock_supabase.table().update().eq().execute.side_effect = Exception('boom')
+        self.mock_supabase.table.reset_mock()
+
+        self.assertEqual(update_sleep_scores('user-1'), (82.0, 82))
+        self.assertEqual(self.mock_supabase.table().update.call_count, 1)
+        self.mock_publish.assert_not_called()
+
+class AdminPagesTestCase(unittest.TestCase):
+    """Tests for the paginated admin user list and switcher index."""
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        profile_cache.clear()
+        admin_user_index.clear()
+        self.supabase_patcher = patch('src.app.supabase')
+        self.mock_supabase = self.supabase_patcher.start()
+        self.mock_supabase.table().select().eq().execute.return_value.data = [{
+            'id': 'admin-1', 'email': 'admin@example.com', 'display_name': 'admin', 'is_admin': True
+        }]
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = 'admin-1'
+            sess['_fresh'] = True
+
+    def tearDown(self):
+        self.supabase_patcher.stop()
+        profile_cache.clear()
+        admin_user_index.clear()
+
+    def test_search_term_is_sanitized(self):
+        """Test that filter syntax and wildcards can't be injected through the search box."""
+        self.assertEqual(admin_search_term('jo.doe@example.com'), 'jo.doe@example.com')
+        self.assertEqual(admin_search_term('a*,email.eq.x)'), 'a  email.eq.x')
+        self.assertEqual(len(admin_search_term('x' * 500)), 100)
+
+    def test_list_is_paged_and_searchable(self):
+        """Test that the list fetches one page with a count and filters by name or email."""
+        query = self.mock_supabase.table().select().or_().order().order().range
+        query.return_value.execute.return_value = MagicMock(
+            data=[{'id': 'u1', 'email': 'ann@example.com', 'display_name': 'ann'}], count=120
+        )
+
+        response = self.client.get('/admin?q=ann&page=2')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Page 2 of 3', response.data)
+        self.mock_supabase.table().select().or_.assert_called_with(
+            'display_name.ilike.*ann*,email.ilike.*ann*'
+        )
+        query.assert_called_with(48, 95)
+        self.assertIn({'count': 'estimated'}, [call.kwargs for call in self.mock_supabase.table().select.call_args_list])
+
+    def test_list_pages_past_a_low_estimate(self):
+        """Test that a full page beyond the estimated count still offers the next page."""
+        query = self.mock_supabase.table().select().order().order().range
+        query.return_value.execute.return_value = MagicMock(
+            data=[{'id': f'u{i}', 'email': f'u{i}@example.com', 'display_name': f'u{i}'} for i in range(48)], count=60
+        )
+
+        response = self.client.get('/admin?page=2')
+
+        self.assertIn(b'Page 2 of 3', response.data)
+        self.assertIn(b'96 users', response.data)
+
+    @patch('src.app.daily_store')
+    @patch('src.app.decrypt_token', return_value={'access_token': 'tok'})
+    def test_compare_syncs_users_concurrently(self, _, mock_store):
+        """Test that a cohort loads tokens in one query and syncs its users in parallel."""
+        tokens_query = self.mock_supabase.table().select().in_
+        tokens_query.return_value.execute.return_value.data = [
+            {'id': f'u{i}', 'display_name': f'user {i}', 'oura_tokens': 'enc'} for i in range(3)
+        ]
+        day = daily_window()[1]
+        mock_store.documents.side_effect = lambda user_id, collection, *args: [{'day': day, 'score': 70}]
+
+        def slow_sync(user_id, tokens, **kwargs):
+            time.sleep(0.2)
+            return tokens, {}
+
+        with patch('src.app.sync_user_data', side_effect=slow_sync) as mock_sync:
+            started = time.monotonic()
+            response = self.client.get('/admin/compare?user_id=u0,u1&user_id=u2&user_id=ghost')
+            elapsed = time.monotonic() - started
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_sync.call_count, 3)
+        self.assertLess(elapsed, 0.5)
+        tokens_query.assert_called_with('id', ['u0', 'u1', 'u2', 'ghost'])
+        self.assertIn(b'Unknown user ids: ghost', response.data)
+        self.assertEqual(response.data.count(b'<td>70</td>'), 9)
+
+    def test_compare_requires_users(self):
+        """Test that an empty cohort redirects back to the admin list."""
+        self.assertEqual(self.client.get('/admin/compare').status_code, 302)
+
+    @patch('src.app.daily_store')
+    def test_export_streams_csv(self, mock_store):
+        """Test that the export endpoint streams the store as a CSV attachment."""
+        mock_store.iter_documents.return_value = iter([[('u1', {'day': '2024-01-01', 'score': 80})]])
+
+        response = self.client.get('/admin/export/daily_sleep?format=csv')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/csv')
+        self.assertIn('daily_sleep.csv', response.headers['Content-Disposition'])
+        self.assertEqual(response.get_data(as_text=True).splitlines()[1].split(',')[:3], ['u1', '2024-01-01', '80'])
+        self.assertEqual(self.client.get('/admin/export/daily_sleep?format=xlsx').status_code, 400)
+
+    def test_switcher_shows_window_of_cached_index(self):
+        """Test that the switcher lists nearby users from one cached index load."""
+        pages = self.mock_supabase.table().select().order().order().range
+        pages.return_value.execute.return_value.data = [
+            {'id': f'u{i:03d}', 'display_name': f'user {i:03d}'} for i in range(120)
+        ]
+        pages.reset_mock()
+
+        with patch('src.app.SUPABASE_PAGE_SIZE', 1000):
+            options = admin_switcher_options('u100')
+            admin_switcher_options('u000')
+
+        self.assertEqual(len(options), 50)
+        self.assertEqual((options[0]['id'], options[-1]['id']), ('u070', 'u119'))
+        self.assertEqual(pages.call_count, 1)
+
+class BackfillWiringTestCase(unittest.TestCase):
+    """Tests for queueing and running history backfills from the app."""
+
+    def setUp(self):
+        self.jobs = BackfillJobs(':memory:')
+        self.patchers = [
+            patch('src.app.backfill_jobs', self.jobs),
+            patch('src.app.backfill_pool'),
+            patch('src.app.load_stored_tokens', return_value={'access_token': 'tok'}),
+            patch('src.app.token_manager'),
+        ]
+        _, self.mock_pool, _, self.mock_tokens = [p.start() for p in self.patchers]
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+
+    def test_login_queues_backfill_before_synced_window(self):
+        """Test that a new user's backfill is queued once and run off the request path."""
+        start_backfill('user-1')
+        start_backfill('user-1')
+
+        job = self.jobs.get('user-1')
+        self.assertLess(job['next_end'], daily_window(90)[0])
+        self.mock_pool.submit.assert_called_once_with(run_user_backfill, 'user-1')
+
+    def test_expired_authorization_puts_job_back(self):
+        """Test that a job whose tokens can't be renewed waits instead of failing."""
+        self.mock_tokens.valid_tokens.return_value = None
+        start_backfill('user-1')
+
+        self.assertEqual(run_user_backfill('user-1'), 'pending')
+        self.assertIn('authorization', self.jobs.get('user-1')['error'])
+        self.assertEqual(self.jobs.runnable(), [])
+
+    def test_resume_queues_due_jobs_without_waiting(self):
+        """Test that resuming only queues jobs, and a job still queued isn't queued twice."""
+        self.jobs.enqueue('user-1', '2024-03-31', '2024-01-01')
+        self.jobs.enqueue('user-2', '2024-03-31', '2024-01-01')
+        backfill_queued.clear()
+
+        self.assertEqual(resume_backfills(), ['user-1', 'user-2'])
+        self.assertEqual(resume_backfills(), [])
+        self.mock_pool.submit.assert_has_calls([call(resume_backfill, 'user-1'), call(resume_backfill, 'user-2')])
+        self.assertEqual(self.mock_pool.submit.call_count, 2)
+
+        with patch('src.app.run_user_backfill', return_value='pending'):
+            self.assertEqual(resume_backfill('user-1'), 'pending')
+        self.assertEqual(resume_backfills(), ['user-1'])
+        backfill_queued.clear()
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
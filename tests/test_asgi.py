@@ -0,0 +1,89 @@
+"""Tests for the threaded ASGI adapter."""
+import unittest
+import asyncio
+import os
+import sys
+import threading
+
+# Add the repository root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+
+try:
+    from src.asgi import ThreadedWsgiToAsgi
+except ImportError:
+    ThreadedWsgiToAsgi = None
+
+
+async def call(application, path):
+    """Send one GET through an ASGI app; returns (status, body chunks)."""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [(b'host', b'testserver')], 'server': ('testserver', 80), 'client': ('127.0.0.1', 1234),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    chunks = [message['body'] for message in messages if message['type'] == 'http.response.body' and message.get('body')]
+    return messages[0]['status'], chunks
+
+
+@unittest.skipIf(ThreadedWsgiToAsgi is None, 'asgiref is not installed')
+class ThreadedWsgiToAsgiTests(unittest.TestCase):
+    """Test suite for ThreadedWsgiToAsgi."""
+
+    def setUp(self):
+        self.flask_app = Flask(__name__)
+        self.barrier = threading.Barrier(3, timeout=5)
+
+        @self.flask_app.route('/wait')
+        def wait():
+            # Only returns once three requests are being handled at the same time
+            self.barrier.wait()
+            return 'done'
+
+        @self.flask_app.route('/stream')
+        def stream():
+            return self.flask_app.response_class(iter([b'head', b'body']))
+
+        self.application = ThreadedWsgiToAsgi(self.flask_app, threads=4)
+
+    def tearDown(self):
+        self.application.executor.shutdown()
+
+    def test_requests_run_concurrently(self):
+        """Test that blocking views run side by side instead of one at a time."""
+        async def run():
+            return await asyncio.gather(*(call(self.application, '/wait') for _ in range(3)))
+
+        self.assertEqual(asyncio.run(run()), [(200, [b'done'])] * 3)
+
+    def test_streamed_response(self):
+        """Test that a streamed response arrives chunk by chunk."""
+        self.assertEqual(asyncio.run(call(self.application, '/stream')), (200, [b'head', b'body']))
+
+    def test_lifespan(self):
+        """Test that startup and shutdown are acknowledged."""
+        sent = []
+        incoming = iter([{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+
+        async def receive():
+            return next(incoming)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        asyncio.run(self.application({'type': 'lifespan'}, receive, send))
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+"""Tests for the historical backfill jobs."""
+import unittest
+import os
+import sys
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+
+# Add the repository root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.backfill import BackfillJobs, backfill_range, run_backfill
+from src.daily_store import DailyStore
+from src.oura_client import CollectionFetch
+from src.rate_limiter import RateLimitExceeded
+
+
+def history_client(first_day, fail_on=None):
+    """An OuraClient stand-in with one sleep document per day from first_day onwards."""
+    client = MagicMock()
+
+    def _fetch_many(access_token, calls, **kwargs):
+        results = {}
+        for collection, params in calls.items():
+            if fail_on and fail_on(params):
+                results[collection] = fail_on(params)
+                continue
+            day = max(datetime.strptime(params['start_date'], '%Y-%m-%d'), datetime.strptime(first_day, '%Y-%m-%d'))
+            end = datetime.strptime(params['end_date'], '%Y-%m-%d')
+            documents = []
+            while day <= end:
+                documents.append({'day': day.strftime('%Y-%m-%d'), 'score': 80})
+                day += timedelta(days=1)
+            response = MagicMock(status_code=200)
+            response.json.return_value = {'data': documents}
+            results[collection] = CollectionFetch(collection, response=response)
+        return results
+
+    client.fetch_many.side_effect = _fetch_many
+    return client
+
+
+class BackfillTests(unittest.TestCase):
+    """Test suite for BackfillJobs and run_backfill."""
+
+    def setUp(self):
+        self.jobs = BackfillJobs(':memory:', concurrency=1)
+        self.store = DailyStore(':memory:')
+
+    def run_job(self, client, user_id='u1', **kwargs):
+        job = self.jobs.claim(user_id)
+        return run_backfill(self.jobs, client, self.store, job, 'tok', ['daily_sleep'], **kwargs)
+
+    def test_backfill_range(self):
+        """Test that a backfill ends the day before the synced window."""
+        self.assertEqual(backfill_range('2024-04-01', max_days=31), ('2024-03-31', '2024-03-01'))
+
+    def test_loads_history_in_chunks_until_it_runs_out(self):
+        """Test that chunks walk backwards and stop after consecutive empty chunks."""
+        self.jobs.enqueue('u1', '2024-03-31', '2023-01-01')
+        client = history_client('2024-03-10')
+
+        self.assertEqual(self.run_job(client, chunk_days=10), 'done')
+
+        documents = self.store.documents('u1', 'daily_sleep', '2000-01-01', '2100-01-01')
+        self.assertEqual(len(documents), 22)
+        # Three chunks with data, then two empty ones
+        self.assertEqual(client.fetch_many.call_count, 5)
+        job = self.jobs.get('u1')
+        self.assertEqual((job['status'], job['documents']), ('done', 22))
+
+    def test_run_stops_after_max_chunks_and_resumes(self):
+        """Test that a run gives the job back after max_chunks and the next run continues."""
+        self.jobs.enqueue('u1', '2024-03-31', '2024-01-01')
+        client = history_client('2024-01-01')
+
+        self.assertEqual(self.run_job(client, chunk_days=10, max_chunks=2), 'pending')
+        job = self.jobs.get('u1')
+        self.assertEqual((job['status'], job['next_end'], job['leased_until']), ('pending', '2024-03-11', 0))
+        self.assertEqual(self.jobs.runnable(), ['u1'])
+
+        self.assertEqual(self.run_job(client, chunk_days=10, max_chunks=0), 'done')
+        self.assertEqual(len(self.store.documents('u1', 'daily_sleep', '2024-01-01', '2024-03-31')), 91)
+
+    def test_enqueue_is_idempotent(self):
+        """Test that logging in again doesn't restart a user's job."""
+        self.assertTrue(self.jobs.enqueue('u1', '2024-03-31', '2024-01-01'))
+        self.assertFalse(self.jobs.enqueue('u1', '2024-12-31', '2024-01-01'))
+        self.assertEqual(self.jobs.get('u1')['next_end'], '2024-03-31')
+
+    def test_concurrency_cap_and_lease(self):
+        """Test that claims respect the concurrency cap and live leases."""
+        self.jobs.enqueue('u1', '2024-03-31', '2024-01-01')
+        self.jobs.enqueue('u2', '2024-03-31', '2024-01-01')
+
+        self.assertIsNotNone(self.jobs.claim('u1'))
+        self.assertIsNone(self.jobs.claim('u1'))
+        self.assertIsNone(self.jobs.claim('u2'))
+        self.assertEqual(self.jobs.runnable(), ['u2'])
+
+        # An abandoned lease expires and the job can be resumed
+        self.assertIsNotNone(self.jobs.claim('u1', now=datetime.now().timestamp() + 3600))
+
+    def test_rate_limited_chunk_is_deferred_and_resumes_from_checkpoint(self):
+        """Test that a shed call releases the job and a later run continues where it stopped."""
+        self.jobs.enqueue('u1', '2024-03-31', '2024-03-01')
+        shed = CollectionFetch('daily_sleep', error=RateLimitExceeded('busy', retry_after=30))
+        client = history_client('2024-01-01', fail_on=lambda params: shed if params['end_date'] < '2024-03-21' else None)
+
+        self.assertEqual(self.run_job(client, chunk_days=10), 'pending')
+        job = self.jobs.get('u1')
+        self.assertEqual((job['status'], job['next_end']), ('pending', '2024-03-11'))
+        self.assertNotIn('u1', self.jobs.runnable())
+        self.assertIn('u1', self.jobs.runnable(now=job['not_before']))
+
+        self.jobs.release('u1')
+        self.assertEqual(self.run_job(history_client('2024-01-01'), chunk_days=10), 'done')
+        self.assertEqual(len(self.store.documents('u1', 'daily_sleep', '2024-03-01', '2024-03-31')), 31)
+
+    def test_repeated_failures_mark_job_failed(self):
+        """Test that a chunk failing max_attempts times in a row fails the job."""
+        self.jobs.enqueue('u1', '2024-03-31', '2024-03-01')
+        error = CollectionFetch('daily_sleep', response=MagicMock(status_code=500))
+        client = history_client('2024-01-01', fail_on=lambda params: error)
+
+        self.assertEqual(self.run_job(client, max_attempts=2, retry_delay=0), 'pending')
+        self.assertEqual(self.run_job(client, max_attempts=2, retry_delay=0), 'failed')
+        job = self.jobs.get('u1')
+        self.assertEqual((job['status'], job['attempts']), ('failed', 2))
+        self.assertIn('daily_sleep failed', job['error'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+"""Tests for the in-process TTL cache."""
+import unittest
+import os
+import sys
+from unittest.mock import patch
+
+# Add src directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.cache import TTLCache
+
+
+class TTLCacheTests(unittest.TestCase):
+    """Test suite for TTLCache."""
+
+    def test_get_and_set(self):
+        """Test that cached values are returned until they expire."""
+        cache = TTLCache(ttl=10)
+        cache.set('a', 1)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('missing'))
+        self.assertEqual(cache.get('missing', 'default'), 'default')
+
+    def test_get_with_copy(self):
+        """Test that get(copy=...) hands back a copy of the cached value."""
+        cache = TTLCache(ttl=10, on_evict=dict.clear)
+        value = {'a': 1}
+        cache.set('k', value)
+
+        copied = cache.get('k', copy=dict)
+        cache.clear()
+        self.assertEqual(copied, {'a': 1})
+        self.assertEqual(value, {})
+
+    @patch('src.cache.time.monotonic')
+    def test_entries_expire(self, mock_monotonic):
+        """Test that entries older than the TTL are dropped."""
+        mock_monotonic.return_value = 100
+        cache = TTLCache(ttl=10)
+        cache.set('a', 1)
+
+        mock_monotonic.return_value = 111
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+    def test_least_recently_used_is_evicted(self):
+        """Test that the cache stays within maxsize, evicting the LRU entry."""
+        cache = TTLCache(maxsize=2, ttl=10)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_pop_and_clear(self):
+        """Test explicit invalidation."""
+        cache = TTLCache(ttl=10)
+        cache.set('a', 1)
+        cache.set('b', 2)
+
+        self.assertEqual(cache.pop('a'), 1)
+        self.assertIsNone(cache.get('a'))
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    @patch('src.cache.time.monotonic')
+    def test_on_evict_sees_expired_evicted_and_cleared_values(self, mock_monotonic):
+        """Test that every value leaving the cache is passed to on_evict."""
+        evicted = []
+        mock_monotonic.return_value = 100
+        cache = TTLCache(maxsize=2, ttl=10, on_evict=evicted.append)
+        cache.set('a', 'A')
+        cache.set('b', 'B')
+        cache.set('c', 'C')
+        self.assertEqual(evicted, ['A'])
+
+        mock_monotonic.return_value = 111
+        cache.get('b')
+        self.assertEqual(evicted, ['A', 'B'])
+
+        cache.clear()
+        self.assertEqual(evicted, ['A', 'B', 'C'])
+
+    def test_pop_does_not_call_on_evict(self):
+        """Test that popped values are returned rather than wiped."""
+        evicted = []
+        cache = TTLCache(ttl=10, on_evict=evicted.append)
+        cache.set('a', 'A')
+
+        self.assertEqual(cache.pop('a'), 'A')
+        self.assertEqual(evicted, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+"""Tests for the local daily summary store and incremental sync."""
+import unittest
+import os
+import sys
+import time
+from unittest.mock import MagicMock
+
+# Add src directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.daily_store import DailyStore, sync_daily, sync_start_day
+from src.oura_client import CollectionFetch
+
+
+def fake_client(documents_by_collection):
+    """Build an OuraClient stand-in whose fetch_many returns canned documents."""
+    client = MagicMock()
+
+    def _fetch_many(access_token, calls, **kwargs):
+        results = {}
+        for collection in calls:
+            response = MagicMock()
+            response.status_code = 200
+            response.json.return_value = {'data': documents_by_collection.get(collection, [])}
+            results[collection] = CollectionFetch(collection, response=response)
+        return results
+
+    client.fetch_many.side_effect = _fetch_many
+    return client
+
+
+class DailyStoreTests(unittest.TestCase):
+    """Test suite for DailyStore."""
+
+    def setUp(self):
+        self.store = DailyStore(':memory:')
+
+    def test_upsert_and_read_range(self):
+        """Test that documents come back for the requested days, oldest first."""
+        self.store.upsert_documents('u1', 'daily_sleep', [
+            {'day': '2024-01-03', 'score': 80},
+            {'day': '2024-01-01', 'score': 70},
+            {'day': '2024-01-05', 'score': 90},
+        ])
+
+        docs = self.store.documents('u1', 'daily_sleep', '2024-01-01', '2024-01-03')
+
+        self.assertEqual([d['day'] for d in docs], ['2024-01-01', '2024-01-03'])
+        self.assertEqual(self.store.documents('u2', 'daily_sleep', '2024-01-01', '2024-01-31'), [])
+
+    def test_upsert_counts_only_changes(self):
+        """Test that re-storing identical documents reports no changes."""
+        docs = [{'day': '2024-01-01', 'score': 70}]
+        self.assertEqual(self.store.upsert_documents('u1', 'daily_sleep', docs), 1)
+        self.assertEqual(self.store.upsert_documents('u1', 'daily_sleep', docs), 0)
+        self.assertEqual(self.store.upsert_documents('u1', 'daily_sleep', [{'day': '2024-01-01', 'score': 71}]), 1)
+
+    def test_version_advances_only_on_changes(self):
+        """Test that the collection version moves only when stored documents change."""
+        self.assertEqual(self.store.version('u1', 'daily_sleep'), (0, None))
+        docs = [{'day': '2024-01-01', 'score': 70}]
+        self.store.upsert_documents('u1', 'daily_sleep', docs)
+        version, changed_at = self.store.version('u1', 'daily_sleep')
+        self.assertEqual(version, 1)
+        self.assertIsNotNone(changed_at)
+
+        self.store.upsert_documents('u1', 'daily_sleep', docs)
+        self.assertEqual(self.store.version('u1', 'daily_sleep')[0], 1)
+        self.store.upsert_documents('u1', 'daily_sleep', [{'day': '2024-01-01', 'score': 71}])
+        self.assertEqual(self.store.version('u1', 'daily_sleep')[0], 2)
+
+    def test_mark_synced_never_moves_backwards(self):
+        """Test that last_day only advances."""
+        self.store.mark_synced('u1', 'daily_sleep', '2024-01-05', synced_at=1)
+        self.store.mark_synced('u1', 'daily_sleep', '2024-01-02', synced_at=2)
+
+        self.assertEqual(self.store.sync_state('u1', 'daily_sleep'), ('2024-01-05', 2))
+
+
+class SyncDailyTests(unittest.TestCase):
+    """Test suite for incremental sync."""
+
+    def setUp(self):
+        self.store = DailyStore(':memory:')
+
+    def test_start_day_uses_revalidation_tail(self):
+        """Test that a sync resumes a few days before the last synced day."""
+        self.assertEqual(sync_start_day(None, '2024-01-01'), '2024-01-01')
+        self.assertEqual(sync_start_day(('2024-01-10', 0), '2024-01-01', revalidate_days=2), '2024-01-08')
+        self.assertEqual(sync_start_day(('2024-01-02', 0), '2024-01-01', revalidate_days=5), '2024-01-01')
+
+    def test_first_sync_fetches_window_and_stores(self):
+        """Test that a new user gets the full window fetched and stored."""
+        client = fake_client({'daily_sleep': [{'day': '2024-01-06', 'score': 75}]})
+
+        sync_daily(client, self.store, 'u1', 'token', ['daily_sleep'], '2024-01-01', '2024-01-07')
+
+        calls = client.fetch_many.call_args.args[1]
+        self.assertEqual(calls, {'daily_sleep': {'start_date': '2024-01-01', 'end_date': '2024-01-07'}})
+        self.assertEqual(self.store.sync_state('u1', 'daily_sleep')[0], '2024-01-06')
+        self.assertEqual(len(self.store.documents('u1', 'daily_sleep', '2024-01-01', '2024-01-07')), 1)
+
+    def test_fresh_sync_skips_oura(self):
+        """Test that a recently synced collection makes no Oura call."""
+        self.store.mark_synced('u1', 'daily_sleep', '2024-01-06', synced_at=time.time())
+        client = fake_client({})
+
+        fetches = sync_daily(client, self.store, 'u1', 'token', ['daily_sleep'], '2024-01-01', '2024-01-07')
+
+        self.assertEqual(fetches, {})
+        client.fetch_many.assert_not_called()
+
+    def test_stale_sync_fetches_only_new_days(self):
+        """Test that a returning user only asks Oura for the tail."""
+        self.store.mark_synced('u1', 'daily_sleep', '2024-01-06', synced_at=0)
+        client = fake_client({})
+
+        sync_daily(client, self.store, 'u1', 'token', ['daily_sleep'], '2024-01-01', '2024-01-07', revalidate_days=1)
+
+        calls = client.fetch_many.call_args.args[1]
+        self.assertEqual(calls['daily_sleep']['start_date'], '2024-01-05')
+
+    def test_failed_fetch_leaves_state_untouched(self):
+        """Test that an error response does not mark the collection synced."""
+        client = MagicMock()
+        response = MagicMock()
+        response.status_code = 401
+        client.fetch_many.return_value = {'daily_sleep': CollectionFetch('daily_sleep', response=response)}
+
+        sync_daily(client, self.store, 'u1', 'token', ['daily_sleep'], '2024-01-01', '2024-01-07')
+
+        self.assertIsNone(self.store.sync_state('u1', 'daily_sleep'))
+
+if __name__ == '__main__':
+    unittest.main()
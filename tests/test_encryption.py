@@ -3,12 +3,15 @@ import unittest
 import os
 import sys
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import patch
 
 # Add src directory to path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from src.app import encrypt_token, decrypt_token
+from src.app import encrypt_token, decrypt_token, token_cache
 from cryptography.fernet import Fernet
 
 class TokenEncryptionTests(unittest.TestCase):
@@ -21,6 +24,7 @@ class TokenEncryptionTests(unittest.TestCase):
         # Create patch for env variable
         self.patcher = patch.dict('os.environ', {'FERNET_KEY': self.test_key.decode()})
         self.patcher.start()
+        token_cache.clear()
         
     def tearDown(self):
         """Clean up after tests."""
@@ -56,5 +60,46 @@ class TokenEncryptionTests(unittest.TestCase):
         # Should return None on failure
         self.assertIsNone(result)
 
+    def test_decrypt_token_reuses_cached_result(self):
+        """Test that a repeated ciphertext is served from the token cache."""
+        encrypted = encrypt_token({'access_token': 'abc'})
+        first = decrypt_token(encrypted)
+
+        with patch('src.app.cipher_suite') as mock_cipher:
+            second = decrypt_token(encrypted)
+            mock_cipher.decrypt.assert_not_called()
+
+        self.assertEqual(second, {'access_token': 'abc'})
+        # Callers get copies, so mutating one can't poison the cache
+        first['access_token'] = 'changed'
+        self.assertEqual(decrypt_token(encrypted), {'access_token': 'abc'})
+
+    def test_evicted_tokens_are_wiped(self):
+        """Test that cached token dicts are cleared when they leave the cache."""
+        decrypt_token(encrypt_token({'access_token': 'abc'}))
+        cached = next(value for _, value in token_cache._data.values())
+
+        token_cache.clear()
+
+        self.assertEqual(cached, {})
+
+    def test_concurrent_decrypts_never_see_wiped_tokens(self):
+        """Test that threads racing on a cold cache all get the tokens, not a wiped dict."""
+        encrypted = encrypt_token({'access_token': 'abc'})
+        barrier = threading.Barrier(8)
+        cache_set = token_cache.set
+
+        def slow_set(key, value, ttl=None):
+            # Every thread missed the cache; each one replaces (and wipes) the others' entries
+            barrier.wait()
+            cache_set(key, value, ttl)
+            time.sleep(0.05)
+
+        with patch.object(token_cache, 'set', side_effect=slow_set):
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                results = list(pool.map(lambda _: decrypt_token(encrypted), range(8)))
+
+        self.assertEqual(results, [{'access_token': 'abc'}] * 8)
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
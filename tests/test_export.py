@@ -0,0 +1,74 @@
+"""Tests for bulk export of stored daily summaries."""
+import unittest
+import csv
+import io
+import os
+import shutil
+import sys
+import tempfile
+from unittest.mock import patch
+
+# Add the repository root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.daily_store import DailyStore
+from src import export
+from src.export import export_columns, iter_export, write_export, available_formats
+
+
+class ExportTests(unittest.TestCase):
+    """Test suite for src/export.py."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.store = DailyStore(os.path.join(self.tmpdir, 'daily_store.sqlite3'))
+        for user_id in ('u1', 'u2', 'u3'):
+            self.store.upsert_documents(user_id, 'daily_sleep', [
+                {'day': '2024-01-01', 'score': 80, 'contributors': {'deep_sleep': 70}, 'class_5_min': '1234'},
+                {'day': '2024-01-02', 'score': 85.0, 'timestamp': '2024-01-02T00:00:00+00:00'},
+            ])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_documents_are_read_in_batches(self):
+        """Test that the store hands out bounded batches ordered by user and day."""
+        batches = list(self.store.iter_documents('daily_sleep', batch_size=4))
+
+        self.assertEqual([len(batch) for batch in batches], [4, 2])
+        self.assertEqual([(user_id, doc['day']) for user_id, doc in batches[0][:2]],
+                         [('u1', '2024-01-01'), ('u1', '2024-01-02')])
+
+    def test_csv_export_flattens_documents(self):
+        """Test CSV columns, flattened contributors and dropped list fields."""
+        data = b''.join(iter_export(self.store, 'daily_sleep', 'csv', batch_size=2)).decode('utf-8')
+        rows = list(csv.DictReader(io.StringIO(data)))
+
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(list(rows[0]), export_columns('daily_sleep'))
+        self.assertEqual((rows[0]['user_id'], rows[0]['score'], rows[0]['contributors_deep_sleep']),
+                         ('u1', '80', '70'))
+        self.assertEqual(rows[1]['score'], '85')
+        self.assertNotIn('class_5_min', rows[0])
+
+    def test_csv_is_the_fallback_without_pyarrow(self):
+        """Test that Parquet is only offered when pyarrow is importable."""
+        with patch.object(export, 'pq', None):
+            self.assertEqual(available_formats(), ('csv',))
+            with self.assertRaises(ValueError):
+                iter_export(self.store, 'daily_sleep', 'parquet')
+
+    @unittest.skipIf(export.pq is None, 'pyarrow is not installed')
+    def test_parquet_export_writes_a_row_group_per_batch(self):
+        """Test that a Parquet export round-trips with one row group per batch."""
+        path = write_export(self.store, 'daily_sleep', 'parquet', self.tmpdir, batch_size=4)
+        parquet = export.pq.ParquetFile(path)
+
+        self.assertEqual(parquet.metadata.num_rows, 6)
+        self.assertEqual(parquet.metadata.num_row_groups, 2)
+        table = parquet.read()
+        self.assertEqual(table.column('score').to_pylist(), [80, 85] * 3)
+        self.assertEqual(table.schema.names, export_columns('daily_sleep'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+"""Tests for HTTP validators and compression."""
+import unittest
+import os
+import sys
+import gzip
+
+# Add the repository root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask, Response, jsonify, stream_with_context
+
+from src.http_cache import etag_for, set_validators, not_modified, add_content_etag, compress_response
+
+
+def build_app():
+    app = Flask(__name__)
+
+    @app.after_request
+    def finalize(response):
+        return compress_response(add_content_etag(response))
+
+    @app.route('/json')
+    def json_view():
+        return jsonify({'rows': ['x' * 40] * 100})
+
+    @app.route('/small')
+    def small_view():
+        return jsonify({'ok': True})
+
+    @app.route('/page')
+    def page_view():
+        etag = etag_for('page', 1)
+        cached = not_modified(etag, last_modified=1700000000)
+        if cached is not None:
+            return cached
+        chunks = ['<p>%d</p>' % i * 50 for i in range(3)]
+        return set_validators(Response(stream_with_context(iter(chunks)), mimetype='text/html'), etag, 1700000000)
+
+    return app
+
+
+class HttpCacheTests(unittest.TestCase):
+    """Test suite for src/http_cache.py."""
+
+    def setUp(self):
+        self.client = build_app().test_client()
+
+    def test_json_gets_content_etag_and_304(self):
+        """Test that a repeat request with the same ETag gets an empty 304."""
+        first = self.client.get('/json')
+        etag = first.headers['ETag']
+
+        second = self.client.get('/json', headers={'If-None-Match': etag})
+
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.data, b'')
+        self.assertEqual(first.headers['Cache-Control'], 'private, no-cache')
+
+    def test_large_json_is_gzipped_with_weak_etag(self):
+        """Test that big responses are compressed and their ETag weakened."""
+        response = self.client.get('/json', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn(b'xxxx', gzip.decompress(response.data))
+        self.assertTrue(response.headers['ETag'].startswith('W/'))
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+
+        # The weak ETag still validates a repeat request
+        repeat = self.client.get('/json', headers={'Accept-Encoding': 'gzip', 'If-None-Match': response.headers['ETag']})
+        self.assertEqual(repeat.status_code, 304)
+
+    def test_small_responses_are_not_compressed(self):
+        """Test that tiny payloads are sent as they are."""
+        response = self.client.get('/small', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_precomputed_etag_skips_rendering(self):
+        """Test that a page with a data-derived ETag answers 304 before rendering."""
+        first = self.client.get('/page')
+        self.assertEqual(first.headers['Last-Modified'], 'Tue, 14 Nov 2023 22:13:20 GMT')
+
+        second = self.client.get('/page', headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(second.status_code, 304)
+
+    def test_streamed_page_is_gzipped_incrementally(self):
+        """Test that streamed responses are compressed chunk by chunk."""
+        response = self.client.get('/page', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', response.headers)
+        self.assertEqual(gzip.decompress(response.data).count(b'<p>'), 150)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+"""Tests for the shared Oura API client."""
+import unittest
+import os
+import sys
+import time
+from unittest.mock import patch, MagicMock
+
+import requests
+
+# Add src directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.oura_client import OuraClient
+
+COLLECTIONS = ['daily_sleep', 'daily_readiness', 'daily_activity']
+
+
+def slow_get(delay):
+    """Build a Session.request stand-in that takes `delay` seconds to answer."""
+    def _get(method, url, **kwargs):
+        time.sleep(delay)
+        response = MagicMock()
+        response.status_code = 200
+        response.url = url
+        return response
+    return _get
+
+
+class FetchCollectionsTests(unittest.TestCase):
+    """Test suite for concurrent collection fetches."""
+
+    def setUp(self):
+        """Set up a client whose session is mocked out."""
+        self.client = OuraClient(base_url='https://api.example.test')
+        self.patcher = patch.object(self.client.session, 'request')
+        self.mock_request = self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def test_calls_run_concurrently(self):
+        """Test that total latency is close to the slowest single call."""
+        self.mock_request.side_effect = slow_get(0.2)
+
+        started = time.monotonic()
+        results = self.client.fetch_collections('token', COLLECTIONS, {'start_date': '2024-01-01'})
+        elapsed = time.monotonic() - started
+
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(set(results), set(COLLECTIONS))
+        for collection in COLLECTIONS:
+            self.assertEqual(results[collection].result().status_code, 200)
+
+    def test_passes_timeout_and_auth_header(self):
+        """Test that every call carries a deadline and the bearer token."""
+        self.mock_request.return_value.status_code = 200
+
+        self.client.fetch_collections('token', ['daily_sleep'], {}, timeout=3)
+
+        args, kwargs = self.mock_request.call_args
+        self.assertEqual(args, ('GET', 'https://api.example.test/v2/usercollection/daily_sleep'))
+        self.assertEqual(kwargs['timeout'], 3)
+        self.assertEqual(kwargs['headers'], {'Authorization': 'Bearer token'})
+
+    def test_default_timeout_applied(self):
+        """Test that plain requests get the client's default timeout."""
+        client = OuraClient(base_url='https://api.example.test', timeout=7)
+        with patch.object(client.session, 'request') as mock_request:
+            client.get('/v2/usercollection/personal_info', access_token='token')
+
+        self.assertEqual(mock_request.call_args.kwargs['timeout'], 7)
+
+
+    def test_budget_exceeded_reports_timeout(self):
+        """Test that calls outliving the overall budget surface as timeouts."""
+        self.mock_request.side_effect = slow_get(0.5)
+
+        results = self.client.fetch_collections('token', ['daily_sleep'], {}, budget=0.05)
+
+        with self.assertRaises(requests.exceptions.Timeout):
+            results['daily_sleep'].result()
+
+    def test_errors_are_kept_per_collection(self):
+        """Test that one failing call does not affect the others."""
+        def _get(method, url, **kwargs):
+            if url.endswith('daily_activity'):
+                raise requests.exceptions.ConnectionError('boom')
+            response = MagicMock()
+            response.status_code = 200
+            return response
+        self.mock_request.side_effect = _get
+
+        results = self.client.fetch_collections('token', COLLECTIONS, {})
+
+        self.assertEqual(results['daily_sleep'].result().status_code, 200)
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            results['daily_activity'].result()
+
+class SessionPoolTests(unittest.TestCase):
+    """Test suite for the pooled session configuration."""
+
+    def test_adapter_pool_and_retry_policy(self):
+        """Test that the session is pooled and only retries GETs."""
+        client = OuraClient(pool_size=4, retries=3)
+        adapter = client.session.get_adapter('https://api.ouraring.com')
+
+        self.assertEqual(adapter._pool_maxsize, 4)
+        self.assertEqual(adapter.max_retries.total, 3)
+        self.assertNotIn(429, adapter.max_retries.status_forcelist)
+        self.assertFalse(adapter.max_retries.respect_retry_after_header)
+        self.assertEqual(adapter.max_retries.allowed_methods, frozenset(['GET']))
+
+    def test_absolute_urls_pass_through(self):
+        """Test that absolute URLs such as the token endpoint are not rebased."""
+        client = OuraClient(base_url='https://api.example.test')
+
+        self.assertEqual(client.url('https://api.ouraring.com/oauth/token'), 'https://api.ouraring.com/oauth/token')
+        self.assertEqual(client.url('/v1/sleep'), 'https://api.example.test/v1/sleep')
+
+if __name__ == '__main__':
+    unittest.main()
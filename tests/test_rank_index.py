@@ -0,0 +1,124 @@
+"""Tests for the leaderboard rank index."""
+import unittest
+import os
+import sys
+import threading
+from unittest.mock import MagicMock
+
+# Add the repository root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.rank_index import ScoreIndex
+
+
+class ScoreIndexTests(unittest.TestCase):
+    """Test suite for ScoreIndex."""
+
+    def setUp(self):
+        self.rows = [('a', 90), ('b', 80), ('c', 80), ('d', 70), ('e', None)]
+        self.load = MagicMock(side_effect=lambda: iter(self.rows))
+        self.index = ScoreIndex(self.load, ttl=300)
+
+    def test_rank_matches_leaderboard_view(self):
+        """Test competition ranking with ties and unscored users last."""
+        ranks = {user_id: self.index.rank(user_id) for user_id in 'abcde'}
+
+        self.assertEqual(ranks, {'a': 1, 'b': 2, 'c': 2, 'd': 4, 'e': 5})
+        self.assertIsNone(self.index.rank('nobody'))
+
+    def test_rank_of_score(self):
+        """Test the rank a score would take, for ties, new scores and unscored users."""
+        self.assertEqual([self.index.rank_of_score(score) for score in (95, 80, 75, None)], [1, 2, 4, 5])
+
+    def test_percentile(self):
+        """Test percentile rank, counting ties as half below."""
+        self.assertEqual(self.index.percentile('a'), 87.5)
+        self.assertEqual(self.index.percentile('b'), 50.0)
+        self.assertEqual(self.index.percentile('d'), 12.5)
+        self.assertIsNone(self.index.percentile('e'))
+
+    def test_histogram(self):
+        """Test bin counts, with the top edge included in the last bin."""
+        self.rows.append(('f', 100))
+        histogram = self.index.histogram(edges=(60, 80, 100))
+
+        self.assertEqual(histogram, [
+            {'min': 60, 'max': 80, 'count': 1},
+            {'min': 80, 'max': 100, 'count': 4},
+        ])
+
+    def test_updates_apply_without_reloading(self):
+        """Test that score changes move a user without another load."""
+        self.index.rank('a')
+        self.index.update('d', 95)
+        self.index.update('e', 85)
+        self.index.track('new')
+        self.index.track('a')
+
+        self.assertEqual(self.index.rank('d'), 1)
+        self.assertEqual(self.index.rank('e'), 3)
+        self.assertEqual(self.index.rank('a'), 2)
+        self.assertEqual(self.index.rank('new'), 6)
+        self.assertEqual(self.load.call_count, 1)
+
+    def test_reloads_after_ttl(self):
+        """Test that the index picks up other processes' changes once stale."""
+        self.index.ttl = 0
+        self.index.rank('a')
+        self.rows = [('a', 60), ('b', 80)]
+
+        self.assertEqual(self.index.rank('a'), 2)
+        self.assertEqual(self.load.call_count, 2)
+
+    def reload_in_background(self, rows):
+        """Start a stale reload that blocks inside `load`; returns (loading, release, thread)."""
+        loading, release = threading.Event(), threading.Event()
+
+        def slow_load():
+            loading.set()
+            release.wait(5)
+            return iter(rows)
+
+        self.index.rank('a')
+        self.index.ttl = 0
+        self.load.side_effect = slow_load
+        thread = threading.Thread(target=self.index.rank, args=('a',))
+        thread.start()
+        self.assertTrue(loading.wait(5))
+        return release, thread
+
+    def test_queries_during_reload_use_previous_snapshot(self):
+        """Test that a slow reload doesn't block other queries."""
+        release, thread = self.reload_in_background([('a', 60), ('b', 80)])
+        try:
+            self.assertEqual(self.index.rank('a'), 1)
+            self.assertEqual(self.index.histogram(edges=(0, 100))[0]['count'], 4)
+        finally:
+            release.set()
+            thread.join(5)
+
+        self.index.ttl = 300
+        self.assertEqual(self.index.rank('a'), 2)
+
+    def test_updates_during_reload_survive_the_swap(self):
+        """Test that scores written while a reload is in flight aren't lost to the older snapshot."""
+        release, thread = self.reload_in_background([('a', 90), ('b', 80)])
+        self.index.update('b', 99)
+        self.index.track('new')
+        release.set()
+        thread.join(5)
+
+        self.index.ttl = 300
+        self.assertEqual(self.index.rank('b'), 1)
+        self.assertEqual(self.index.rank('new'), 3)
+
+    def test_standing(self):
+        """Test the combined snapshot used by the dashboard and API."""
+        standing = self.index.standing('b')
+
+        self.assertEqual((standing['rank'], standing['percentile']), (2, 50.0))
+        self.assertEqual((standing['total'], standing['scored']), (5, 4))
+        self.assertEqual(sum(bin['count'] for bin in standing['histogram']), 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+"""Tests for the shared Oura rate limiter."""
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch, MagicMock
+
+# Add the repository root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.oura_client import OuraClient
+from src.rate_limiter import RateLimiter, RateLimitExceeded, parse_retry_after
+
+
+class RateLimiterTests(unittest.TestCase):
+    """Test suite for RateLimiter."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'rate_limits.sqlite3')
+        self.limiter = RateLimiter(self.path, global_rate=1, global_burst=100, token_rate=1, token_burst=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_token_bucket_allows_burst_then_sheds(self):
+        """Test that a token may burst up to its bucket size and is then refused."""
+        self.limiter.acquire('tok', 'interactive', max_wait=0)
+        self.limiter.acquire('tok', 'interactive', max_wait=0)
+
+        with self.assertRaises(RateLimitExceeded) as ctx:
+            self.limiter.acquire('tok', 'interactive', max_wait=0)
+        self.assertGreater(ctx.exception.retry_after, 0)
+
+        # Other tokens have their own bucket
+        self.limiter.acquire('other', 'interactive', max_wait=0)
+
+    def test_low_priority_leaves_headroom(self):
+        """Test that low-priority calls are shed before the bucket runs dry."""
+        self.limiter.acquire('tok', 'interactive')
+
+        with self.assertRaises(RateLimitExceeded):
+            self.limiter.acquire('tok', 'low')
+        self.limiter.acquire('tok', 'interactive', max_wait=0)
+
+    def test_buckets_are_shared_across_instances(self):
+        """Test that separate limiters (e.g. gunicorn workers) draw from one bucket."""
+        other = RateLimiter(self.path, global_rate=1, global_burst=100, token_rate=1, token_burst=2)
+        self.limiter.acquire('tok', max_wait=0)
+        other.acquire('tok', max_wait=0)
+
+        with self.assertRaises(RateLimitExceeded):
+            self.limiter.acquire('tok', max_wait=0)
+
+    def test_block_stops_calls_until_retry_after(self):
+        """Test that a blocked bucket refuses calls for the Retry-After period."""
+        self.limiter.block('tok', 30)
+
+        with self.assertRaises(RateLimitExceeded) as ctx:
+            self.limiter.acquire('tok', 'background', max_wait=5)
+        self.assertAlmostEqual(ctx.exception.retry_after, 30, delta=1)
+
+    def test_parse_retry_after(self):
+        """Test that Retry-After accepts seconds and ignores garbage."""
+        self.assertEqual(parse_retry_after('12'), 12.0)
+        self.assertIsNone(parse_retry_after('soon'))
+        self.assertIsNone(parse_retry_after(None))
+
+    def test_client_blocks_token_after_429(self):
+        """Test that OuraClient feeds 429 Retry-After back into the limiter."""
+        client = OuraClient(base_url='https://api.example.test', rate_limiter=self.limiter)
+        response = MagicMock(status_code=429, headers={'Retry-After': '20'})
+        with patch.object(client.session, 'request', return_value=response):
+            client.get('/v2/usercollection/daily_sleep', access_token='tok')
+
+            with self.assertRaises(RateLimitExceeded):
+                client.get('/v2/usercollection/daily_sleep', access_token='tok', rate_wait=0)
+
+    def test_429_is_not_retried_inside_the_session(self):
+        """Test that a real 429 reaches the limiter at once instead of being slept out and retried."""
+        hits = []
+
+        class TooManyRequests(BaseHTTPRequestHandler):
+            def do_GET(self):
+                hits.append(self.path)
+                self.send_response(429)
+                self.send_header('Retry-After', '3')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), TooManyRequests)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            client = OuraClient(base_url=f"http://127.0.0.1:{server.server_address[1]}", retries=2,
+                                rate_limiter=self.limiter)
+            started = time.monotonic()
+            response = client.get('/v2/usercollection/daily_sleep', access_token='tok')
+            self.assertLess(time.monotonic() - started, 1)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(len(hits), 1)
+        with self.assertRaises(RateLimitExceeded) as raised:
+            client.get('/v2/usercollection/daily_sleep', access_token='tok', rate_wait=0)
+        self.assertGreater(raised.exception.retry_after, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+"""Tests for the sleep statistics module."""
+import unittest
+import os
+import sys
+
+import numpy as np
+
+# Add the repository root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.sleep_stats import daily_series, trend_slope, window_stats, streaks, compute_sleep_stats
+
+
+def days(scores, start=1):
+    """Daily documents for consecutive January 2024 days; None leaves a gap."""
+    return [
+        {'day': f'2024-01-{start + i:02d}', 'score': score}
+        for i, score in enumerate(scores) if score is not None
+    ]
+
+
+class SleepStatsTests(unittest.TestCase):
+    """Test suite for src/sleep_stats.py."""
+
+    def test_daily_series_places_days_and_leaves_gaps(self):
+        """Test that scores land on their calendar day with NaN for missing days."""
+        series = daily_series(days([70, None, 90]), '2024-01-04', 5)
+
+        self.assertTrue(np.isnan(series[[0, 2, 4]]).all())
+        self.assertEqual(series[1], 70)
+        self.assertEqual(series[3], 90)
+
+    def test_window_stats(self):
+        """Test mean, median, spread and day count over a window with a gap."""
+        series = daily_series(days([60, 80, None, 70]), '2024-01-04', 7)
+        stats = window_stats(series, 7)
+
+        self.assertEqual(stats['days'], 3)
+        self.assertEqual(stats['mean'], 70.0)
+        self.assertEqual(stats['median'], 70.0)
+        self.assertAlmostEqual(stats['std'], 8.16, places=2)
+
+    def test_trend_slope(self):
+        """Test the least-squares slope, skipping missing days."""
+        self.assertAlmostEqual(trend_slope(np.array([70.0, np.nan, 74.0, 76.0])), 2.0)
+        self.assertIsNone(trend_slope(np.array([np.nan, 70.0])))
+
+    def test_streaks_ignore_missing_today(self):
+        """Test that today's not-yet-available score doesn't break the current streak."""
+        series = np.array([90, 90, 90, 60, 88, 86, np.nan])
+        self.assertEqual(streaks(series, threshold=85), {'current': 2, 'longest': 3, 'threshold': 85})
+
+    def test_gap_breaks_streak(self):
+        """Test that a missing day in the middle ends a streak."""
+        series = np.array([90, np.nan, 90, 90])
+        self.assertEqual(streaks(series, threshold=85)['current'], 2)
+        self.assertEqual(streaks(np.array([np.nan, np.nan]), threshold=85)['longest'], 0)
+
+    def test_compute_sleep_stats(self):
+        """Test the stored summary shape for several windows."""
+        stats = compute_sleep_stats(days([80, 82, 84]), '2024-01-04', windows=(2, 7))
+
+        self.assertEqual(stats['last_day'], '2024-01-03')
+        self.assertEqual(stats['last_score'], 84)
+        self.assertEqual(stats['windows']['2']['days'], 1)
+        self.assertEqual(stats['windows']['7']['mean'], 82.0)
+        self.assertEqual(stats['windows']['7']['slope'], 2.0)
+
+    def test_empty_series(self):
+        """Test that a user without data gets empty stats rather than errors."""
+        stats = compute_sleep_stats([], '2024-01-04')
+
+        self.assertIsNone(stats['last_score'])
+        self.assertEqual(stats['windows']['7'], {'days': 0, 'mean': None, 'median': None, 'std': None, 'slope': None})
+        self.assertEqual(stats['streaks']['current'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
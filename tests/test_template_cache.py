@@ -0,0 +1,52 @@
+"""Tests for template precompilation and streaming."""
+import unittest
+import os
+import sys
+
+# Add the repository root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from jinja2 import DictLoader
+
+from src.template_cache import FLUSH_MARKER, flush_at_markers, precompile_templates, stream_page
+
+
+class TemplateCacheTests(unittest.TestCase):
+    """Test suite for src/template_cache.py."""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.jinja_loader = DictLoader({
+            'page.html': '<h1>{{ title }}</h1>{{ flush }}{% set rows = load_rows() %}{% for row in rows %}<p>{{ row }}</p>{% endfor %}',
+            'notes.txt': 'not a page',
+        })
+
+    def test_precompile_loads_every_html_template(self):
+        """Test that all page templates are compiled into the environment cache."""
+        self.assertEqual(precompile_templates(self.app), ['page.html'])
+        self.assertTrue(any(key[1] == 'page.html' for key in self.app.jinja_env.cache.keys()))
+
+    def test_flush_at_markers_groups_chunks(self):
+        """Test that chunks are joined into one write per flushed section."""
+        chunks = ['<a>', 'b', FLUSH_MARKER, 'c', 'd']
+        self.assertEqual(list(flush_at_markers(chunks)), ['<a>b' + str(FLUSH_MARKER), 'cd'])
+
+    def test_stream_page_sends_head_before_loading_rows(self):
+        """Test that the part above {{ flush }} is sent before later data is loaded."""
+        loaded = []
+
+        def load_rows():
+            loaded.append(True)
+            return ['one', 'two']
+
+        with self.app.test_request_context():
+            response = stream_page(self.app, 'page.html', title='Hi', load_rows=load_rows)
+            body = iter(response.response)
+            self.assertEqual(next(body), '<h1>Hi</h1>' + str(FLUSH_MARKER))
+            self.assertEqual(loaded, [])
+            self.assertEqual(next(body), '<p>one</p><p>two</p>')
+        self.assertEqual(response.headers['X-Accel-Buffering'], 'no')
+
+if __name__ == '__main__':
+    unittest.main()
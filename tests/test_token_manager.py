@@ -0,0 +1,193 @@
+"""Tests for Oura token refresh."""
+import unittest
+import os
+import sys
+import tempfile
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+# Add the repository root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.token_manager import TokenManager, RefreshLeases, stamp_expiry
+
+
+class TokenManagerTests(unittest.TestCase):
+    """Test suite for TokenManager."""
+
+    def setUp(self):
+        self.stored = {}
+        self.client = MagicMock()
+        self.client.post.return_value = MagicMock(
+            status_code=200,
+            json=lambda: {'access_token': 'new', 'refresh_token': 'r2', 'expires_in': 86400}
+        )
+        self.manager = TokenManager(
+            self.client, 'https://oura.test/oauth/token', 'cid', 'secret',
+            load=lambda user_id: self.stored.get(user_id),
+            save=self.stored.__setitem__,
+            margin=300
+        )
+
+    def expiring(self, seconds, access_token='old'):
+        tokens = {'access_token': access_token, 'refresh_token': 'r1', 'expires_at': time.time() + seconds}
+        self.stored['u1'] = tokens
+        return dict(tokens)
+
+    def test_stamp_expiry_records_absolute_expiry(self):
+        """Test that expires_in is turned into an absolute expires_at."""
+        tokens = stamp_expiry({'access_token': 'a', 'expires_in': 60}, now=1000)
+        self.assertEqual(tokens['expires_at'], 1060)
+
+    def test_fresh_tokens_are_returned_without_refreshing(self):
+        """Test that tokens far from expiry skip the token endpoint."""
+        tokens = self.expiring(3600)
+
+        self.assertEqual(self.manager.valid_tokens('u1', tokens), tokens)
+        self.client.post.assert_not_called()
+
+    def test_tokens_without_expiry_are_treated_as_fresh(self):
+        """Test that legacy tokens with no expires_at are only refreshed on demand."""
+        tokens = {'access_token': 'old', 'refresh_token': 'r1'}
+
+        self.assertEqual(self.manager.valid_tokens('u1', tokens), tokens)
+        self.client.post.assert_not_called()
+
+    def test_expiring_tokens_are_refreshed_and_saved(self):
+        """Test that tokens inside the margin are renewed and persisted."""
+        tokens = self.expiring(60)
+
+        renewed = self.manager.valid_tokens('u1', tokens)
+
+        self.assertEqual(renewed['access_token'], 'new')
+        self.assertIn('expires_at', renewed)
+        self.assertEqual(self.stored['u1'], renewed)
+        data = self.client.post.call_args.kwargs['data']
+        self.assertEqual((data['grant_type'], data['refresh_token']), ('refresh_token', 'r1'))
+
+    def test_concurrent_requests_refresh_once(self):
+        """Test that simultaneous requests for one user share a single refresh."""
+        tokens = self.expiring(60)
+        results = []
+
+        def slow_post(*args, **kwargs):
+            time.sleep(0.05)
+            return self.client.post.return_value
+
+        self.client.post.side_effect = slow_post
+        threads = [
+            threading.Thread(target=lambda: results.append(self.manager.valid_tokens('u1', dict(tokens))))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.client.post.call_count, 1)
+        self.assertEqual({result['access_token'] for result in results}, {'new'})
+
+    def test_failed_refresh_keeps_unexpired_tokens(self):
+        """Test that a failed renewal falls back to tokens that still work."""
+        self.client.post.return_value = MagicMock(status_code=500)
+        tokens = self.expiring(60)
+
+        self.assertEqual(self.manager.valid_tokens('u1', tokens), tokens)
+
+    def test_failed_refresh_of_expired_tokens_returns_none(self):
+        """Test that expired tokens that cannot be renewed require re-authorization."""
+        self.client.post.return_value = MagicMock(status_code=400)
+        tokens = self.expiring(-60)
+
+        self.assertIsNone(self.manager.valid_tokens('u1', tokens))
+
+    def test_forced_refresh_ignores_expiry(self):
+        """Test that force=True refreshes tokens that look fresh, e.g. after a 401."""
+        tokens = self.expiring(3600)
+
+        renewed = self.manager.valid_tokens('u1', tokens, force=True)
+
+        self.assertEqual(renewed['access_token'], 'new')
+
+    def test_unsaved_refresh_is_not_returned(self):
+        """Test that tokens whose rotated refresh token couldn't be stored count as a failed refresh."""
+        def failing_save(user_id, tokens):
+            raise RuntimeError('supabase unavailable')
+
+        self.manager.save = failing_save
+        tokens = self.expiring(-60)
+
+        with patch('builtins.print') as mock_print:
+            self.assertIsNone(self.manager.valid_tokens('u1', tokens))
+        self.assertIn('could not be saved', ' '.join(str(call.args[0]) for call in mock_print.call_args_list))
+
+
+class RefreshLeaseTests(unittest.TestCase):
+    """Test suite for cross-process refresh leases."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'leases.sqlite3')
+        self.stored = {'u1': {'access_token': 'old', 'refresh_token': 'r1', 'expires_at': time.time() + 3600}}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def manager(self, client, **lease_kwargs):
+        # Each manager stands in for a separate process: its own thread locks and SQLite connection
+        return TokenManager(
+            client, 'https://oura.test/oauth/token', 'cid', 'secret',
+            load=lambda user_id: dict(self.stored[user_id]), save=self.stored.__setitem__,
+            leases=RefreshLeases(self.path, **lease_kwargs)
+        )
+
+    def test_lease_is_exclusive_until_released_or_expired(self):
+        """Test that a live lease blocks other owners, and that only its owner can release it."""
+        first, second = RefreshLeases(self.path, lease=30), RefreshLeases(self.path, lease=30)
+
+        self.assertTrue(first.try_acquire('u1', 'a', now=1000))
+        self.assertFalse(second.try_acquire('u1', 'b', now=1010))
+        self.assertTrue(second.try_acquire('u2', 'b', now=1010))
+        second.release('u1', 'b')
+        self.assertFalse(second.try_acquire('u1', 'b', now=1020))
+        # A holder that stopped renewing is taken over once the lease runs out
+        self.assertTrue(second.try_acquire('u1', 'b', now=1031))
+        first.release('u1', 'a')
+        self.assertFalse(first.try_acquire('u1', 'a', now=1040))
+
+    def test_processes_share_one_refresh(self):
+        """Test that forced refreshes in two processes spend the refresh token once."""
+        def slow_post(*args, **kwargs):
+            time.sleep(0.1)
+            return MagicMock(status_code=200, json=lambda: {'access_token': 'new', 'refresh_token': 'r2',
+                                                            'expires_in': 86400})
+
+        client = MagicMock()
+        client.post.side_effect = slow_post
+        managers = [self.manager(client, poll=0.01) for _ in range(2)]
+        results = []
+        threads = [
+            threading.Thread(target=lambda m=m: results.append(m.valid_tokens('u1', dict(self.stored['u1']), force=True)))
+            for m in managers
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(client.post.call_count, 1)
+        self.assertEqual([result['access_token'] for result in results], ['new', 'new'])
+
+    def test_lease_timeout_skips_refresh(self):
+        """Test that a refresh doesn't go ahead while another process still holds the lease."""
+        RefreshLeases(self.path).try_acquire('u1', 'elsewhere')
+        client = MagicMock()
+
+        tokens = self.manager(client, wait=0.05, poll=0.01).valid_tokens('u1', dict(self.stored['u1']), force=True)
+
+        self.assertIsNone(tokens)
+        client.post.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
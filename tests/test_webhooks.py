@@ -0,0 +1,222 @@
+"""Tests for the Oura webhook receiver and subscription management."""
+import unittest
+import os
+import sys
+import time
+from unittest.mock import patch, MagicMock
+
+# Add the repository root (and this directory, for fake_oura) to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from fake_oura import FakeOura
+from src.app import app, process_webhook_event, webhook_pending, oura_user_cache
+from src.daily_store import DailyStore
+from src.oura_client import OuraClient
+from src.webhooks import WebhookSubscriptions, verify_signature, webhook_signature, parse_event
+import manage_webhooks
+
+
+class SignatureTests(unittest.TestCase):
+    """Test suite for notification signature checks."""
+
+    def test_valid_signature(self):
+        """Test that a signature over timestamp + body verifies, in either case."""
+        signature = webhook_signature('secret', 1700000000, b'{"a": 1}')
+        self.assertTrue(verify_signature('secret', '1700000000', b'{"a": 1}', signature, now=1700000010))
+        self.assertTrue(verify_signature('secret', '1700000000', b'{"a": 1}', signature.lower(), now=1700000010))
+
+    def test_rejects_tampering_and_replays(self):
+        """Test that a changed body, wrong secret or stale timestamp fails."""
+        signature = webhook_signature('secret', 1700000000, b'{"a": 1}')
+        self.assertFalse(verify_signature('secret', '1700000000', b'{"a": 2}', signature, now=1700000000))
+        self.assertFalse(verify_signature('other', '1700000000', b'{"a": 1}', signature, now=1700000000))
+        self.assertFalse(verify_signature('secret', '1700000000', b'{"a": 1}', signature, now=1700003600))
+        self.assertFalse(verify_signature('secret', 'soon', b'{"a": 1}', signature))
+        self.assertFalse(verify_signature(None, '1700000000', b'{"a": 1}', signature, now=1700000000))
+
+    def test_parse_event(self):
+        """Test that notifications missing a field are rejected."""
+        event = {'user_id': 'o1', 'event_type': 'update', 'data_type': 'daily_sleep', 'object_id': 'd1'}
+        self.assertEqual(parse_event(event), ('o1', 'update', 'daily_sleep', 'd1'))
+        with self.assertRaises(ValueError):
+            parse_event(dict(event, object_id=''))
+        with self.assertRaises(ValueError):
+            parse_event([event])
+
+
+class WebhookRouteTests(unittest.TestCase):
+    """Test suite for the /webhooks/oura endpoint."""
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self.fake = FakeOura().start()
+        self.patchers = [
+            patch('src.app.OURA_CLIENT_SECRET', self.fake.client_secret),
+            patch('src.app.OURA_WEBHOOK_VERIFICATION_TOKEN', 'verify-me'),
+            patch('src.app.webhook_pool'),
+        ]
+        self.mock_pool = [p.start() for p in self.patchers][2]
+        webhook_pending.clear()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        webhook_pending.clear()
+        self.fake.stop()
+
+    def post(self, notification, timestamp=None):
+        body, headers = self.fake.sign(notification, int(time.time()) if timestamp is None else timestamp)
+        return self.client.post('/webhooks/oura', data=body, headers=headers)
+
+    def test_verification_challenge(self):
+        """Test that Oura's subscription check gets the challenge back only with the right token."""
+        response = self.client.get('/webhooks/oura?verification_token=verify-me&challenge=abc')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {'challenge': 'abc'})
+        response = self.client.get('/webhooks/oura?verification_token=wrong&challenge=abc')
+        self.assertEqual(response.status_code, 403)
+
+    def test_signed_notification_is_queued_once(self):
+        """Test that a notification is queued and a duplicate of a queued one is dropped."""
+        notification = self.fake.add_document('daily_sleep', {'id': 'd1', 'day': '2024-03-01', 'score': 80})
+        self.assertEqual(self.post(notification).status_code, 202)
+        response = self.post(notification)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.get_json(), {'status': 'duplicate'})
+        self.mock_pool.submit.assert_called_once_with(process_webhook_event, 'oura-user', 'daily_sleep', 'd1')
+
+    def test_bad_signature_is_rejected(self):
+        """Test that unsigned, mis-signed and stale notifications are refused."""
+        notification = self.fake.add_document('daily_sleep', {'id': 'd1', 'day': '2024-03-01'})
+        body, headers = self.fake.sign(notification, int(time.time()))
+        headers['x-oura-signature'] = '00' * 32
+        self.assertEqual(self.client.post('/webhooks/oura', data=body, headers=headers).status_code, 401)
+        self.assertEqual(self.post(notification, timestamp=int(time.time()) - 3600).status_code, 401)
+        self.assertEqual(self.client.post('/webhooks/oura', json=notification).status_code, 401)
+        self.mock_pool.submit.assert_not_called()
+
+    def test_other_events_are_acknowledged_and_ignored(self):
+        """Test that deletes and collections we don't store don't queue a fetch."""
+        notification = {'user_id': 'oura-user', 'event_type': 'create', 'data_type': 'workout', 'object_id': 'w1'}
+        self.assertEqual(self.post(notification).get_json(), {'status': 'ignored'})
+        self.assertEqual(self.post(dict(notification, data_type='daily_sleep', event_type='delete')).status_code, 200)
+        self.assertEqual(self.post({'user_id': 'oura-user'}).status_code, 400)
+        self.mock_pool.submit.assert_not_called()
+
+
+class WebhookProcessingTests(unittest.TestCase):
+    """Test suite for fetching and storing the document a notification points at."""
+
+    def setUp(self):
+        self.fake = FakeOura().start()
+        self.store = DailyStore(':memory:')
+        lookup = MagicMock()
+        lookup.eq.return_value.execute.return_value.data = [{'id': 'user-1', 'email': 'a@example.com'}]
+        self.patchers = [
+            patch('src.app.oura_client', OuraClient(base_url=self.fake.url, retries=0)),
+            patch('src.app.daily_store', self.store),
+            patch('src.app.select_profiles', return_value=lookup),
+            patch('src.app.load_stored_tokens', return_value={'access_token': self.fake.access_token}),
+            patch('src.app.token_manager'),
+            patch('src.app.update_sleep_scores'),
+        ]
+        started = [p.start() for p in self.patchers]
+        self.mock_tokens, self.mock_scores = started[4], started[5]
+        self.mock_tokens.valid_tokens.side_effect = lambda user_id, tokens, **kwargs: tokens
+        oura_user_cache.clear()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        oura_user_cache.clear()
+        self.fake.stop()
+
+    def test_stores_document_and_refreshes_scores(self):
+        """Test that a sleep notification fetches only that document and updates the scores."""
+        self.fake.add_document('daily_sleep', {'id': 'd1', 'day': '2024-03-01', 'score': 80})
+        self.assertEqual(process_webhook_event('oura-user', 'daily_sleep', 'd1'), 1)
+
+        self.assertEqual(self.store.documents('user-1', 'daily_sleep', '2024-03-01', '2024-03-01')[0]['score'], 80)
+        self.assertEqual(self.fake.requests, [('GET', '/v2/usercollection/daily_sleep/d1')])
+        self.mock_scores.assert_called_once_with('user-1')
+
+        # An unchanged document is not re-scored
+        self.assertEqual(process_webhook_event('oura-user', 'daily_sleep', 'd1'), 0)
+        self.mock_scores.assert_called_once()
+
+    def test_other_collections_skip_scores(self):
+        """Test that readiness updates are stored without touching sleep scores."""
+        self.fake.add_document('daily_readiness', {'id': 'r1', 'day': '2024-03-01', 'score': 70})
+        self.assertEqual(process_webhook_event('oura-user', 'daily_readiness', 'r1'), 1)
+        self.mock_scores.assert_not_called()
+
+    def test_missing_document_or_user_is_skipped(self):
+        """Test that unknown documents and unlinked Oura users are logged and skipped."""
+        self.assertEqual(process_webhook_event('oura-user', 'daily_sleep', 'missing'), 0)
+        with patch('src.app.select_profiles') as mock_select:
+            mock_select.return_value.eq.return_value.execute.return_value.data = []
+            self.assertEqual(process_webhook_event('stranger', 'daily_sleep', 'd1'), 0)
+        self.mock_scores.assert_not_called()
+
+    def test_rejected_token_is_refreshed_once(self):
+        """Test that a 401 forces a token refresh and the fetch is retried."""
+        self.fake.add_document('daily_sleep', {'id': 'd1', 'day': '2024-03-01', 'score': 80})
+
+        def valid_tokens(user_id, tokens, force=False, **kwargs):
+            return {'access_token': self.fake.access_token} if force else tokens
+
+        self.mock_tokens.valid_tokens.side_effect = valid_tokens
+        with patch('src.app.load_stored_tokens', return_value={'access_token': 'expired'}):
+            self.assertEqual(process_webhook_event('oura-user', 'daily_sleep', 'd1'), 1)
+        self.assertEqual(len(self.fake.requests), 2)
+
+
+class SubscriptionTests(unittest.TestCase):
+    """Test suite for WebhookSubscriptions and the manage_webhooks CLI."""
+
+    def setUp(self):
+        self.fake = FakeOura().start()
+        self.subscriptions = WebhookSubscriptions(
+            OuraClient(base_url=self.fake.url, retries=0), self.fake.client_id, self.fake.client_secret
+        )
+
+    def tearDown(self):
+        self.fake.stop()
+
+    def test_ensure_creates_then_renews(self):
+        """Test that subscribing twice creates each pair once and then renews them."""
+        created, renewed = self.subscriptions.ensure('https://app/webhooks/oura', 'tok', ['daily_sleep', 'daily_activity'])
+        self.assertEqual((len(created), len(renewed)), (4, 0))
+        self.assertEqual(
+            sorted((s['data_type'], s['event_type']) for s in self.subscriptions.list()),
+            [('daily_activity', 'create'), ('daily_activity', 'update'),
+             ('daily_sleep', 'create'), ('daily_sleep', 'update')]
+        )
+
+        created, renewed = self.subscriptions.ensure('https://app/webhooks/oura', 'tok', ['daily_sleep', 'daily_activity'])
+        self.assertEqual((len(created), len(renewed)), (0, 4))
+        self.assertTrue(all(s['expiration_time'].startswith('2031') for s in renewed))
+
+    def test_cli(self):
+        """Test the subscribe, list and delete commands."""
+        with patch('sys.stdout'):
+            self.assertEqual(manage_webhooks.main(
+                ['subscribe', '--callback-url', 'https://app/webhooks/oura', '--verification-token', 'tok',
+                 '--collection', 'daily_sleep'], subscriptions=self.subscriptions), 0)
+            self.assertEqual(len(self.fake.subscriptions), 2)
+            self.assertEqual(manage_webhooks.main(['list'], subscriptions=self.subscriptions), 0)
+            subscription_id = next(iter(self.fake.subscriptions))
+            self.assertEqual(manage_webhooks.main(['delete', subscription_id], subscriptions=self.subscriptions), 0)
+        self.assertNotIn(subscription_id, self.fake.subscriptions)
+
+    def test_cli_reports_rejected_credentials(self):
+        """Test that an Oura error exits non-zero instead of raising."""
+        subscriptions = WebhookSubscriptions(OuraClient(base_url=self.fake.url, retries=0), 'wrong', 'wrong')
+        with patch('sys.stderr'):
+            self.assertEqual(manage_webhooks.main(['list'], subscriptions=subscriptions), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+"""Tests for the background sync worker."""
+import unittest
+import os
+import sys
+import threading
+import time
+from unittest.mock import patch, MagicMock
+
+# Add the repository root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import worker
+from src.oura_client import CollectionFetch
+
+
+class SyncWorkerTests(unittest.TestCase):
+    """Test suite for worker.py."""
+
+    @patch('worker.PROFILE_PAGE_SIZE', 2)
+    @patch('worker.select_profiles')
+    def test_iter_profiles_pages_and_skips_missing_tokens(self, mock_select):
+        """Test that profiles are walked page by page, skipping users without tokens."""
+        pages = [
+            [{'id': 'a', 'oura_tokens': 'x'}, {'id': 'b', 'oura_tokens': None}],
+            [{'id': 'c', 'oura_tokens': 'y'}],
+        ]
+        query = mock_select.return_value.order.return_value
+        query.range.return_value.execute.side_effect = [MagicMock(data=page) for page in pages]
+
+        ids = [profile['id'] for profile in worker.iter_profiles()]
+
+        self.assertEqual(ids, ['a', 'c'])
+        self.assertEqual(query.range.call_args_list[1].args, (2, 3))
+        mock_select.assert_called_with('tokens')
+
+    @patch('worker.sync_user_data')
+    @patch('worker.decrypt_token')
+    def test_refresh_profile_syncs_with_access_token(self, mock_decrypt, mock_sync):
+        """Test that a profile is refreshed with its decrypted tokens."""
+        mock_decrypt.return_value = {'access_token': 'tok'}
+        response = MagicMock(status_code=200)
+        mock_sync.return_value = (
+            {'access_token': 'tok'},
+            {'daily_sleep': CollectionFetch('daily_sleep', response=response)}
+        )
+
+        self.assertTrue(worker.refresh_profile({'id': 'a', 'oura_tokens': 'enc'}))
+        self.assertEqual(mock_sync.call_args.args[:2], ('a', {'access_token': 'tok'}))
+        self.assertEqual(mock_sync.call_args.kwargs['refresh_margin'], worker.TOKEN_REFRESH_MARGIN)
+
+    @patch('worker.sync_user_data')
+    @patch('worker.decrypt_token')
+    def test_refresh_profile_fails_when_tokens_cannot_be_renewed(self, mock_decrypt, mock_sync):
+        """Test that users whose tokens expired for good are reported as failed."""
+        mock_decrypt.return_value = {'access_token': 'tok'}
+        mock_sync.return_value = (None, {})
+
+        self.assertFalse(worker.refresh_profile({'id': 'a', 'oura_tokens': 'enc'}))
+
+    @patch('worker.sync_user_data')
+    @patch('worker.decrypt_token')
+    def test_refresh_profile_skips_undecryptable_tokens(self, mock_decrypt, mock_sync):
+        """Test that users whose tokens cannot be decrypted are skipped."""
+        mock_decrypt.return_value = None
+
+        self.assertFalse(worker.refresh_profile({'id': 'a', 'oura_tokens': 'enc'}))
+        mock_sync.assert_not_called()
+
+    @patch('worker.SYNC_WORKER_CONCURRENCY', 2)
+    @patch('worker.resume_backfills', return_value=[])
+    @patch('worker.refresh_profile')
+    @patch('worker.iter_profiles')
+    def test_run_once_reads_profiles_as_the_pool_drains(self, mock_iter, mock_refresh, mock_resume):
+        """Test that profiles aren't read ahead of the pool, so pages aren't all fetched up front."""
+        counts = {'read': 0, 'done': 0, 'ahead': 0}
+        lock = threading.Lock()
+
+        def profiles():
+            for i in range(10):
+                with lock:
+                    counts['read'] += 1
+                    counts['ahead'] = max(counts['ahead'], counts['read'] - counts['done'])
+                yield {'id': f'user-{i}', 'oura_tokens': 'enc'}
+
+        def refresh(profile):
+            time.sleep(0.01)
+            with lock:
+                counts['done'] += 1
+            return profile['id'] != 'user-3'
+
+        mock_iter.side_effect = profiles
+        mock_refresh.side_effect = refresh
+
+        with patch('sys.stdout'):
+            self.assertEqual(worker.run_once(), (9, 10))
+        # Two running plus the one just read, waiting for a free slot
+        self.assertLessEqual(counts['ahead'], 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+"""
+Background sync worker for the Oura Ring Data Comparison application.
+
+Walks the profiles table on a schedule and refreshes every user's Oura daily
+summaries and derived sleep scores off the request path, so web requests only
+read already-prepared data and the leaderboard stays fresh for users who have
+not logged in recently. OAuth tokens are renewed well ahead of expiry here, so
+web requests rarely have to refresh them themselves. Each pass also resumes
+history backfills that were interrupted or rate limited, without waiting for
+them.
+
+Usage:
+    python worker.py          # run forever, every SYNC_WORKER_INTERVAL seconds
+    python worker.py --once   # run a single pass and exit
+"""
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from src.app import select_profiles, decrypt_token, sync_user_data, resume_backfills
+
+SYNC_WORKER_INTERVAL = int(os.getenv('SYNC_WORKER_INTERVAL', '600'))
+# Each user refresh fans out three Oura calls, so keep this at or below OURA_FETCH_WORKERS / 3
+SYNC_WORKER_CONCURRENCY = int(os.getenv('SYNC_WORKER_CONCURRENCY', '2'))
+PROFILE_PAGE_SIZE = 500
+# Renew tokens this many seconds ahead of expiry, well before web requests would
+TOKEN_REFRESH_MARGIN = int(os.getenv('SYNC_WORKER_TOKEN_MARGIN', str(SYNC_WORKER_INTERVAL * 3)))
+
+def iter_profiles():
+    """Yield every profile with stored tokens, one page at a time."""
+    offset = 0
+    while True:
+        response = select_profiles('tokens')\
+            .order('id')\
+            .range(offset, offset + PROFILE_PAGE_SIZE - 1)\
+            .execute()
+        rows = response.data or []
+        for row in rows:
+            if row.get('oura_tokens'):
+                yield row
+        if len(rows) < PROFILE_PAGE_SIZE:
+            return
+        offset += PROFILE_PAGE_SIZE
+
+def refresh_profile(profile):
+    """Refresh one user's data; returns True if everything synced cleanly."""
+    user_id = profile['id']
+    try:
+        tokens = decrypt_token(profile['oura_tokens'])
+        if not tokens or not tokens.get('access_token'):
+            print(f"worker: Skipping {user_id}, tokens could not be decrypted")
+            return False
+
+        # Anything older than half an interval is refreshed, so pages never find it stale
+        tokens, fetches = sync_user_data(
+            user_id, tokens, max_age=SYNC_WORKER_INTERVAL / 2, refresh_margin=TOKEN_REFRESH_MARGIN,
+            priority='background'
+        )
+        if not tokens:
+            print(f"worker: Skipping {user_id}, tokens expired and could not be refreshed")
+            return False
+
+        ok = True
+        for collection, fetch in fetches.items():
+            if fetch.error is not None:
+                print(f"worker: {user_id} {collection} failed: {str(fetch.error)}")
+                ok = False
+            elif fetch.response.status_code != 200:
+                print(f"worker: {user_id} {collection} failed with status {fetch.response.status_code}")
+                ok = False
+        return ok
+    except Exception as e:
+        print(f"worker: Error refreshing {user_id}: {str(e)}")
+        traceback.print_exc()
+        return False
+
+def run_once():
+    """Refresh every profile once with bounded concurrency; returns (refreshed, total).
+
+    At most SYNC_WORKER_CONCURRENCY profiles are submitted and unfinished at a
+    time, so profile pages are read only as fast as the pool works through them.
+    """
+    started = time.monotonic()
+    slots = threading.BoundedSemaphore(SYNC_WORKER_CONCURRENCY)
+    counts = {'refreshed': 0, 'total': 0}
+    counts_lock = threading.Lock()
+
+    def finished(future):
+        with counts_lock:
+            counts['total'] += 1
+            counts['refreshed'] += bool(future.result())
+        slots.release()
+
+    with ThreadPoolExecutor(max_workers=SYNC_WORKER_CONCURRENCY, thread_name_prefix='sync-worker') as pool:
+        for profile in iter_profiles():
+            slots.acquire()
+            pool.submit(refresh_profile, profile).add_done_callback(finished)
+    refreshed, total = counts['refreshed'], counts['total']
+    print(f"worker: Refreshed {refreshed}/{total} profiles in {time.monotonic() - started:.1f}s")
+
+    # Continue history backfills that were interrupted, rate limited or never started. They run
+    # in the background a few chunks at a time, so this pass (and the next one) doesn't wait for them
+    backfills = resume_backfills()
+    if backfills:
+        print(f"worker: Queued {len(backfills)} backfill jobs")
+    return refreshed, total
+
+def main(argv):
+    if '--once' in argv:
+        run_once()
+        return 0
+
+    while True:
+        started = time.monotonic()
+        try:
+            run_once()
+        except Exception as e:
+            print(f"worker: Pass failed: {str(e)}")
+            traceback.print_exc()
+        time.sleep(max(0, SYNC_WORKER_INTERVAL - (time.monotonic() - started)))
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))